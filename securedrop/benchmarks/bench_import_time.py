@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Measure the cold start of the WSGI apps and of manage.py.
+
+    ./benchmarks/bench_import_time.py --top 15
+
+Each target is imported `--runs` times, each time in a fresh interpreter,
+much like `python -X importtime` does on Python 3.7+: the best wall clock
+time is reported, along with the modules whose import took the longest,
+their own imports included. Run it from a tree with a `config.py`.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = [
+    # (label, statement run after the imports are timed)
+    ('source', 'import source'),
+    ('journalist', 'import journalist'),
+    ('manage.py clean-tmp', 'import manage'),
+]
+
+# Run in the fresh interpreter: time every import, nested ones included,
+# and print the results as JSON.
+PROFILE = r'''
+import json, sys, time
+import __builtin__
+_import = __builtin__.__import__
+_times = {}
+def _timed_import(name, *args, **kwargs):
+    if name in sys.modules:
+        return _import(name, *args, **kwargs)
+    start = time.time()
+    try:
+        return _import(name, *args, **kwargs)
+    finally:
+        _times.setdefault(name, time.time() - start)
+__builtin__.__import__ = _timed_import
+start = time.time()
+%s
+total = time.time() - start
+__builtin__.__import__ = _import
+sys.stdout.write(json.dumps({'total': total, 'modules': _times}))
+'''
+
+
+def profile(statement):
+    env = dict(os.environ)
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+    out = subprocess.check_output([sys.executable, '-c', PROFILE % statement],
+                                  cwd=ROOT, env=env)
+    return json.loads(out.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10,
+                        help='number of the slowest imports to list')
+    args = parser.parse_args()
+
+    for label, statement in TARGETS:
+        runs = [profile(statement) for _ in range(args.runs)]
+        best = min(runs, key=lambda run: run['total'])
+        print('{:<24} {:8.3f}s (best of {})'.format(
+            label, best['total'], args.runs))
+        slowest = sorted(best['modules'].items(), key=lambda item: item[1],
+                         reverse=True)[:args.top]
+        for name, seconds in slowest:
+            print('    {:<32} {:8.3f}s'.format(name, seconds))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Time the rendering of the journalist index, with and without the cache
+of rendered source rows.
+
+    ./benchmarks/bench_index_render.py --sources 1000 10000
+
+Each run fills a fresh SQLite database with `--sources` sources, each with
+`--submissions` submissions, then renders the index with the cache disabled,
+with a cold cache, with a warm cache, and with a warm cache after one source
+has been starred. Run it from a tree with a `config.py`.
+"""
+import argparse
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+import i18n  # noqa: E402
+from db import db  # noqa: E402
+from journalist_app import create_app  # noqa: E402
+from journalist_app.fragment_cache import FragmentCache  # noqa: E402
+from models import Source, SourceStar, Submission  # noqa: E402
+from sdconfig import SDConfig  # noqa: E402
+from flask import g  # noqa: E402
+
+
+def make_app(workdir):
+    config = SDConfig()
+    config.SECUREDROP_DATA_ROOT = workdir
+    config.STORE_DIR = os.path.join(workdir, 'store')
+    config.TEMP_DIR = os.path.join(workdir, 'tmp')
+    config.DATABASE_FILE = os.path.join(workdir, 'db.sqlite')
+    for directory in (config.STORE_DIR, config.TEMP_DIR):
+        os.mkdir(directory)
+    app = create_app(config)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def populate(app, sources, submissions):
+    now = datetime.datetime.utcnow()
+    with app.app_context():
+        db.session.execute(Source.__table__.insert(), [
+            dict(filesystem_id='source{}'.format(i),
+                 journalist_designation='adjective noun {}'.format(i),
+                 last_updated=now - datetime.timedelta(minutes=i),
+                 pending=False,
+                 interaction_count=submissions)
+            for i in range(1, sources + 1)])
+        db.session.execute(Submission.__table__.insert(), [
+            dict(source_id=i,
+                 filename='{}-adjective_noun-{}.gpg'.format(
+                     j, 'msg' if j % 2 else 'doc.gz'),
+                 size=1024,
+                 downloaded=j > 1)
+            for i in range(1, sources + 1)
+            for j in range(1, submissions + 1)])
+        db.session.commit()
+
+
+def render_index(app):
+    with app.test_request_context('/'):
+        g.user = None
+        g.locale = i18n.get_locale(app.sdconfig)
+        g.text_direction = i18n.get_text_direction(g.locale)
+        g.html_lang = i18n.locale_to_rfc_5646(g.locale)
+        g.locales = i18n.get_locale2name()
+        start = time.time()
+        app.view_functions['main.index']()
+        return time.time() - start
+
+
+def star_one_source(app):
+    with app.app_context():
+        db.session.add(SourceStar(Source.query.first()))
+        db.session.commit()
+
+
+def bench(sources, submissions):
+    workdir = tempfile.mkdtemp()
+    try:
+        app = make_app(workdir)
+        populate(app, sources, submissions)
+        cache = app.source_row_cache
+
+        app.source_row_cache = FragmentCache(0)
+        runs = [('no cache', render_index(app))]
+        app.source_row_cache = cache
+        runs.append(('cold cache', render_index(app)))
+        runs.append(('warm cache', render_index(app)))
+        star_one_source(app)
+        runs.append(('warm cache, one source changed', render_index(app)))
+
+        print('{} sources x {} submissions'.format(sources, submissions))
+        for label, seconds in runs:
+            print('  {:<32} {:8.3f}s {:10.1f} rows/s'.format(
+                label, seconds, sources / seconds))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sources', type=int, nargs='+',
+                        default=[1000, 10000])
+    parser.add_argument('--submissions', type=int, default=4)
+    args = parser.parse_args()
+
+    for sources in args.sources:
+        bench(sources, args.submissions)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compare the in-process secure deletion engine (`rm.secure_delete`) with
+the `srm` subprocess it replaces.
+
+    ./benchmarks/bench_secure_delete.py --files 200 --size 65536
+
+Each run deletes a freshly populated directory of `--files` files of
+`--size` bytes, mimicking a source collection. `srm` is skipped if it is not
+installed.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+import rm  # noqa: E402
+
+
+def populate(directory, files, size):
+    os.mkdir(directory)
+    for i in range(files):
+        with open(os.path.join(directory,
+                               '{}-source-msg.gpg'.format(i)), 'wb') as f:
+            f.write(os.urandom(size))
+
+
+def bench_native(directory, passes):
+    start = time.time()
+    rm.secure_delete([directory], passes=passes)
+    return time.time() - start
+
+
+def bench_srm_per_file(directory):
+    """The old behaviour: one `srm` process (and one rq job) per item."""
+    start = time.time()
+    for name in os.listdir(directory):
+        subprocess.check_call(['srm', '-r', os.path.join(directory, name)])
+    os.rmdir(directory)
+    return time.time() - start
+
+
+def bench_srm_directory(directory):
+    start = time.time()
+    subprocess.check_call(['srm', '-r', directory])
+    return time.time() - start
+
+
+def have_srm():
+    try:
+        subprocess.call(['srm'], stdout=subprocess.PIPE,
+                        stderr=subprocess.PIPE)
+    except OSError:
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--size', type=int, default=64 * 1024)
+    parser.add_argument('--passes', type=int, default=rm.DEFAULT_PASSES)
+    parser.add_argument('--dir', default=None,
+                        help='directory to run in (default: a new temporary '
+                        'directory); use the same filesystem as STORE_DIR '
+                        'for meaningful numbers')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(dir=args.dir)
+    total = args.files * args.size
+    runs = [('native ({} passes)'.format(args.passes),
+             lambda d: bench_native(d, args.passes))]
+    if have_srm():
+        runs.append(('srm, one process per file', bench_srm_per_file))
+        runs.append(('srm -r on the directory', bench_srm_directory))
+    else:
+        print('srm not found, only benchmarking the native engine')
+
+    try:
+        print('{} files x {} bytes = {:.1f} MiB'.format(
+            args.files, args.size, total / (1024.0 * 1024)))
+        for label, run in runs:
+            directory = os.path.join(workdir, 'collection')
+            populate(directory, args.files, args.size)
+            seconds = run(directory)
+            print('{:<32} {:8.3f}s {:8.1f} MiB/s {:8.1f} files/s'.format(
+                label, seconds, total / (1024.0 * 1024) / seconds,
+                args.files / seconds))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
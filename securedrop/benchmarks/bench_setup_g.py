@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Time the `setup_g` hooks of the journalist and source interfaces.
+
+    ./benchmarks/bench_setup_g.py --requests 2000
+
+Each hook runs `--requests` times in a request context carrying one of a few
+common Accept-Language headers, first with the locale caches of `i18n`
+emptied before every request (which is what every request used to cost),
+then with warm caches. Run it from a tree with a `config.py`.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+import i18n  # noqa: E402
+import journalist_app  # noqa: E402
+import source_app  # noqa: E402
+from db import db  # noqa: E402
+from sdconfig import SDConfig  # noqa: E402
+
+ACCEPT_LANGUAGES = [
+    'en-US,en;q=0.5',
+    'fr-FR,fr;q=0.8,en-US;q=0.5,en;q=0.3',
+    'de-DE,de;q=0.9',
+    'ar,en;q=0.5',
+]
+
+
+def make_config(workdir):
+    config = SDConfig()
+    config.SECUREDROP_DATA_ROOT = workdir
+    config.STORE_DIR = os.path.join(workdir, 'store')
+    config.TEMP_DIR = os.path.join(workdir, 'tmp')
+    config.DATABASE_FILE = os.path.join(workdir, 'db.sqlite')
+    for directory in (config.STORE_DIR, config.TEMP_DIR):
+        os.mkdir(directory)
+    return config
+
+
+def bench(app, requests, cold):
+    hooks = app.before_request_funcs[None]
+    contexts = [app.test_request_context(
+                    '/', headers={'Accept-Language': accept_language})
+                for accept_language in ACCEPT_LANGUAGES]
+    elapsed = 0.0
+    for i in range(requests):
+        if cold:
+            i18n.LOCALE2NAME.clear()
+            i18n.TEXT_DIRECTIONS.clear()
+            i18n._accept_languages.clear()
+        with contexts[i % len(contexts)]:
+            start = time.time()
+            for hook in hooks:
+                if hook() is not None:
+                    break
+            elapsed += time.time() - start
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        config = make_config(workdir)
+        for name, module in (('journalist', journalist_app),
+                             ('source', source_app)):
+            app = module.create_app(config)
+            with app.app_context():
+                db.create_all()
+            print('{} interface, {} requests'.format(name, args.requests))
+            for label, cold in (('uncached', True), ('cached', False)):
+                seconds = bench(app, args.requests, cold)
+                print('  {:<10} {:8.1f}us per request'.format(
+                    label, seconds / args.requests * 1e6))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark the crypto, storage and request hot paths with production
+parameters, and store the results as JSON.
+
+    ./benchmarks/bench_suite.py -o before.json
+    ./benchmarks/bench_suite.py -o after.json --compare before.json
+    ./benchmarks/bench_suite.py --only crypto.encrypt request.source_lookup
+
+The tests run with SECUREDROP_ENV=test, which weakens scrypt to N=2 and the
+source keys to 1024 bits, so they say nothing about the real cost of those
+operations. This suite uses the SCRYPT_PARAMS of config.py and 4096-bit
+keys instead, against a fresh data root and database. Each benchmark is run
+`--repeat` times for each of its parameters (e.g. each of the `--size`s), and
+its best, median and mean times are printed and written to `--output`, along
+with a description of the machine and of the tree, so that runs can be
+compared with `--compare`. Run it from a tree with a `config.py`.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from datetime import datetime
+
+if os.environ.get('SECUREDROP_ENV') == 'test':
+    sys.exit('SECUREDROP_ENV=test weakens the crypto, unset it to benchmark')
+os.environ['SECUREDROP_ENV'] = 'prod'
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import gnupg  # noqa: E402
+from db import db  # noqa: E402
+from journalist_app import create_app as create_journalist_app  # noqa: E402
+from models import Journalist, Reply, Source, Submission  # noqa: E402
+from sdconfig import SDConfig  # noqa: E402
+from secure_tempfile import SecureTemporaryFile  # noqa: E402
+from source_app import create_app as create_source_app  # noqa: E402
+import store  # noqa: E402
+
+KiB = 1024
+MiB = 1024 * KiB
+
+
+class Environment(object):
+    """A data root, keyring and database shared by both apps, with one
+    source who has a reply key, and one journalist."""
+
+    def __init__(self, workdir):
+        self.config = config = SDConfig()
+        config.SECUREDROP_DATA_ROOT = workdir
+        config.STORE_DIR = os.path.join(workdir, 'store')
+        config.TEMP_DIR = os.path.join(workdir, 'tmp')
+        config.GPG_KEY_DIR = os.path.join(workdir, 'keys')
+        config.DATABASE_FILE = os.path.join(workdir, 'db.sqlite')
+        config.TEMPLATE_CACHE_DIR = os.path.join(workdir, 'template_cache')
+        config.METRICS_DIR = None
+        config.SQL_QUERY_SAMPLE_RATE = 0
+        for directory in (config.STORE_DIR, config.TEMP_DIR,
+                          config.GPG_KEY_DIR):
+            os.mkdir(directory, 0o700)
+        with open(os.path.join(ROOT, 'tests', 'files',
+                               'test_journalist_key.pub')) as f:
+            gnupg.GPG(homedir=config.GPG_KEY_DIR).import_keys(f.read())
+
+        self.source_app = create_source_app(config)
+        self.journalist_app = create_journalist_app(config)
+        self.crypto_util = self.source_app.crypto_util
+        self.storage = self.source_app.storage
+        with self.source_app.app_context():
+            db.create_all()
+
+            self.codename = self.crypto_util.genrandomid()
+            self.filesystem_id = self.crypto_util.hash_codename(
+                self.codename)
+            source = Source(self.filesystem_id,
+                            self.crypto_util.display_id())
+            source.pending = False
+            db.session.add(source)
+            journalist = Journalist(username='benchmark',
+                                    password=self.crypto_util.genrandomid())
+            db.session.add(journalist)
+            db.session.commit()
+            self.source_id = source.id
+            self.journalist_id = journalist.id
+            self.journalist_filename = source.journalist_filename
+            os.mkdir(self.storage.path(self.filesystem_id))
+            self.crypto_util.genkeypair(self.filesystem_id, self.codename)
+            self.source_key = self.crypto_util.getkey(self.filesystem_id)
+
+    def clear(self, model):
+        """Delete the submissions or replies of the source, and their
+        files."""
+        with self.source_app.app_context():
+            for (filename,) in db.session.query(model.filename).filter(
+                    model.source_id == self.source_id):
+                os.remove(self.storage.path(self.filesystem_id, filename))
+            model.query.filter(model.source_id == self.source_id).delete(
+                synchronize_session=False)
+            db.session.commit()
+
+    def clear_other_sources(self):
+        with self.source_app.app_context():
+            Submission.query.filter(
+                Submission.source_id != self.source_id).delete(
+                    synchronize_session=False)
+            Source.query.filter(Source.id != self.source_id).delete(
+                synchronize_session=False)
+            db.session.commit()
+
+    def add_files(self, model, count, content):
+        """Store `count` copies of `content` as the submissions or replies
+        of the source."""
+        rows = []
+        for i in range(1, count + 1):
+            filename = '{}-{}-{}'.format(
+                i, self.journalist_filename,
+                'reply.gpg' if model is Reply else 'doc.gz.gpg')
+            with open(self.storage.path(self.filesystem_id,
+                                        filename), 'wb') as f:
+                f.write(content)
+            row = dict(source_id=self.source_id, filename=filename,
+                       size=len(content))
+            if model is Reply:
+                row['journalist_id'] = self.journalist_id
+            rows.append(row)
+        with self.source_app.app_context():
+            db.session.execute(model.__table__.insert(), rows)
+            db.session.commit()
+
+
+def crypto_hash_codename(env, _):
+    codename = env.crypto_util.genrandomid()
+    return lambda: env.crypto_util.hash_codename(codename), None
+
+
+def crypto_genkeypair(env, _):
+    names = iter(range(1000))
+
+    def run():
+        name = 'benchmark{}'.format(next(names))
+        env.crypto_util.genkeypair(name, env.codename)
+    return run, None
+
+
+def crypto_encrypt(env, size):
+    plaintext = os.urandom(size)
+    recipients = [env.source_key, env.config.JOURNALIST_KEY]
+    return lambda: env.crypto_util.encrypt(plaintext, recipients), size
+
+
+def crypto_decrypt(env, size):
+    ciphertext = env.crypto_util.encrypt(os.urandom(size), env.source_key)
+    return lambda: env.crypto_util.decrypt(env.codename, ciphertext), size
+
+
+def storage_secure_tempfile(env, size):
+    content = os.urandom(size)
+
+    def run():
+        with SecureTemporaryFile(env.config.TEMP_DIR) as f:
+            for offset in range(0, size, 64 * KiB):
+                f.write(content[offset:offset + 64 * KiB])
+            while f.read(64 * KiB):
+                pass
+    return run, size
+
+
+def storage_save_file_submission(env, size):
+    content = os.urandom(size)
+    counts = iter(range(1, 1000))
+
+    def run():
+        with env.source_app.app_context():
+            filename = env.storage.save_file_submission(
+                env.filesystem_id, next(counts), env.journalist_filename,
+                'upload.bin', io.BytesIO(content))
+        os.remove(env.storage.path(env.filesystem_id, filename))
+    return run, size
+
+
+def storage_build_bulk_archive(env, count):
+    env.clear(Submission)
+    size = 256 * KiB
+    env.add_files(Submission, count, os.urandom(size))
+
+    def run():
+        with env.journalist_app.app_context():
+            entries = [store.bulk_archive_entry(s) for s in
+                       Submission.query.filter_by(source_id=env.source_id)]
+        name = store.bulk_archive_name(entries, zip_directory='all')
+        os.remove(env.storage.build_bulk_archive(name, entries, 'all'))
+    return run, count * size
+
+
+def request_journalist_index(env, count):
+    env.clear_other_sources()
+    now = datetime.utcnow()
+    with env.journalist_app.app_context():
+        first = env.source_id + 1
+        db.session.execute(Source.__table__.insert(), [
+            dict(id=i,
+                 filesystem_id='benchmark{}'.format(i),
+                 journalist_designation='adjective noun {}'.format(i),
+                 last_updated=now, pending=False, interaction_count=4)
+            for i in range(first, first + count)])
+        # like create-dev-data.py: two messages and two documents each
+        db.session.execute(Submission.__table__.insert(), [
+            dict(source_id=i,
+                 filename='{}-adjective_noun-{}.gpg'.format(
+                     j, 'msg' if j % 2 else 'doc.gz'),
+                 size=KiB, downloaded=j > 2)
+            for i in range(first, first + count)
+            for j in range(1, 5)])
+        db.session.commit()
+
+    client = env.journalist_app.test_client()
+    with client.session_transaction() as session:
+        session['uid'] = env.journalist_id
+    # the first request renders every source row, the next ones reuse them
+    assert client.get('/').status_code == 200
+    return lambda: client.get('/'), None
+
+
+def request_source_lookup(env, count):
+    env.clear(Reply)
+    recipients = [env.source_key, env.config.JOURNALIST_KEY]
+    reply = env.crypto_util.encrypt(os.urandom(KiB), recipients)
+    env.add_files(Reply, count, reply)
+
+    client = env.source_app.test_client()
+    with client.session_transaction() as session:
+        session['logged_in'] = True
+        session['codename'] = env.codename
+    assert client.get('/lookup').status_code == 200
+    return lambda: client.get('/lookup'), None
+
+
+# (name, function, parameter, default values, default --repeat)
+BENCHMARKS = [
+    ('crypto.hash_codename', crypto_hash_codename, None, [None], 10),
+    ('crypto.genkeypair', crypto_genkeypair, None, [None], 3),
+    ('crypto.encrypt', crypto_encrypt, 'size', [KiB, MiB, 50 * MiB], 5),
+    ('crypto.decrypt', crypto_decrypt, 'size', [KiB, MiB, 50 * MiB], 5),
+    ('storage.secure_tempfile', storage_secure_tempfile, 'size',
+     [MiB, 50 * MiB], 5),
+    ('storage.save_file_submission', storage_save_file_submission, 'size',
+     [KiB, MiB, 50 * MiB], 5),
+    ('storage.build_bulk_archive', storage_build_bulk_archive, 'submissions',
+     [10, 100], 5),
+    ('request.journalist_index', request_journalist_index, 'sources',
+     [100, 1000, 10000], 5),
+    ('request.source_lookup', request_source_lookup, 'replies',
+     [1, 10, 50], 5),
+]
+
+
+def measure(run, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        run()
+        times.append(time.time() - start)
+    times.sort()
+    return times
+
+
+def describe_run(config):
+    try:
+        revision = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT,
+            stderr=subprocess.STDOUT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {'date': datetime.utcnow().isoformat() + 'Z',
+            'revision': revision,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'cpus': os.sysconf('SC_NPROCESSORS_ONLN'),
+            'scrypt_params': config.SCRYPT_PARAMS}
+
+
+def result_key(result):
+    return (result['name'], json.dumps(result['params'], sort_keys=True))
+
+
+def format_params(params):
+    return ' '.join('{}={}'.format(k, v) for k, v in sorted(params.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-o', '--output', help='write the results here')
+    parser.add_argument('--compare', help='results of a previous run')
+    parser.add_argument('--only', nargs='+', metavar='NAME',
+                        help='only run the benchmarks whose name starts '
+                        'with one of these, e.g. crypto')
+    parser.add_argument('--repeat', type=int,
+                        help='runs per parameter (default: per benchmark)')
+    parser.add_argument('--size', type=int, nargs='+',
+                        help='sizes in bytes, for the crypto and storage '
+                        'benchmarks')
+    parser.add_argument('--submissions', type=int, nargs='+')
+    parser.add_argument('--sources', type=int, nargs='+')
+    parser.add_argument('--replies', type=int, nargs='+')
+    args = parser.parse_args()
+
+    previous = {}
+    if args.compare:
+        with open(args.compare) as f:
+            previous = dict((result_key(r), r) for r in
+                            json.load(f)['results'])
+
+    workdir = tempfile.mkdtemp()
+    try:
+        env = Environment(workdir)
+        results = []
+        for name, function, parameter, values, repeat in BENCHMARKS:
+            if args.only and not name.startswith(tuple(args.only)):
+                continue
+            values = getattr(args, parameter or '', None) or values
+            for value in values:
+                params = {parameter: value} if parameter else {}
+                run, size = function(env, value)
+                times = measure(run, args.repeat or repeat)
+                result = {'name': name,
+                          'params': params,
+                          'times': times,
+                          'best': times[0],
+                          'median': times[len(times) // 2],
+                          'mean': sum(times) / len(times)}
+                if size:
+                    result['bytes_per_second'] = size / result['median']
+                results.append(result)
+
+                line = '{:<30} {:<20} {:9.4f}s best {:9.4f}s median'.format(
+                    name, format_params(params), result['best'],
+                    result['median'])
+                if size:
+                    line += ' {:9.1f} MiB/s'.format(
+                        result['bytes_per_second'] / MiB)
+                before = previous.get(result_key(result))
+                if before:
+                    line += ' {:+7.1%}'.format(
+                        result['median'] / before['median'] - 1)
+                print(line)
+                sys.stdout.flush()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'run': describe_run(env.config), 'results': results},
+                      f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Time the first and the steady-state renders of the templates of both
+interfaces, with and without the on-disk cache of compiled templates.
+
+    ./benchmarks/bench_template_render.py --runs 5 --renders 1000
+
+The first render is timed in a fresh interpreter, `--runs` times, with the
+cache disabled, with an empty cache and with a cache filled by an earlier
+process, which is the case after a restart. The steady-state render is timed
+in-process, once every template has been loaded. Run it from a tree with a
+`config.py`.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TEMPLATES = [
+    # (interface, template)
+    ('journalist', 'login.html'),
+    ('journalist', 'index.html'),
+    ('source', 'index.html'),
+    ('source', 'lookup.html'),
+]
+
+# Run in the fresh interpreter: create the app, then time the first load of
+# every template of TEMPLATES, and print the results as JSON.
+FIRST_RENDER = r'''
+import json, sys, time
+sys.path.insert(0, %(root)r)
+sys.path.insert(0, %(benchmarks)r)
+import bench_template_render as bench
+app = bench.make_app(%(interface)r, %(workdir)r, %(cache_dir)r)
+times = {}
+for interface, name in bench.TEMPLATES:
+    if interface == %(interface)r:
+        start = time.time()
+        app.jinja_env.get_template(name)
+        times[name] = time.time() - start
+sys.stdout.write(json.dumps(times))
+'''
+
+
+def make_app(interface, workdir, cache_dir):
+    import journalist_app
+    import source_app
+    from sdconfig import SDConfig
+
+    config = SDConfig()
+    config.SECUREDROP_DATA_ROOT = workdir
+    config.STORE_DIR = os.path.join(workdir, 'store')
+    config.TEMP_DIR = os.path.join(workdir, 'tmp')
+    config.DATABASE_FILE = os.path.join(workdir, 'db.sqlite')
+    config.TEMPLATE_CACHE_DIR = cache_dir
+    for directory in (config.STORE_DIR, config.TEMP_DIR):
+        if not os.path.isdir(directory):
+            os.mkdir(directory)
+    module = journalist_app if interface == 'journalist' else source_app
+    return module.create_app(config)
+
+
+def first_render(interface, workdir, cache_dir):
+    env = dict(os.environ)
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+    statement = FIRST_RENDER % dict(root=ROOT,
+                                    benchmarks=os.path.join(ROOT,
+                                                            'benchmarks'),
+                                    interface=interface,
+                                    workdir=workdir,
+                                    cache_dir=cache_dir)
+    out = subprocess.check_output([sys.executable, '-c', statement],
+                                  cwd=ROOT, env=env)
+    return json.loads(out.splitlines()[-1])
+
+
+def bench_first_render(workdir, runs):
+    cache_dir = os.path.join(workdir, 'template_cache')
+    modes = [
+        # (label, cache directory, whether to empty it before each run)
+        ('no cache', None, False),
+        ('empty cache', cache_dir, True),
+        ('filled cache', cache_dir, False),
+    ]
+    print('first render, best of {}'.format(runs))
+    for label, directory, empty in modes:
+        best = {}
+        for _ in range(runs):
+            for interface in ('journalist', 'source'):
+                if empty:
+                    shutil.rmtree(cache_dir, ignore_errors=True)
+                for name, seconds in first_render(interface, workdir,
+                                                  directory).items():
+                    key = (interface, name)
+                    best[key] = min(best.get(key, seconds), seconds)
+        print('  {}'.format(label))
+        for interface, name in TEMPLATES:
+            print('    {:<28} {:8.1f}ms'.format(
+                '{}/{}'.format(interface, name),
+                best[(interface, name)] * 1e3))
+
+
+def bench_steady_state(workdir, renders):
+    from flask import g, render_template
+    import i18n
+
+    print('steady-state render, {} renders'.format(renders))
+    for interface, name in TEMPLATES:
+        if name != 'login.html' and interface == 'journalist':
+            continue  # see bench_index_render.py
+        app = make_app(interface, workdir, None)
+        with app.test_request_context('/'):
+            g.locale = i18n.get_locale(app.sdconfig)
+            g.text_direction = i18n.get_text_direction(g.locale)
+            g.html_lang = i18n.locale_to_rfc_5646(g.locale)
+            g.locales = i18n.get_locale2name()
+            context = dict(codename='abc def ghi', flagged=False,
+                           replies=[], new_user=False, haskey=True,
+                           allow_document_uploads=True)
+            render_template(name, **context)
+            start = time.time()
+            for _ in range(renders):
+                render_template(name, **context)
+            seconds = time.time() - start
+        print('  {:<30} {:8.1f}us per render'.format(
+            '{}/{}'.format(interface, name), seconds / renders * 1e6))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--renders', type=int, default=1000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        bench_first_render(workdir, args.runs)
+        bench_steady_state(workdir, args.renders)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
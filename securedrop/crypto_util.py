@@ -4,13 +4,14 @@
 import gnupg
 import os
 import scrypt
-import subprocess
 
 from base64 import b32encode
 from Cryptodome.Random import random
 from flask import current_app
 from gnupg._util import _is_stream, _make_binary_stream
 
+import metrics
+
 import typing
 # https://www.python.org/dev/peps/pep-0484/#runtime-or-type-checking
 if typing.TYPE_CHECKING:
@@ -18,7 +19,7 @@ if typing.TYPE_CHECKING:
     # That is why all type annotation relative import
     # statements has to be marked as noqa.
     # http://flake8.pycqa.org/en/latest/user/error-codes.html?highlight=f401stream
-    from typing import Dict, List, Text  # noqa: F401
+    from typing import Dict, List, Optional, Text, Tuple  # noqa: F401
 
 # to fix gpg error #78 on production
 os.environ['USERNAME'] = 'www-data'
@@ -28,7 +29,7 @@ class CryptoException(Exception):
     pass
 
 
-class CryptoUtil:
+class CryptoUtil(object):
 
     GPG_KEY_TYPE = "RSA"
     DEFAULT_WORDS_IN_RANDOM_ID = 8
@@ -44,6 +45,9 @@ class CryptoUtil:
                  gpg_key_dir):
         self.__securedrop_root = securedrop_root
         self.__word_list = word_list
+        self.__gpg_key_dir = gpg_key_dir
+        self.__nouns_file = nouns_file
+        self.__adjectives_file = adjectives_file
 
         if os.environ.get('SECUREDROP_ENV') == 'test':
             # Optimize crypto to speed up tests (at the expense of security
@@ -59,27 +63,61 @@ class CryptoUtil:
 
         self.do_runtime_tests()
 
-        self.gpg = gnupg.GPG(binary='gpg2', homedir=gpg_key_dir)
+        # The keyring, which runs gpg to check its version, and the word
+        # lists are only loaded when first used, so that starting a process
+        # that never needs them stays cheap.
+        self.__gpg = None
 
         # map code for a given language to a localized wordlist
         self.__language2words = {}  # type: Dict[Text, List[str]]
 
-        with open(nouns_file) as f:
-            self.nouns = f.read().splitlines()
-
-        with open(adjectives_file) as f:
-            self.adjectives = f.read().splitlines()
+        self.__nouns = None  # type: List[str]
+        self.__adjectives = None  # type: List[str]
 
     # Make sure these pass before the app can run
     # TODO: Add more tests
     def do_runtime_tests(self):
         if self.scrypt_id_pepper == self.scrypt_gpg_pepper:
             raise AssertionError('scrypt_id_pepper == scrypt_gpg_pepper')
-        # crash if we don't have srm:
-        try:
-            subprocess.check_call(['srm'], stdout=subprocess.PIPE)
-        except subprocess.CalledProcessError:
-            pass
+
+    @property
+    def gpg(self):
+        if self.__gpg is None:
+            self.__gpg = gnupg.GPG(binary='gpg2', homedir=self.__gpg_key_dir)
+        return self.__gpg
+
+    def keyring_version(self):
+        # type: () -> Tuple[Optional[float], ...]
+        """Return the modification times of the public keyrings, which
+        change whenever a key is imported or deleted, without running gpg."""
+        versions = []  # type: List[Optional[float]]
+        for keyring in ('pubring.kbx', 'pubring.gpg'):
+            try:
+                versions.append(os.path.getmtime(
+                    os.path.join(self.__gpg_key_dir, keyring)))
+            except OSError:
+                versions.append(None)
+        return tuple(versions)
+
+    def export_pubkey(self, fingerprint):
+        with metrics.timed('gpg'):
+            return self.gpg.export_keys(fingerprint)
+
+    @property
+    def nouns(self):
+        # type: () -> List[str]
+        if self.__nouns is None:
+            with open(self.__nouns_file) as f:
+                self.__nouns = f.read().splitlines()
+        return self.__nouns
+
+    @property
+    def adjectives(self):
+        # type: () -> List[str]
+        if self.__adjectives is None:
+            with open(self.__adjectives_file) as f:
+                self.__adjectives = f.read().splitlines()
+        return self.__adjectives
 
     def get_wordlist(self, locale):
         # type: (Text) -> List[str]
@@ -122,6 +160,7 @@ class CryptoUtil:
         return ' '.join([random.choice(self.adjectives),
                          random.choice(self.nouns)])
 
+    @metrics.timed('hash_codename')
     def hash_codename(self, codename, salt=None):
         """Salts and hashes a codename using scrypt.
 
@@ -157,27 +196,47 @@ class CryptoUtil:
         """
         name = clean(name)
         secret = self.hash_codename(secret, salt=self.scrypt_gpg_pepper)
-        return self.gpg.gen_key(self.gpg.gen_key_input(
-            key_type=self.GPG_KEY_TYPE,
-            key_length=self.__gpg_key_length,
-            passphrase=secret,
-            name_email=name
-        ))
+        with metrics.timed('gpg'):
+            return self.gpg.gen_key(self.gpg.gen_key_input(
+                key_type=self.GPG_KEY_TYPE,
+                key_length=self.__gpg_key_length,
+                passphrase=secret,
+                name_email=name
+            ))
 
     def delete_reply_keypair(self, source_filesystem_id):
-        key = self.getkey(source_filesystem_id)
-        # If this source was never flagged for review, they won't have a reply
+        self.delete_reply_keypairs([source_filesystem_id])
+
+    def delete_reply_keypairs(self, source_filesystem_ids):
+        """Delete the reply keypairs of all of `source_filesystem_ids` with a
+        single scan of the keyring and one gpg call per key type, however
+        many sources are given."""
+        wanted = set(source_filesystem_ids)
+        keys = []
+        with metrics.timed('gpg'):
+            public_keys = self.gpg.list_keys()
+        for key in public_keys:
+            for uid in key['uids']:
+                # Reply keys are generated with the source's filesystem id as
+                # their only email address: "Autogenerated Key <id>"
+                if uid.rsplit('<', 1)[-1].rstrip('>') in wanted:
+                    keys.append(key['fingerprint'])
+                    break
+        # Sources that were never flagged for review won't have a reply
         # keypair
-        if not key:
+        if not keys:
             return
-        # The private key needs to be deleted before the public key can be
+        # The private keys need to be deleted before the public keys can be
         # deleted. http://pythonhosted.org/python-gnupg/#deleting-keys
-        self.gpg.delete_keys(key, True)  # private key
-        self.gpg.delete_keys(key)  # public key
+        with metrics.timed('gpg'):
+            self.gpg.delete_keys(keys, True)  # private keys
+            self.gpg.delete_keys(keys)  # public keys
         # TODO: srm?
 
     def getkey(self, name):
-        for key in self.gpg.list_keys():
+        with metrics.timed('gpg'):
+            public_keys = self.gpg.list_keys()
+        for key in public_keys:
             for uid in key['uids']:
                 if name in uid:
                     return key['fingerprint']
@@ -198,11 +257,12 @@ class CryptoUtil:
         if not _is_stream(plaintext):
             plaintext = _make_binary_stream(plaintext, "utf_8")
 
-        out = self.gpg.encrypt(plaintext,
-                               *fingerprints,
-                               output=output,
-                               always_trust=True,
-                               armor=False)
+        with metrics.timed('gpg'):
+            out = self.gpg.encrypt(plaintext,
+                                   *fingerprints,
+                                   output=output,
+                                   always_trust=True,
+                                   armor=False)
         if out.ok:
             return out.data
         else:
@@ -219,7 +279,9 @@ class CryptoUtil:
         """
         hashed_codename = self.hash_codename(secret,
                                              salt=self.scrypt_gpg_pepper)
-        return self.gpg.decrypt(ciphertext, passphrase=hashed_codename).data
+        with metrics.timed('gpg'):
+            return self.gpg.decrypt(ciphertext,
+                                    passphrase=hashed_codename).data
 
 
 def clean(s, also=''):
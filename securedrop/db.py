@@ -1,5 +1,19 @@
 # -*- coding: utf-8 -*-
 
+import sqlite3
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 db = SQLAlchemy()
+
+
+@event.listens_for(Engine, 'connect')
+def _set_secure_delete(dbapi_connection, connection_record):
+    """Have SQLite overwrite the content it deletes. The setting only lasts
+    as long as the connection, so it is made on each of them."""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA secure_delete = ON')
+        cursor.close()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""The single entry point for deleting submissions, replies and source
+collections from either interface.
+
+Database rows are removed immediately, in the request, so the deleted items
+disappear from both interfaces right away. The files themselves are shredded
+later by the worker: all of the files belonging to one source directory are
+handed to a single job, which overwrites them in-process (see
+:func:`rm.secure_delete`), so deleting many items costs one job instead of
+one job and one `srm` process per item.
+"""
+import os
+
+from collections import OrderedDict
+from flask import current_app
+
+import worker
+
+from db import db
+from rm import secure_delete_batch, DEFAULT_PASSES
+
+
+def delete_items(filesystem_id, items):
+    """Delete the `models.Submission`s and/or `models.Reply`s in `items`,
+    which must all belong to the source `filesystem_id`. Returns the list
+    of queued deletion jobs."""
+    paths = [current_app.storage.path(filesystem_id, item.filename)
+             for item in items]
+    for item in items:
+        db.session.delete(item)
+    db.session.commit()
+    return queue_paths(paths)
+
+
+def delete_source_directory(filesystem_id):
+    """Queue the secure deletion of a source's whole store directory and
+    return the deletion job."""
+    return delete_source_directories([filesystem_id])
+
+
+def delete_source_directories(filesystem_ids):
+    """Queue the secure deletion of several sources' store directories as a
+    single job, and return that job."""
+    return _enqueue([current_app.storage.path(filesystem_id)
+                     for filesystem_id in filesystem_ids])
+
+
+def queue_paths(paths):
+    """Queue secure deletion of `paths`, with one job per source directory,
+    and return the list of queued jobs."""
+    return [_enqueue(batch) for batch in _batch_by_source_directory(paths)]
+
+
+def _enqueue(paths):
+    passes = getattr(current_app.sdconfig, 'SECURE_DELETE_PASSES',
+                     DEFAULT_PASSES)
+    return worker.enqueue(secure_delete_batch, paths, passes=passes,
+                          description='secure deletion of {} path(s)'.format(
+                              len(paths)))
+
+
+def _batch_by_source_directory(paths):
+    batches = OrderedDict()  # type: OrderedDict
+    for path in paths:
+        parent = os.path.dirname(path)
+        if parent == current_app.storage.path():
+            # the path *is* a source directory
+            parent = path
+        batches.setdefault(parent, []).append(path)
+    return list(batches.values())
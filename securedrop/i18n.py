@@ -17,11 +17,12 @@
 #
 from flask import request, session
 from flask_babel import Babel
-from babel import core
+from babel import core, support
 
 import collections
 import os
 import re
+import threading
 
 from os import path
 
@@ -29,6 +30,16 @@ LOCALE_SPLIT = re.compile('(-|_)')
 LOCALES = ['en_US']
 babel = None
 
+# The Babel lookups made for every request are done once per process: the
+# names and text directions of LOCALES by setup_app, and the negotiation of
+# each distinct Accept-Language header the first time it is seen.
+LOCALE2NAME = collections.OrderedDict()  # type: collections.OrderedDict
+TEXT_DIRECTIONS = {}  # type: dict
+TRANSLATIONS = {}  # type: dict
+ACCEPT_LANGUAGES_CACHE_SIZE = 1024
+_accept_languages = collections.OrderedDict()  # type: collections.OrderedDict
+_accept_languages_lock = threading.Lock()
+
 
 class LocaleNotFound(Exception):
 
@@ -69,6 +80,20 @@ def setup_app(config, app):
 
     babel.localeselector(lambda: get_locale(config))
 
+    _cache_locales()
+
+
+def _cache_locales():
+    global LOCALE2NAME
+    global TEXT_DIRECTIONS
+
+    LOCALE2NAME = _get_locale2name(LOCALES)
+    TEXT_DIRECTIONS = dict((l, core.Locale.parse(l).text_direction)
+                           for l in LOCALES)
+    TRANSLATIONS.clear()
+    with _accept_languages_lock:
+        _accept_languages.clear()
+
 
 def get_locale(config):
     """
@@ -79,21 +104,11 @@ def get_locale(config):
     - 'en_US'
     """
     locale = None
-    accept_languages = []
-    for l in request.accept_languages.values():
-        if '-' in l:
-            sep = '-'
-        else:
-            sep = '_'
-        try:
-            accept_languages.append(str(core.Locale.parse(l, sep)))
-        except Exception:
-            pass
     if 'l' in request.args:
         if len(request.args['l']) == 0:
             if 'locale' in session:
                 del session['locale']
-            locale = core.negotiate_locale(accept_languages, LOCALES)
+            locale = _negotiate_accept_languages()
         else:
             locale = core.negotiate_locale([request.args['l']], LOCALES)
             session['locale'] = locale
@@ -101,7 +116,7 @@ def get_locale(config):
         if 'locale' in session:
             locale = session['locale']
         else:
-            locale = core.negotiate_locale(accept_languages, LOCALES)
+            locale = _negotiate_accept_languages()
 
     if locale:
         return locale
@@ -109,8 +124,62 @@ def get_locale(config):
         return getattr(config, 'DEFAULT_LOCALE', 'en_US')
 
 
+def _negotiate_accept_languages():
+    """Return the supported locale that best matches the Accept-Language
+    header of the request, or None. The result is remembered for the
+    ACCEPT_LANGUAGES_CACHE_SIZE most recently seen headers."""
+    header = request.headers.get('Accept-Language', '')
+    with _accept_languages_lock:
+        if header in _accept_languages:
+            locale = _accept_languages.pop(header)
+            _accept_languages[header] = locale
+            return locale
+
+    accept_languages = []
+    for l in request.accept_languages.values():
+        if '-' in l:
+            sep = '-'
+        else:
+            sep = '_'
+        try:
+            accept_languages.append(str(core.Locale.parse(l, sep)))
+        except Exception:
+            pass
+    locale = core.negotiate_locale(accept_languages, LOCALES)
+
+    with _accept_languages_lock:
+        _accept_languages[header] = locale
+        while len(_accept_languages) > ACCEPT_LANGUAGES_CACHE_SIZE:
+            _accept_languages.popitem(last=False)
+    return locale
+
+
+def get_translations(locale):
+    """Return the message catalog of `locale`. Flask-Babel reads it from disk
+    for every request; it is read once per process here instead, and
+    setup_g hands it to Flask-Babel."""
+    try:
+        return TRANSLATIONS[locale]
+    except KeyError:
+        pass
+
+    translations = support.Translations()
+    for dirname in babel.translation_directories:
+        catalog = support.Translations.load(dirname, [locale], babel.domain)
+        translations.merge(catalog)
+        # merge() does not copy the plural forms, see
+        # flask_babel.get_translations
+        if hasattr(catalog, 'plural'):
+            translations.plural = catalog.plural
+    TRANSLATIONS[locale] = translations
+    return translations
+
+
 def get_text_direction(locale):
-    return core.Locale.parse(locale).text_direction
+    try:
+        return TEXT_DIRECTIONS[locale]
+    except KeyError:
+        return core.Locale.parse(locale).text_direction
 
 
 def _get_supported_locales(locales, supported, default_locale,
@@ -144,8 +213,16 @@ NAME_OVERRIDES = {
 
 
 def get_locale2name():
+    """Return the names of the supported locales, in their own language.
+    The mapping is shared and must not be modified."""
+    if not LOCALE2NAME:
+        _cache_locales()
+    return LOCALE2NAME
+
+
+def _get_locale2name(locales):
     locale2name = collections.OrderedDict()
-    for l in LOCALES:
+    for l in locales:
         if l in NAME_OVERRIDES:
             locale2name[l] = NAME_OVERRIDES[l]
         else:
@@ -8,12 +8,17 @@ from flask_wtf.csrf import CSRFProtect, CSRFError
 from os import path
 
 import i18n
+import metrics
+import query_counter
+import static_assets
+import template_cache
 import template_filters
 import version
 
 from crypto_util import CryptoUtil
 from db import db
-from journalist_app import account, admin, main, col
+from journalist_app import account, admin, main, col, api
+from journalist_app.fragment_cache import FragmentCache
 from journalist_app.utils import get_source, logged_in
 from models import Journalist
 from store import Storage
@@ -28,6 +33,9 @@ if typing.TYPE_CHECKING:
     from sdconfig import SDConfig  # noqa: F401
 
 _insecure_views = ['main.login', 'static']
+# Views polled by the UI in the background, which must not keep an inactive
+# session from expiring
+_background_views = ['api.notifications']
 
 
 def create_app(config):
@@ -39,8 +47,12 @@ def create_app(config):
     app.config.from_object(config.JournalistInterfaceFlaskConfig)
     app.sdconfig = config
 
+    # before the other before_request hooks are registered, to time them too
+    metrics.setup_app(config, app, 'journalist')
+    query_counter.setup_app(config, app)
+
     CSRFProtect(app)
-    Environment(app)
+    static_assets.setup_app(app, Environment(app))
 
     if config.DATABASE_ENGINE == "sqlite":
         db_uri = (config.DATABASE_ENGINE + ":///" +
@@ -72,6 +84,11 @@ def create_app(config):
         gpg_key_dir=config.GPG_KEY_DIR,
     )
 
+    # Rendered rows of the index, see journalist_app.utils.render_source_rows
+    app.source_row_cache = FragmentCache(
+        getattr(config, 'SOURCE_ROW_CACHE_SIZE', 10000))
+    app.metrics.register_stats('source_row_cache', app.source_row_cache.stats)
+
     @app.errorhandler(CSRFError)
     def handle_csrf_error(e):
         # render the message first to ensure it's localized.
@@ -84,6 +101,7 @@ def create_app(config):
 
     app.jinja_env.trim_blocks = True
     app.jinja_env.lstrip_blocks = True
+    template_cache.setup_app(config, app)
     app.jinja_env.globals['version'] = version.__version__
     if hasattr(config, 'CUSTOM_HEADER_IMAGE'):
         app.jinja_env.globals['header_image'] = \
@@ -99,7 +117,8 @@ def create_app(config):
 
     @app.template_filter('autoversion')
     def autoversion_filter(filename):
-        """Use this template filter for cache busting"""
+        """Use this template filter for cache busting of the files that
+        change at runtime, and are therefore not hashed by static_assets"""
         absolute_filename = path.join(config.SECUREDROP_ROOT, filename[1:])
         if path.exists(absolute_filename):
             timestamp = str(path.getmtime(absolute_filename))
@@ -116,16 +135,18 @@ def create_app(config):
             flash(gettext('You have been logged out due to inactivity'),
                   'error')
 
-        session['expires'] = datetime.utcnow() + \
-            timedelta(minutes=getattr(config,
-                                      'SESSION_EXPIRATION_MINUTES',
-                                      120))
+        if request.endpoint not in _background_views:
+            session['expires'] = datetime.utcnow() + \
+                timedelta(minutes=getattr(config,
+                                          'SESSION_EXPIRATION_MINUTES',
+                                          120))
 
         uid = session.get('uid', None)
         if uid:
             g.user = Journalist.query.get(uid)
 
         g.locale = i18n.get_locale(config)
+        request.babel_translations = i18n.get_translations(g.locale)
         g.text_direction = i18n.get_text_direction(g.locale)
         g.html_lang = i18n.locale_to_rfc_5646(g.locale)
         g.locales = i18n.get_locale2name()
@@ -144,5 +165,6 @@ def create_app(config):
                            url_prefix='/account')
     app.register_blueprint(admin.make_blueprint(config), url_prefix='/admin')
     app.register_blueprint(col.make_blueprint(config), url_prefix='/col')
+    app.register_blueprint(api.make_blueprint(config), url_prefix='/api/v1')
 
     return app
@@ -3,11 +3,15 @@
 import os
 
 from flask import (Blueprint, render_template, request, url_for, redirect, g,
-                   current_app, flash, abort)
+                   current_app, flash, abort, make_response)
 from flask_babel import gettext
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.exc import NoResultFound
 
+import maintenance
+import metrics
+import worker
+
 from db import db
 from models import Journalist, InvalidUsernameException, PasswordError
 from journalist_app.decorators import admin_required
@@ -230,4 +234,47 @@ def make_blueprint(config):
               'notification')
         return redirect(url_for('admin.manage_config'))
 
+    @view.route('/metrics')
+    @admin_required
+    def request_metrics():
+        return render_template('metrics.html',
+                               metrics=current_app.metrics.collect(),
+                               categories=metrics.CATEGORIES,
+                               inf=float('inf'),
+                               max_bound=metrics.BUCKETS[-2])
+
+    @view.route('/metrics.txt')
+    @admin_required
+    def request_metrics_text():
+        resp = make_response(
+            metrics.exposition(current_app.metrics.collect()))
+        resp.headers['Content-Type'] = 'text/plain; version=0.0.4'
+        return resp
+
+    @view.route('/jobs')
+    @admin_required
+    def jobs():
+        return render_template(
+            'jobs.html', queues=worker.stats(),
+            failed_jobs=worker.failed_jobs(),
+            maintenance_tasks=maintenance.TASKS,
+            maintenance_runs=maintenance.status(config),
+            maintenance_intervals=maintenance.intervals(config))
+
+    @view.route('/jobs/<job_id>/requeue', methods=('POST',))
+    @admin_required
+    def requeue_job(job_id):
+        if worker.requeue(job_id) is None:
+            abort(404)
+        flash(gettext('The job was queued again.'), 'notification')
+        return redirect(url_for('admin.jobs'))
+
+    @view.route('/jobs/<job_id>/discard', methods=('POST',))
+    @admin_required
+    def discard_job(job_id):
+        if not worker.discard(job_id):
+            abort(404)
+        flash(gettext('The job was discarded.'), 'notification')
+        return redirect(url_for('admin.jobs'))
+
     return view
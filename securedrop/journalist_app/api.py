@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import threading
+
+from collections import OrderedDict
+from datetime import datetime
+from flask import Blueprint, Response, abort, jsonify, request, url_for
+from sqlalchemy import func, select
+from sqlalchemy.sql.expression import false
+
+import maintenance
+
+from notifications import Subscription
+
+from db import db
+from models import Change, Reply, Source, SourceStar, Submission
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Seconds a long poll of /notifications waits for a new submission
+DEFAULT_POLL_TIMEOUT = 25
+MAX_POLL_TIMEOUT = 60
+# Long polls waiting at once per web process, each holding on to one of its
+# threads: past these, polls are answered right away
+DEFAULT_MAX_LONG_POLLS = 10
+
+# The fields that can be requested with `?fields=`, and the columns they are
+# read from. Only the columns of the requested fields are queried, so no
+# model, and none of their relationships, are loaded.
+SOURCE_FIELDS = OrderedDict([
+    ('filesystem_id', Source.filesystem_id),
+    ('journalist_designation', Source.journalist_designation),
+    ('flagged', Source.flagged),
+    ('last_updated', Source.last_updated),
+    ('interaction_count', Source.interaction_count),
+    ('starred', SourceStar.starred),
+    ('submissions_count',
+     select([func.count(Submission.id)])
+     .where(Submission.source_id == Source.id).as_scalar()),
+])
+SUBMISSION_FIELDS = OrderedDict([
+    ('filename', Submission.filename),
+    ('size', Submission.size),
+    ('downloaded', Submission.downloaded),
+    ('url', Submission.filename),
+])
+REPLY_FIELDS = OrderedDict([
+    ('filename', Reply.filename),
+    ('size', Reply.size),
+    ('url', Reply.filename),
+])
+
+
+def make_blueprint(config):
+    view = Blueprint('api', __name__)
+    long_polls = threading.BoundedSemaphore(
+        getattr(config, 'MAX_LONG_POLLS', DEFAULT_MAX_LONG_POLLS))
+
+    @view.route('/changes')
+    def changes():
+        """Return, oldest first, up to `limit` changes to sources and their
+        collections made after the change `since` (a cursor returned by an
+        earlier call; 0, the default, returns the whole journal).
+
+        Clients keep the returned `cursor` for their next call, and call
+        again right away while `has_more` is true. A cursor so old that
+        deletions made after it have been purged from the journal since is
+        answered with 410 Gone: the client has to start over from 0.
+        """
+        since = _int_arg('since', 0)
+        if 0 < since < _purged_cursor(config):
+            abort(410)
+        limit = _limit()
+
+        changes = Change.query.filter(Change.id > since) \
+                              .order_by(Change.id) \
+                              .limit(limit + 1).all()
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+
+        return jsonify(cursor=changes[-1].id if changes else since,
+                       has_more=has_more,
+                       changes=[change.to_json() for change in changes])
+
+    @view.route('/notifications')
+    def notifications():
+        """Long poll for the sources that have made new submissions since the
+        change `since`: wait up to `timeout` seconds for one to arrive, and
+        return the number of new submissions and unread submissions of each
+        of these sources, along with the cursor to poll with next.
+
+        Without `since`, or when MAX_LONG_POLLS polls are waiting already,
+        return right away.
+        """
+        if 'since' not in request.args:
+            return jsonify(cursor=Change.last_id(), sources=[])
+        since = _int_arg('since', 0)
+        timeout = max(0, min(_int_arg('timeout', DEFAULT_POLL_TIMEOUT),
+                             MAX_POLL_TIMEOUT))
+
+        with Subscription() as subscription:
+            cursor, sources = _new_submissions(since)
+            if not sources and timeout and long_polls.acquire(False):
+                try:
+                    # don't hold on to a database connection while waiting
+                    db.session.close()
+                    if subscription.wait(timeout):
+                        cursor, sources = _new_submissions(since)
+                finally:
+                    long_polls.release()
+
+        return jsonify(cursor=cursor, sources=sources)
+
+    @view.route('/sources')
+    def sources():
+        """List the sources shown on the index, with the `fields` requested,
+        in pages of `limit` sources following the cursor `after`."""
+        fields = _fields(SOURCE_FIELDS)
+        etag = _etag(Change.last_id())
+        if request.if_none_match.contains(etag):
+            return _not_modified(etag)
+
+        query = _select(Source.id, SOURCE_FIELDS, fields) \
+            .filter(Source.pending == False)  # noqa: E712
+        if 'starred' in fields:
+            query = query.outerjoin(SourceStar,
+                                    SourceStar.source_id == Source.id)
+        return _page('sources', _rows(query, Source.id),
+                     lambda row: _serialize(row, fields), etag)
+
+    @view.route('/sources/<filesystem_id>/submissions')
+    def submissions(filesystem_id):
+        """List the submissions of a source, with the `fields` requested, in
+        pages of `limit` submissions following the cursor `after`."""
+        return _collection(filesystem_id, Submission, SUBMISSION_FIELDS,
+                           'submissions')
+
+    @view.route('/sources/<filesystem_id>/replies')
+    def replies(filesystem_id):
+        """List the replies to a source, like :func:`submissions`."""
+        return _collection(filesystem_id, Reply, REPLY_FIELDS, 'replies')
+
+    return view
+
+
+def _collection(filesystem_id, model, available, name):
+    fields = _fields(available)
+    source = db.session.query(Source.id, Source.last_updated,
+                              Source.interaction_count) \
+                       .filter(Source.filesystem_id == filesystem_id) \
+                       .first()
+    if source is None:
+        abort(404)
+    etag = _etag(source.last_updated, source.interaction_count,
+                 Change.last_id(filesystem_id))
+    if request.if_none_match.contains(etag):
+        return _not_modified(etag)
+
+    query = _select(model.id, available, fields) \
+        .filter(model.source_id == source.id)
+
+    def serialize(row):
+        item = _serialize(row, fields)
+        if 'url' in item:
+            item['url'] = url_for('col.download_single_submission',
+                                  filesystem_id=filesystem_id, fn=item['url'])
+        return item
+
+    return _page(name, _rows(query, model.id), serialize, etag)
+
+
+def _purged_cursor(config):
+    """Return the cursor up to which deletions have been purged from the
+    change journal, as far as is known."""
+    run = maintenance.status(config).get('prune_changes')
+    if run is None or run['status'] != 'finished':
+        return 0
+    return run['result']['purged']
+
+
+def _new_submissions(since):
+    """Return the cursor of the last change, and for each source that made
+    submissions after the change `since`, how many, and how many of its
+    submissions are unread."""
+    cursor = Change.last_id()
+    new = db.session.query(Change.filesystem_id, func.count(Change.id)) \
+                    .filter(Change.id > since,
+                            Change.id <= cursor,
+                            Change.type == 'submission',
+                            Change.action == Change.ADD) \
+                    .group_by(Change.filesystem_id) \
+                    .all()
+    if not new:
+        return cursor, []
+
+    unread = dict(
+        db.session.query(Source.filesystem_id, func.count(Submission.id))
+                  .join(Submission)
+                  .filter(Source.filesystem_id.in_([f for (f, _) in new]),
+                          Submission.downloaded == false())
+                  .group_by(Source.filesystem_id))
+    return cursor, [{'filesystem_id': filesystem_id,
+                     'new': count,
+                     'unread': unread.get(filesystem_id, 0)}
+                    for (filesystem_id, count) in new]
+
+
+def _int_arg(name, default):
+    try:
+        return int(request.args.get(name, default))
+    except ValueError:
+        abort(400)
+
+
+def _limit():
+    return max(1, min(_int_arg('limit', DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+
+
+def _fields(available):
+    """Return the fields requested with `?fields=`, all of them by default.
+    """
+    requested = request.args.get('fields')
+    if not requested:
+        return list(available)
+    fields = requested.split(',')
+    if not set(fields) <= set(available):
+        abort(400)
+    return fields
+
+
+def _select(key, available, fields):
+    return db.session.query(
+        key.label('key'),
+        *[available[field].label(field) for field in fields])
+
+
+def _rows(query, key):
+    """Return the page of `query` that follows the cursor `after`, plus one
+    row if there is a next page."""
+    return query.filter(key > _int_arg('after', 0)) \
+                .order_by(key) \
+                .limit(_limit() + 1).all()
+
+
+def _serialize(row, fields):
+    item = {}
+    for field in fields:
+        value = getattr(row, field)
+        if isinstance(value, datetime):
+            value = value.isoformat() + 'Z'
+        item[field] = value
+    return item
+
+
+def _page(name, rows, serialize, etag):
+    """Return the `rows` fetched by :func:`_rows` as a page of JSON, along
+    with the cursor to the next page."""
+    limit = _limit()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    resp = jsonify(**{name: [serialize(row) for row in rows],
+                      'cursor': rows[-1].key if rows else _int_arg('after', 0),
+                      'has_more': has_more})
+    resp.set_etag(etag)
+    return resp
+
+
+def _etag(*version):
+    """Return a strong ETag for the current request, given the `version` of
+    the data it returns. Any change to that data moves the change journal
+    forward, so its last cursor is always part of the `version`."""
+    return hashlib.sha256(repr((request.path,
+                                sorted(request.args.items(multi=True)),
+                                version))).hexdigest()
+
+
+def _not_modified(etag):
+    resp = Response(status=304)
+    resp.set_etag(etag)
+    return resp
@@ -1,9 +1,15 @@
 # -*- coding: utf-8 -*-
 
+import os
+import time
+
 from flask import (Blueprint, redirect, url_for, render_template, flash,
-                   request, abort, send_file, current_app)
+                   request, abort, current_app, jsonify)
 from flask_babel import gettext
 from sqlalchemy.orm.exc import NoResultFound
+from werkzeug.utils import secure_filename
+
+import worker
 
 from db import db
 from models import Submission
@@ -11,7 +17,8 @@ from journalist_app.forms import ReplyForm
 from journalist_app.utils import (make_star_true, make_star_false, get_source,
                                   delete_collection, col_download_unread,
                                   col_download_all, col_star, col_un_star,
-                                  col_delete)
+                                  col_delete, send_resumable_file)
+from store import PathException
 
 
 def make_blueprint(config):
@@ -80,7 +87,51 @@ def make_blueprint(config):
             current_app.logger.error(
                 "Could not mark " + fn + " as downloaded: %s" % (e,))
 
-        return send_file(current_app.storage.path(filesystem_id, fn),
-                         mimetype="application/pgp-encrypted")
+        return send_resumable_file(current_app.storage.path(filesystem_id, fn),
+                                   mimetype="application/pgp-encrypted")
+
+    @view.route('/archive/<archive>/<filename>')
+    def download_archive(archive, filename):
+        """Sends a client a bulk archive prepared by `utils.download`, for as
+        long as it is younger than `BULK_ARCHIVE_TTL_MINUTES`.
+
+        While the worker is still building the archive, a progress page is
+        shown instead, or, with `?status`, its state as JSON. If the build
+        failed after all its attempts, the client is sent back to the
+        collection it was downloading from, or to the index.
+        """
+        try:
+            path = current_app.storage.bulk_archive_path(archive)
+        except PathException:
+            abort(404)
+
+        try:
+            age = time.time() - os.stat(path).st_mtime
+        except OSError:
+            job = worker.fetch_job(archive)
+            if job is None or job.is_finished:
+                abort(404)
+            # a failed build which is to be retried is still being built
+            failed = job.is_failed and 'retry_at' not in job.meta
+            status = 'failed' if failed else 'building'
+        else:
+            if age > 60 * getattr(config, 'BULK_ARCHIVE_TTL_MINUTES', 60):
+                abort(404)
+            status = 'ready'
+
+        if 'status' in request.args:
+            return jsonify(status=status)
+        if status == 'ready':
+            return send_resumable_file(
+                path, mimetype="application/zip",
+                attachment_filename=secure_filename(filename))
+        if status == 'failed':
+            flash(gettext("The archive could not be prepared. "
+                          "Please try again."), "error")
+            if 'filesystem_id' in request.args:
+                return redirect(url_for(
+                    'col.col', filesystem_id=request.args['filesystem_id']))
+            return redirect(url_for('main.index'))
+        return render_template('archive.html'), 202
 
     return view
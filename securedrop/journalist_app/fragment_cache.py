@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import threading
+
+
+class FragmentCache(object):
+    """A bounded, least-recently-used, in-process cache of rendered HTML
+    fragments, such as the rows of the index.
+
+    Each fragment is stored under a `key` (e.g. a source and a locale) along
+    with the `version` of the data it was rendered from. A lookup only hits
+    if the version still matches, so writes invalidate fragments without
+    having to notify every process, and there is at most one fragment, the
+    latest, per key.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.__lock = threading.Lock()
+        self.__fragments = collections.OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.size > 0
+
+    def get(self, key, version):
+        """Return the fragment stored under `key` for `version`, or None."""
+        with self.__lock:
+            try:
+                cached_version, fragment = self.__fragments.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            if cached_version != version:
+                self.misses += 1
+                return None
+            # move it to the most recently used end
+            self.__fragments[key] = (cached_version, fragment)
+            self.hits += 1
+            return fragment
+
+    def set(self, key, version, fragment):
+        if not self.enabled:
+            return
+        with self.__lock:
+            self.__fragments.pop(key, None)
+            self.__fragments[key] = (version, fragment)
+            while len(self.__fragments) > self.size:
+                self.__fragments.popitem(last=False)
+
+    def retain(self, predicate):
+        """Drop the fragments whose key does not satisfy `predicate`, e.g.
+        those of the sources that have been deleted."""
+        with self.__lock:
+            for key in [k for k in self.__fragments if not predicate(k)]:
+                del self.__fragments[key]
+
+    def clear(self):
+        with self.__lock:
+            self.__fragments.clear()
+
+    def __len__(self):
+        return len(self.__fragments)
+
+    def stats(self):
+        return {'size': self.size,
+                'length': len(self),
+                'hits': self.hits,
+                'misses': self.misses}
@@ -4,13 +4,15 @@ from datetime import datetime
 from flask import (Blueprint, request, current_app, session, url_for, redirect,
                    render_template, g, flash, abort)
 from flask_babel import gettext
+from sqlalchemy.orm import contains_eager
 from sqlalchemy.sql.expression import false
 
 from db import db
-from models import Source, SourceStar, Submission, Reply
+from models import Source, Submission, Reply, Change
 from journalist_app.forms import ReplyForm
 from journalist_app.utils import (validate_user, bulk_delete, download,
-                                  confirm_bulk_delete, get_source)
+                                  confirm_bulk_delete, get_source,
+                                  count_submissions, render_source_rows)
 
 
 def make_blueprint(config):
@@ -52,21 +54,30 @@ def make_blueprint(config):
         # the Pocoo style guide, IMHO:
         # http://www.pocoo.org/internal/styleguide/
         sources = Source.query.filter_by(pending=False) \
+                              .outerjoin(Source.star) \
+                              .options(contains_eager(Source.star)) \
                               .order_by(Source.last_updated.desc()) \
                               .all()
+        counts = count_submissions()
         for source in sources:
-            star = SourceStar.query.filter_by(source_id=source.id).first()
-            if star and star.starred:
+            if source.star and source.star.starred:
                 starred.append(source)
             else:
                 unstarred.append(source)
-            source.num_unread = len(
-                Submission.query.filter_by(source_id=source.id,
-                                           downloaded=False).all())
+            unread, documents, messages = counts.get(source.id, (0, 0, 0))
+            source.num_unread = unread
+            source.docs_msgs_count = {'messages': messages,
+                                      'documents': documents}
+
+        # Forget the rows of the sources that have been deleted
+        filesystem_ids = set(source.filesystem_id for source in sources)
+        current_app.source_row_cache.retain(
+            lambda key: key[0] in filesystem_ids)
 
         return render_template('index.html',
-                               unstarred=unstarred,
-                               starred=starred)
+                               unstarred=render_source_rows(unstarred),
+                               starred=render_source_rows(starred),
+                               notifications_cursor=Change.last_id())
 
     @view.route('/reply', methods=('POST',))
     def reply():
@@ -145,7 +156,8 @@ def make_blueprint(config):
 
         if action == 'download':
             source = get_source(g.filesystem_id)
-            return download(source.journalist_filename, selected_docs)
+            return download(source.journalist_filename, selected_docs,
+                            g.filesystem_id)
         elif action == 'delete':
             return bulk_delete(g.filesystem_id, selected_docs)
         elif action == 'confirm_delete':
@@ -183,6 +195,7 @@ def make_blueprint(config):
             flash(gettext("No unread submissions for this source."))
             return redirect(url_for('col.col', filesystem_id=filesystem_id))
         source = get_source(filesystem_id)
-        return download(source.journalist_filename, submissions)
+        return download(source.journalist_filename, submissions,
+                        filesystem_id)
 
     return view
@@ -1,20 +1,28 @@
 # -*- coding: utf-8 -*-
 
+import hashlib
+import os
+
+from collections import OrderedDict
 from datetime import datetime
 from flask import (g, flash, current_app, abort, send_file, redirect, url_for,
-                   render_template, Markup)
+                   render_template, Markup, escape, request)
 from flask_babel import gettext, ngettext
+from sqlalchemy import case, func, or_
+from sqlalchemy.orm import contains_eager
 from sqlalchemy.sql.expression import false
 
+import deletion
 import i18n
+import store
+import template_filters
 import worker
 
 from db import db
 from models import (get_one_or_else, Source, Journalist,
                     InvalidUsernameException, WrongPasswordException,
                     LoginThrottledException, BadTokenException, SourceStar,
-                    PasswordError, Submission)
-from rm import srm
+                    PasswordError, Submission, Reply, Change)
 
 import typing
 # https://www.python.org/dev/peps/pep-0484/#runtime-or-type-checking
@@ -64,6 +72,67 @@ def get_source(filesystem_id):
     return source
 
 
+def count_submissions():
+    """Return, for each source id, the number of its unread submissions, of
+    its documents, and of its messages, all counted in a single query."""
+    def count(condition):
+        return func.sum(case([(condition, 1)], else_=0))
+
+    rows = db.session.query(
+        Submission.source_id,
+        count(Submission.downloaded == false()),
+        count(or_(Submission.filename.like('%doc.gz.gpg'),
+                  Submission.filename.like('%doc.zip.gpg'))),
+        count(Submission.filename.like('%msg.gpg'))) \
+        .group_by(Submission.source_id)
+    return dict((source_id, (int(unread), int(documents), int(messages)))
+                for (source_id, unread, documents, messages) in rows)
+
+
+# Stand-ins for the parts of a source row that change without the source
+# changing, and which are therefore filled in after the row is cached.
+ROW_INDEX_PLACEHOLDER = u'__source_row_index__'
+ROW_RELATIVE_TIME_PLACEHOLDER = u'__source_row_relative_time__'
+
+
+def render_source_rows(sources):
+    """Render the rows of the index for `sources`, the way
+    ``_source_row.html`` does, reusing the rows cached in
+    ``current_app.source_row_cache`` for sources that have not changed.
+
+    The sources must have been given their `num_unread` and
+    `docs_msgs_count`, as :func:`main.index` does."""
+    cache = current_app.source_row_cache
+    template = None
+    rows = []
+    for index, source in enumerate(sources, 1):
+        counts = source.documents_messages_count()
+        key = (source.filesystem_id, str(g.locale))
+        version = (source.journalist_designation,
+                   source.last_updated,
+                   bool(source.star and source.star.starred),
+                   source.num_unread,
+                   counts['documents'],
+                   counts['messages'])
+        row = cache.get(key, version)
+        if row is None:
+            if template is None:
+                template = current_app.jinja_env.get_template(
+                    '_source_row.html')
+            row = template.render(
+                source=source,
+                loop_index=ROW_INDEX_PLACEHOLDER,
+                last_updated_relative=ROW_RELATIVE_TIME_PLACEHOLDER)
+            cache.set(key, version, row)
+        relative_time = template_filters.rel_datetime_format(
+            source.last_updated, relative=True)
+        rows.append(Markup(
+            row.replace(ROW_INDEX_PLACEHOLDER, unicode(index))
+               .replace(ROW_RELATIVE_TIME_PLACEHOLDER,
+                        escape(relative_time))))
+    return rows
+
+
 def validate_user(username, password, token, error_message=None):
     """
     Validates the user by calling the login and handling exceptions
@@ -144,38 +213,107 @@ def validate_hotp_secret(user, otp_secret):
     return True
 
 
-def download(zip_basename, submissions):
-    """Send client contents of ZIP-file *zip_basename*-<timestamp>.zip
-    containing *submissions*. The ZIP-file, being a
-    :class:`tempfile.NamedTemporaryFile`, is stored on disk only
-    temporarily.
+def download(zip_basename, submissions, filesystem_id=None):
+    """Prepare a ZIP-file *zip_basename*-<timestamp>.zip containing
+    *submissions* and redirect the client to it. Its URL stays valid for
+    `BULK_ARCHIVE_TTL_MINUTES` so that an interrupted download can be
+    resumed.
+
+    Archives are named after their content, so that identical selections
+    share one build. Selections smaller than `BULK_ARCHIVE_ASYNC_THRESHOLD`
+    bytes are built right away; larger ones are built by the worker, and
+    their URL shows a progress page until the archive is ready.
 
     :param str zip_basename: The basename of the ZIP-file download.
 
     :param list submissions: A list of :class:`models.Submission`s to
                              include in the ZIP-file.
+
+    :param str filesystem_id: The source whose collection the client is
+                              sent back to if the build fails, rather than
+                              the index.
     """
-    zf = current_app.storage.get_bulk_archive(submissions,
-                                              zip_directory=zip_basename)
+    config = current_app.sdconfig
+    entries = [store.bulk_archive_entry(s) for s in submissions]
+    archive = store.bulk_archive_name(entries, zip_directory=zip_basename)
     attachment_filename = "{}--{}.zip".format(
         zip_basename, datetime.utcnow().strftime("%Y-%m-%d--%H-%M-%S"))
 
+    if not _reuse_bulk_archive(archive):
+        max_age = 60 * getattr(config, 'BULK_ARCHIVE_TTL_MINUTES', 60)
+        threshold = getattr(config, 'BULK_ARCHIVE_ASYNC_THRESHOLD',
+                            10 * 1024 * 1024)
+        if sum(s.size or 0 for s in submissions) < threshold:
+            current_app.storage.remove_expired_bulk_archives(max_age)
+            current_app.storage.build_bulk_archive(archive, entries,
+                                                   zip_basename)
+        else:
+            worker.enqueue(store.build_bulk_archive,
+                           config.STORE_DIR, config.TEMP_DIR, archive,
+                           entries, zip_basename, max_age,
+                           job_id=archive,
+                           description='bulk archive for {} submissions'
+                                       .format(len(entries)))
+
     # Mark the submissions that have been downloaded as such
     for submission in submissions:
         submission.downloaded = True
     db.session.commit()
 
-    return send_file(zf.name, mimetype="application/zip",
+    return redirect(url_for('col.download_archive',
+                            archive=archive,
+                            filename=attachment_filename,
+                            filesystem_id=filesystem_id))
+
+
+def _reuse_bulk_archive(archive):
+    """Return True if the bulk archive `archive` is already built, in which
+    case its lifetime is extended, or is being built by the worker."""
+    path = current_app.storage.bulk_archive_path(archive)
+    try:
+        os.utime(path, None)
+        return True
+    except OSError:
+        pass
+    job = worker.fetch_job(archive)
+    return job is not None and job.get_status() in ('queued', 'started')
+
+
+def send_resumable_file(path, mimetype, attachment_filename=None):
+    """Like :func:`flask.send_file`, but with a strong ETag and support for
+    If-None-Match and byte ranges, so that an interrupted download can be
+    resumed instead of restarted from zero.
+
+    The ETag is derived from the file's name, size and inode rather than its
+    mtime, which `normalize_timestamps` changes whenever the source submits
+    something new, while the content of a stored file never changes.
+
+    When `USE_X_SENDFILE` is set, Apache serves the body and handles Range
+    and If-Range itself, based on the headers set here.
+    """
+    stat = os.stat(path)
+    etag = hashlib.sha256('{}-{}-{}'.format(os.path.basename(path),
+                                            stat.st_size,
+                                            stat.st_ino)).hexdigest()
+    resp = send_file(path, mimetype=mimetype,
+                     as_attachment=attachment_filename is not None,
                      attachment_filename=attachment_filename,
-                     as_attachment=True)
+                     add_etags=False)
+    resp.set_etag(etag)
+    resp.headers['Accept-Ranges'] = 'bytes'
+    if current_app.use_x_sendfile:
+        resp = resp.make_conditional(request)
+        if resp.status_code == 304:
+            # some servers ignore the 304 status code for X-Sendfile
+            resp.headers.pop('X-Sendfile', None)
+    else:
+        resp = resp.make_conditional(request, accept_ranges=True,
+                                     complete_length=stat.st_size)
+    return resp
 
 
 def bulk_delete(filesystem_id, items_selected):
-    for item in items_selected:
-        item_path = current_app.storage.path(filesystem_id, item.filename)
-        worker.enqueue(srm, item_path)
-        db.session.delete(item)
-    db.session.commit()
+    deletion.delete_items(filesystem_id, items_selected)
 
     flash(ngettext("Submission deleted.",
                    "{num} submissions deleted.".format(
@@ -230,8 +368,7 @@ def col_delete(cols_selected):
     if len(cols_selected) < 1:
         flash(gettext("No collections selected for deletion."), "error")
     else:
-        for filesystem_id in cols_selected:
-            delete_collection(filesystem_id)
+        delete_collections(cols_selected)
         num = len(cols_selected)
         flash(ngettext('{num} collection deleted', '{num} collections deleted',
                        num).format(num=num),
@@ -254,17 +391,39 @@ def make_password(config):
 
 
 def delete_collection(filesystem_id):
-    # Delete the source's collection of submissions
-    job = worker.enqueue(srm, current_app.storage.path(filesystem_id))
+    return delete_collections([filesystem_id])
+
+
+def delete_collections(filesystem_ids):
+    """Delete the collections of all of `filesystem_ids` at once: their
+    database rows are removed in one transaction, their reply keypairs in
+    one keyring operation, and their directories are handed to a single
+    deletion job, which is returned."""
+    filesystem_ids = list(OrderedDict.fromkeys(filesystem_ids))
+    source_ids = [source_id for (source_id,) in
+                  db.session.query(Source.id).filter(
+                      Source.filesystem_id.in_(filesystem_ids))]
+    if len(source_ids) != len(filesystem_ids):
+        current_app.logger.error(
+            "Found {} sources when {} were expected".format(
+                len(source_ids), len(filesystem_ids)))
+        abort(404)
+
+    # Delete their entries in the db. 'fetch' detaches any of these rows
+    # already loaded in the session instead of leaving them to be expired.
+    for model in (SourceStar, Submission, Reply):
+        model.query.filter(model.source_id.in_(source_ids)) \
+                   .delete(synchronize_session='fetch')
+    Source.query.filter(Source.id.in_(source_ids)) \
+                .delete(synchronize_session='fetch')
+    Change.record_source_deletions(db.session, filesystem_ids)
+    db.session.commit()
 
-    # Delete the source's reply keypair
-    current_app.crypto_util.delete_reply_keypair(filesystem_id)
+    # Delete the sources' reply keypairs
+    current_app.crypto_util.delete_reply_keypairs(filesystem_ids)
 
-    # Delete their entry in the db
-    source = get_source(filesystem_id)
-    db.session.delete(source)
-    db.session.commit()
-    return job
+    # Delete the sources' collections of submissions
+    return deletion.delete_source_directories(filesystem_ids)
 
 
 def set_diceware_password(user, password):
@@ -294,15 +453,21 @@ def set_diceware_password(user, password):
         'success')
 
 
+def _submissions_of(cols_selected, *criteria):
+    """Return the submissions of the sources `cols_selected` matching
+    `criteria`, along with their sources, in one query."""
+    return Submission.query.join(Submission.source) \
+                           .options(contains_eager(Submission.source)) \
+                           .filter(Source.filesystem_id.in_(cols_selected),
+                                   *criteria) \
+                           .order_by(Submission.source_id, Submission.id) \
+                           .all()
+
+
 def col_download_unread(cols_selected):
     """Download all unread submissions from all selected sources."""
-    submissions = []
-    for filesystem_id in cols_selected:
-        id = Source.query.filter(Source.filesystem_id == filesystem_id) \
-                   .one().id
-        submissions += Submission.query.filter(
-            Submission.downloaded == false(),
-            Submission.source_id == id).all()
+    submissions = _submissions_of(cols_selected,
+                                  Submission.downloaded == false())
     if submissions == []:
         flash(gettext("No unread submissions in selected collections."),
               "error")
@@ -312,10 +477,4 @@ def col_download_unread(cols_selected):
 
 def col_download_all(cols_selected):
     """Download all submissions from all selected sources."""
-    submissions = []
-    for filesystem_id in cols_selected:
-        id = Source.query.filter(Source.filesystem_id == filesystem_id) \
-                   .one().id
-        submissions += Submission.query.filter(
-            Submission.source_id == id).all()
-    return download("all", submissions)
+    return download("all", _submissions_of(cols_selected))
@@ -0,0 +1,558 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Replay concurrent source and journalist sessions against both apps, in
+process, and report the latency of each step.
+
+    ./load_test.py --users 20 --duration 300
+    ./load_test.py --users 50 --think-time 0 --mix journalist=1 -o run.json
+
+`--users` virtual users run concurrently, in threads, each with a client of
+its own. Each of them repeatedly picks one of the FLOWS below, according to
+the weights of `--mix`, and plays it, waiting a `--think-time` between its
+steps:
+
+- `new_source`: generate a codename, create the source, submit a message
+  and, with `--file-ratio`, a document, and check for replies;
+- `returning_source`: log in with the codename of a source of the
+  synthetic dataset described by `--manifest` (see synthetic_data.py), or
+  of one created by `new_source`, submit, and check for replies;
+- `journalist`: log in, list the sources, open one of them, download one
+  of its submissions, reply with `--reply-ratio` if the source has a key,
+  and delete the submission with `--delete-ratio`.
+
+The latency of every request, its p50, p95 and p99, and the throughput of
+each step are reported at the end of the run, and written to `--output` as
+JSON.
+
+The journalists log in as `load-test-N` accounts, created or reset for the
+run, with HOTP tokens. Login throttling only allows five logins a minute,
+across all the journalists, so it is turned off for the run. With the
+default `--redis local`, the notifications go through an in-process
+stand-in for Redis, and the jobs of the worker are run by threads of this
+process, one queue at a time (see worker.LocalQueue), so that no Redis
+server is needed.
+
+Only ever run this against a development or test data root.
+"""
+import argparse
+import collections
+import io
+import json
+import logging
+import os
+import Queue
+import random
+import re
+import threading
+import time
+
+from contextlib import contextmanager
+
+import models
+import notifications
+import worker
+
+from db import db
+from models import Journalist
+from synthetic_data import Distribution
+
+log = logging.getLogger(__name__)
+
+FLOWS = ('new_source', 'returning_source', 'journalist')
+
+_CSRF_TOKEN = re.compile(r'name="csrf_token"[^>]*value="([^"]*)"')
+_CODENAME = re.compile(r'<p id="codename" class="codename">([^<]+)</p>')
+_SOURCE_LINK = re.compile(r'href="/col/([^/"]+)"')
+_SUBMISSION_LINK = re.compile(r'href="(/col/[^/"]+/([^/"]+))"')
+
+
+class LocalRedis(object):
+    """A stand-in for the Redis pub/sub of `notifications`."""
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__subscribers = collections.defaultdict(list)
+
+    def ping(self):
+        return True
+
+    def publish(self, channel, message):
+        with self.__lock:
+            subscribers = list(self.__subscribers[channel])
+        for messages in subscribers:
+            messages.put({'type': 'message', 'channel': channel,
+                          'data': message})
+        return len(subscribers)
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return _LocalPubSub(self)
+
+    def _subscribe(self, channel, messages):
+        with self.__lock:
+            self.__subscribers[channel].append(messages)
+
+    def _unsubscribe(self, messages):
+        with self.__lock:
+            for subscribers in self.__subscribers.values():
+                if messages in subscribers:
+                    subscribers.remove(messages)
+
+
+class _LocalPubSub(object):
+
+    def __init__(self, redis):
+        self.__redis = redis
+        self.__messages = Queue.Queue()
+
+    def subscribe(self, channel):
+        self.__redis._subscribe(channel, self.__messages)
+
+    def get_message(self, timeout=0):
+        try:
+            return self.__messages.get(timeout=max(timeout, 0.001))
+        except Queue.Empty:
+            return None
+
+    def close(self):
+        self.__redis._unsubscribe(self.__messages)
+
+
+@contextmanager
+def local_redis():
+    """Send the notifications through an in-process stand-in for Redis, and
+    run the jobs of the worker in a thread of this process, while in the
+    `with` block, and yield the job queue."""
+    queue = worker.LocalQueue()
+    saved_redis = notifications.set_redis(LocalRedis())
+    saved_queue = worker.set_queue(queue)
+    try:
+        yield queue
+    finally:
+        queue.join()
+        notifications.set_redis(saved_redis)
+        worker.set_queue(saved_queue)
+
+
+class Recorder(object):
+    """The latencies of the steps, and the outcomes of the flows, of all the
+    virtual users."""
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.latencies = collections.defaultdict(list)
+        self.errors = collections.Counter()
+        self.flows = collections.Counter()
+        self.failed_flows = collections.Counter()
+
+    def step(self, step, seconds, ok):
+        with self.__lock:
+            self.latencies[step].append(seconds)
+            if not ok:
+                self.errors[step] += 1
+
+    def flow(self, flow, ok):
+        with self.__lock:
+            self.flows[flow] += 1
+            if not ok:
+                self.failed_flows[flow] += 1
+
+    def report(self, seconds):
+        steps = {}
+        for step, latencies in self.latencies.items():
+            latencies = sorted(latencies)
+            steps[step] = {
+                'count': len(latencies),
+                'errors': self.errors[step],
+                'throughput': len(latencies) / seconds,
+                'p50': percentile(latencies, 50),
+                'p95': percentile(latencies, 95),
+                'p99': percentile(latencies, 99),
+                'max': latencies[-1],
+            }
+        return {'seconds': seconds,
+                'flows': dict((flow, {'count': count,
+                                      'failed': self.failed_flows[flow]})
+                              for flow, count in self.flows.items()),
+                'steps': steps}
+
+
+def percentile(values, p):
+    """Return the `p`th percentile of the sorted `values`, by the nearest
+    rank method."""
+    rank = max(int(-(-len(values) * p // 100)), 1)
+    return values[rank - 1]
+
+
+class _StepFailed(Exception):
+    pass
+
+
+class _Account(object):
+    """A load-test journalist, and the HOTP counter of its next login."""
+
+    def __init__(self, journalist, password):
+        self.username = journalist.username
+        self.password = password
+        self.hotp = journalist.hotp
+        self.counter = 0
+
+    def next_token(self):
+        self.counter += 1
+        return self.hotp.at(self.counter - 1)
+
+
+def _journalist_accounts(app, count):
+    """Create, or reset, `count` load-test journalists, and return their
+    accounts."""
+    accounts = []
+    with app.app_context():
+        for n in range(1, count + 1):
+            username = 'load-test-{}'.format(n)
+            password = app.crypto_util.genrandomid()
+            otp_secret = os.urandom(20).encode('hex')
+            journalist = Journalist.query.filter_by(username=username).first()
+            if journalist is None:
+                journalist = Journalist(username, password,
+                                        otp_secret=otp_secret)
+                db.session.add(journalist)
+            else:
+                journalist.set_password(password)
+                journalist.set_hotp_secret(otp_secret)
+            db.session.commit()
+            accounts.append(_Account(journalist, password))
+    return accounts
+
+
+class _Shared(object):
+    """What the virtual users share: the codenames of the sources that can
+    log in, the journalist accounts not in use, and the flows left."""
+
+    def __init__(self, codenames, accounts, flows):
+        self.lock = threading.Lock()
+        self.codenames = list(codenames)
+        self.accounts = Queue.Queue()
+        for account in accounts:
+            self.accounts.put(account)
+        self.flows_left = flows
+
+    def take_flow(self):
+        with self.lock:
+            if self.flows_left is None:
+                return True
+            if self.flows_left <= 0:
+                return False
+            self.flows_left -= 1
+            return True
+
+
+class VirtualUser(object):
+
+    def __init__(self, source_app, journalist_app, recorder, shared,
+                 parameters, seed):
+        self.source_client = source_app.test_client()
+        self.journalist_client = journalist_app.test_client()
+        self.recorder = recorder
+        self.shared = shared
+        self.parameters = parameters
+        self.rng = random.Random(seed)
+
+    def run(self, deadline):
+        flows = sorted(self.parameters['mix'].items())
+        weights = [weight for _, weight in flows]
+        while time.time() < deadline and self.shared.take_flow():
+            flow = _choose([name for name, _ in flows], weights, self.rng)
+            try:
+                getattr(self, flow)()
+            except _StepFailed:
+                self.recorder.flow(flow, False)
+            else:
+                self.recorder.flow(flow, True)
+
+    def think(self):
+        seconds = self.parameters['think_time'].sample(self.rng) / 1000.0
+        if seconds:
+            time.sleep(seconds)
+
+    def request(self, client, step, url, method='GET', expect=200, **kw):
+        self.think()
+        start = time.time()
+        try:
+            response = client.open(url, method=method, **kw)
+            body = response.get_data()
+            response.close()
+            ok = response.status_code == expect
+        except Exception:
+            log.exception('%s failed', step)
+            ok = False
+        self.recorder.step(step, time.time() - start, ok)
+        if not ok:
+            raise _StepFailed(step)
+        return body
+
+    def new_source(self):
+        client = self.source_client
+        self.request(client, 'source.index', '/')
+        page = self.request(client, 'source.generate', '/generate')
+        codename = _CODENAME.search(page).group(1)
+        self.request(client, 'source.create', '/create', 'POST', 302,
+                     data={'csrf_token': _csrf_token(page)})
+        page = self.request(client, 'source.lookup', '/lookup')
+        self.submit(page)
+        self.request(client, 'source.lookup', '/lookup')
+        self.request(client, 'source.logout', '/logout', expect=302)
+        with self.shared.lock:
+            self.shared.codenames.append(codename)
+
+    def returning_source(self):
+        with self.shared.lock:
+            codename = (self.rng.choice(self.shared.codenames)
+                        if self.shared.codenames else None)
+        if codename is None:
+            return self.new_source()
+        client = self.source_client
+        page = self.request(client, 'source.login_page', '/login')
+        self.request(client, 'source.login', '/login', 'POST', 302,
+                     data={'codename': codename,
+                           'csrf_token': _csrf_token(page)})
+        page = self.request(client, 'source.lookup', '/lookup')
+        self.submit(page)
+        self.request(client, 'source.lookup', '/lookup')
+        self.request(client, 'source.logout', '/logout', expect=302)
+
+    def submit(self, lookup_page):
+        parameters = self.parameters
+        message = _text(parameters['message_size'].sample(self.rng))
+        if self.rng.random() < parameters['file_ratio']:
+            document = (io.BytesIO(os.urandom(
+                parameters['file_size'].sample(self.rng))), 'document.bin')
+        else:
+            document = (io.BytesIO(b''), '')
+        self.request(self.source_client, 'source.submit', '/submit', 'POST',
+                     302, data={'msg': message, 'fh': document,
+                                'csrf_token': _csrf_token(lookup_page)})
+
+    def journalist(self):
+        account = self.shared.accounts.get()
+        try:
+            self.journalist_session(account)
+        finally:
+            self.shared.accounts.put(account)
+
+    def journalist_session(self, account):
+        client = self.journalist_client
+        page = self.request(client, 'journalist.login_page', '/login')
+        self.request(client, 'journalist.login', '/login', 'POST', 302,
+                     data={'username': account.username,
+                           'password': account.password,
+                           'token': account.next_token(),
+                           'csrf_token': _csrf_token(page)})
+        page = self.request(client, 'journalist.index', '/')
+        filesystem_ids = _SOURCE_LINK.findall(page)
+        if filesystem_ids:
+            filesystem_id = self.rng.choice(filesystem_ids)
+            page = self.request(client, 'journalist.col',
+                                '/col/' + filesystem_id)
+            submissions = _SUBMISSION_LINK.findall(page)
+            submission = (self.rng.choice(submissions)
+                          if submissions else None)
+            if submission:
+                self.request(client, 'journalist.download', submission[0])
+            if ('id="reply-text-field"' in page and
+                    self.rng.random() < self.parameters['reply_ratio']):
+                self.request(
+                    client, 'journalist.reply', '/reply', 'POST', 302,
+                    data={'filesystem_id': filesystem_id,
+                          'message': _text(self.parameters[
+                              'message_size'].sample(self.rng)),
+                          'csrf_token': _csrf_token(page)})
+            if (submission and
+                    self.rng.random() < self.parameters['delete_ratio']):
+                self.request(client, 'journalist.delete', '/bulk', 'POST',
+                             302, data={'filesystem_id': filesystem_id,
+                                        'action': 'delete',
+                                        'doc_names_selected': submission[1],
+                                        'csrf_token': _csrf_token(page)})
+        self.request(client, 'journalist.logout', '/logout', expect=302)
+
+
+def _choose(names, weights, rng):
+    point = rng.uniform(0, sum(weights))
+    for name, weight in zip(names, weights):
+        point -= weight
+        if point <= 0:
+            return name
+    return names[-1]
+
+
+def _csrf_token(page):
+    match = _CSRF_TOKEN.search(page)
+    return match.group(1) if match else ''
+
+
+def _text(size):
+    return os.urandom(size).encode('base64').replace('\n', '')[:size] or 'x'
+
+
+def run(config, users=10, duration=60, flows=None, mix=None,
+        think_time='1000-5000', message_size='lognormal:1024:1',
+        file_size='lognormal:1048576:1.5', file_ratio=0.3, reply_ratio=0.5,
+        delete_ratio=0.3, codenames=(), redis='local', seed=None):
+    """Run `users` virtual users against apps created from `config` for
+    `duration` seconds, or until `flows` flows have been played, and return
+    the report, see the module docstring."""
+    import journalist_app
+    import source_app
+
+    mix = mix or {'new_source': 1, 'returning_source': 3, 'journalist': 1}
+    parameters = {
+        'mix': mix,
+        'think_time': Distribution(str(think_time)),
+        'message_size': Distribution(str(message_size)),
+        'file_size': Distribution(str(file_size)),
+        'file_ratio': file_ratio,
+        'reply_ratio': reply_ratio,
+        'delete_ratio': delete_ratio,
+    }
+    if seed is None:
+        seed = random.SystemRandom().randint(0, 2 ** 32)
+    sources = source_app.create_app(config)
+    journalists = journalist_app.create_app(config)
+    accounts = []
+    if mix.get('journalist'):
+        accounts = _journalist_accounts(journalists, users)
+    recorder = Recorder()
+    shared = _Shared(codenames, accounts, flows)
+    virtual_users = [VirtualUser(sources, journalists, recorder, shared,
+                                 parameters, seed * 1000003 + n)
+                     for n in range(users)]
+
+    hardening = models.LOGIN_HARDENING
+    models.LOGIN_HARDENING = False
+    try:
+        with (local_redis() if redis == 'local' else _nothing()):
+            start = time.time()
+            deadline = start + duration if duration else float('inf')
+            threads = [threading.Thread(target=user.run, args=(deadline,))
+                       for user in virtual_users]
+            for thread in threads:
+                thread.daemon = True
+                thread.start()
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(1)
+            seconds = time.time() - start
+    finally:
+        models.LOGIN_HARDENING = hardening
+
+    result = recorder.report(seconds)
+    result['parameters'] = dict(
+        ((name, repr(value) if isinstance(value, Distribution) else value)
+         for name, value in parameters.items()),
+        users=users, duration=duration, redis=redis, seed=seed)
+    return result
+
+
+@contextmanager
+def _nothing():
+    yield
+
+
+def format_report(result):
+    lines = ['{:<26} {:>7} {:>6} {:>8} {:>8} {:>8} {:>8} {:>8}'.format(
+        'step', 'count', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms',
+        'max ms')]
+    for step, stats in sorted(result['steps'].items()):
+        lines.append(
+            '{:<26} {count:>7} {errors:>6} {throughput:>8.2f} '
+            '{p50:>8.1f} {p95:>8.1f} {p99:>8.1f} {max:>8.1f}'.format(
+                step, count=stats['count'], errors=stats['errors'],
+                throughput=stats['throughput'],
+                **dict((key, stats[key] * 1000)
+                       for key in ('p50', 'p95', 'p99', 'max'))))
+    for flow, stats in sorted(result['flows'].items()):
+        lines.append('{}: {} flows, {} failed, {:.2f}/s'.format(
+            flow, stats['count'], stats['failed'],
+            stats['count'] / result['seconds']))
+    return '\n'.join(lines)
+
+
+def _mix(value):
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name not in FLOWS:
+            raise argparse.ArgumentTypeError(
+                'unknown flow {}, not one of {}'.format(name,
+                                                        ', '.join(FLOWS)))
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def _run_from_commandline():  # pragma: no cover
+    from sdconfig import config
+    from synthetic_data import _ratio
+
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s')
+    log.setLevel(logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--users', type=int, default=10,
+                        help='concurrent virtual users (default: '
+                        '%(default)s)')
+    parser.add_argument('--duration', type=float, default=60,
+                        help='seconds (default: %(default)s)')
+    parser.add_argument('--flows', type=int,
+                        help='stop after that many flows')
+    parser.add_argument('--mix', type=_mix,
+                        default='new_source=1,returning_source=3,'
+                        'journalist=1',
+                        help='weights of the flows (default: %(default)s)')
+    parser.add_argument('--think-time', type=Distribution,
+                        default='1000-5000',
+                        help='milliseconds between steps: N, MIN-MAX or '
+                        'lognormal:MEDIAN:SIGMA (default: %(default)s)')
+    parser.add_argument('--message-size', type=Distribution,
+                        default='lognormal:1024:1',
+                        help='bytes per message and reply (default: '
+                        '%(default)s)')
+    parser.add_argument('--file-size', type=Distribution,
+                        default='lognormal:1048576:1.5',
+                        help='bytes per document (default: %(default)s)')
+    parser.add_argument('--file-ratio', type=_ratio, default=0.3,
+                        help='share of the submissions with a document '
+                        '(default: %(default)s)')
+    parser.add_argument('--reply-ratio', type=_ratio, default=0.5)
+    parser.add_argument('--delete-ratio', type=_ratio, default=0.3)
+    parser.add_argument('--manifest',
+                        default=os.path.join(config.SECUREDROP_DATA_ROOT,
+                                             'synthetic-data.json'),
+                        help='log in as the sources of this synthetic '
+                        'dataset')
+    parser.add_argument('--redis', choices=('local', 'server'),
+                        default='local',
+                        help='use an in-process stand-in for Redis, or the '
+                        'Redis server (default: %(default)s)')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('-o', '--output', help='write the report as JSON')
+    args = parser.parse_args()
+
+    codenames = []
+    if os.path.exists(args.manifest):
+        with open(args.manifest) as f:
+            codenames = [source['codename']
+                         for source in json.load(f)['sources']]
+        log.info('%d sources in %s', len(codenames), args.manifest)
+
+    result = run(config, users=args.users, duration=args.duration,
+                 flows=args.flows, mix=args.mix, think_time=args.think_time,
+                 message_size=args.message_size, file_size=args.file_size,
+                 file_ratio=args.file_ratio, reply_ratio=args.reply_ratio,
+                 delete_ratio=args.delete_ratio, codenames=codenames,
+                 redis=args.redis, seed=args.seed)
+    print(format_report(result))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=1, sort_keys=True)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    _run_from_commandline()
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""The periodic maintenance of an instance, run as jobs by the worker:
+
+- `clean_tmp` removes the temporary files older than TEMP_FILE_MAX_AGE_DAYS;
+- `prune_login_attempts` deletes the journalists' login attempts older than
+  LOGIN_ATTEMPT_MAX_AGE_DAYS, which are only kept to throttle logins;
+- `prune_changes` purges the tombstones of the change journal, which say
+  what was deleted, once they have been served for one interval;
+- `incremental_vacuum` gives the free pages of the database back to the
+  file system, a few at a time for at most VACUUM_TIME_BUDGET seconds, so
+  that it never holds the database for long;
+- `analyze` refreshes the statistics SQLite plans its queries with.
+
+rq cannot schedule jobs, so cron runs `manage.py maintenance` every few
+minutes, which queues on the bulk queue the tasks which have not been run
+for their interval (see DEFAULT_INTERVALS and MAINTENANCE_INTERVALS). The
+start, duration and outcome of the last run of each task are kept in
+MAINTENANCE_DIR, for `manage.py maintenance --status` and the admin
+interface to show them.
+
+This only imports the standard library and the job queue, so that cron can
+run it without loading the web stack.
+"""
+import collections
+import errno
+import json
+import logging
+import os
+import sqlite3
+import stat
+import tempfile
+import time
+
+from datetime import datetime, timedelta
+
+import worker
+
+log = logging.getLogger(__name__)
+
+# Seconds between two runs of each task, by default: 0 never runs it
+DEFAULT_INTERVALS = {
+    'clean_tmp': 24 * 60 * 60,
+    'prune_login_attempts': 60 * 60,
+    'prune_changes': 24 * 60 * 60,
+    'incremental_vacuum': 60 * 60,
+    'analyze': 24 * 60 * 60,
+}
+
+# sqlite's values of PRAGMA auto_vacuum
+_AUTO_VACUUM_NONE, _AUTO_VACUUM_FULL, _AUTO_VACUUM_INCREMENTAL = range(3)
+
+# How long a task waits for the web processes to release the database
+_BUSY_TIMEOUT = 30
+
+# Pause between two incremental vacuum steps, to let the writers in
+_VACUUM_PAUSE = 0.1
+
+
+def remove_old_files(directory, max_age):
+    """Remove the files directly in `directory` which have not been modified
+    for `max_age` seconds, without following symbolic links, and return the
+    lists of the paths removed and kept.
+
+    Each file is only stat'ed once; files which disappear meanwhile, e.g.
+    bulk archives being replaced, are ignored."""
+    removed, kept = [], []
+    threshold = time.time() - max_age
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            st = os.lstat(path)
+            if stat.S_ISDIR(st.st_mode):
+                continue
+            if st.st_mtime < threshold:
+                os.remove(path)
+                removed.append(path)
+            else:
+                kept.append(path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+    return removed, kept
+
+
+def clean_tmp(config):
+    days = getattr(config, 'TEMP_FILE_MAX_AGE_DAYS', 7)
+    if not os.path.exists(config.TEMP_DIR):
+        return {'removed': 0, 'kept': 0}
+    removed, kept = remove_old_files(config.TEMP_DIR, days * 24 * 60 * 60)
+    return {'removed': len(removed), 'kept': len(kept)}
+
+
+def prune_login_attempts(config):
+    days = getattr(config, 'LOGIN_ATTEMPT_MAX_AGE_DAYS', 7)
+    threshold = datetime.utcnow() - timedelta(days=days)
+    with _connect(config) as connection:
+        # the timestamps are stored as text by SQLAlchemy, in this format
+        cursor = connection.execute(
+            'DELETE FROM journalist_login_attempt WHERE timestamp < ?',
+            (threshold.strftime('%Y-%m-%d %H:%M:%S.%f'),))
+        return {'deleted': cursor.rowcount}
+
+
+def prune_changes(config):
+    """Delete the deletion entries of the change journal (see
+    :class:`models.Change`) recorded before the previous run of this task,
+    so that they are kept for one to two of its intervals, and return the
+    cursor up to which they are purged: API clients which have not caught
+    up with it may have missed deletions."""
+    last = status(config).get('prune_changes')
+    purged = 0
+    if last and last['status'] == 'finished':
+        purged = last['result'].get('cursor', 0)
+    with _connect(config) as connection:
+        cursor = connection.execute(
+            "DELETE FROM changes WHERE action = 'delete' AND id <= ?",
+            (purged,))
+        deleted = cursor.rowcount
+        # the last id ever given, even if that change was purged since
+        row = connection.execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'changes'"
+        ).fetchone()
+    return {'deleted': deleted, 'purged': purged,
+            'cursor': row[0] if row else 0}
+
+
+def incremental_vacuum(config):
+    """Free the pages on the freelist of the database, VACUUM_PAGES_PER_STEP
+    at a time, for at most VACUUM_TIME_BUDGET seconds.
+
+    A database created with `auto_vacuum = FULL`, as `manage.py init-db`
+    used to, is switched to INCREMENTAL, which no longer rewrites pages on
+    every commit which deletes rows. The freed pages hold no deleted data in
+    the meantime, as every connection to the database, of the apps as of
+    these tasks, turns `secure_delete` on: without it, FULL is kept."""
+    pages = getattr(config, 'VACUUM_PAGES_PER_STEP', 100)
+    budget = getattr(config, 'VACUUM_TIME_BUDGET', 5)
+    with _connect(config) as connection:
+        mode = connection.execute('PRAGMA auto_vacuum').fetchone()[0]
+        if mode == _AUTO_VACUUM_NONE:
+            # only a full VACUUM, which may lock the database for long,
+            # could turn it on
+            log.warning('the database cannot be vacuumed incrementally: '
+                        'it has auto_vacuum turned off')
+            return {'freed': 0, 'free': _freelist_count(connection)}
+        if mode == _AUTO_VACUUM_FULL:
+            if connection.execute('PRAGMA secure_delete').fetchone() != (1,):
+                log.warning('the database is left with auto_vacuum FULL: '
+                            'secure_delete cannot be turned on')
+                return {'freed': 0, 'free': _freelist_count(connection)}
+            connection.execute('PRAGMA auto_vacuum = INCREMENTAL')
+
+        free = initial = _freelist_count(connection)
+        deadline = time.time() + budget
+        while free and time.time() < deadline:
+            # the pages are freed as the rows of the statement are fetched
+            connection.execute(
+                'PRAGMA incremental_vacuum({:d})'.format(pages)).fetchall()
+            free = _freelist_count(connection)
+            time.sleep(_VACUUM_PAUSE)
+        return {'freed': initial - free, 'free': free}
+
+
+def analyze(config):
+    with _connect(config) as connection:
+        connection.execute('ANALYZE')
+    return {}
+
+
+TASKS = collections.OrderedDict(
+    (task.__name__, task)
+    for task in (clean_tmp, prune_login_attempts, prune_changes,
+                 incremental_vacuum, analyze))
+
+
+class _connect(object):
+    """Context manager of an autocommit connection to the database, which
+    overwrites what it deletes, as the apps' connections do."""
+
+    def __init__(self, config):
+        self.__connection = sqlite3.connect(config.DATABASE_FILE,
+                                            timeout=_BUSY_TIMEOUT,
+                                            isolation_level=None)
+        self.__connection.execute('PRAGMA secure_delete = ON')
+
+    def __enter__(self):
+        return self.__connection
+
+    def __exit__(self, *exc_info):
+        self.__connection.close()
+
+
+def _freelist_count(connection):
+    return connection.execute('PRAGMA freelist_count').fetchone()[0]
+
+
+def run(name, config=None):
+    """Worker job: run the task `name`, and record its duration and outcome.
+    Returns the statistics of the task, e.g. the number of files removed,
+    with its duration in seconds."""
+    if config is None:
+        from sdconfig import config
+    started_at = datetime.utcnow()
+    start = time.time()
+    try:
+        result = TASKS[name](config)
+    except Exception as e:
+        _record(config, name, started_at, time.time() - start, 'failed',
+                {'error': str(e)})
+        raise
+    result['seconds'] = time.time() - start
+    log.info('maintenance task %s took %.3fs: %s', name, result['seconds'],
+             ', '.join('{} {}'.format(*item)
+                       for item in sorted(result.items())))
+    _record(config, name, started_at, result['seconds'], 'finished', result)
+    job = worker.get_current_job()
+    if job is not None:
+        job.meta['maintenance'] = result
+        job.save_meta()
+    return result
+
+
+def intervals(config):
+    """Return the seconds between two runs of each task."""
+    return dict(DEFAULT_INTERVALS,
+                **getattr(config, 'MAINTENANCE_INTERVALS', {}))
+
+
+def schedule(config, now=None):
+    """Queue the tasks which have not been run for their interval, and are
+    neither queued nor running yet, and return their jobs."""
+    now = now or datetime.utcnow()
+    task_intervals = intervals(config)
+    runs = status(config)
+    jobs = []
+    for name in TASKS:
+        if not task_intervals[name]:
+            continue
+        last = runs.get(name)
+        if last and now - last['started_at'] < timedelta(
+                seconds=task_intervals[name]):
+            continue
+        job_id = 'maintenance-' + name
+        job = worker.fetch_job(job_id)
+        if job is not None and job.get_status() in ('queued', 'started'):
+            continue
+        jobs.append(worker.enqueue(run, name, job_id=job_id,
+                                   description='maintenance: ' + name))
+    return jobs
+
+
+def status(config):
+    """Return the last run of each task which has been run, as dicts of its
+    `started_at` datetime, its duration in `seconds`, its `status`,
+    'finished' or 'failed', and its `result`."""
+    runs = {}
+    for name in TASKS:
+        try:
+            with open(_record_path(config, name)) as f:
+                run = json.load(f)
+        except (IOError, ValueError):
+            continue
+        run['started_at'] = datetime.strptime(run['started_at'],
+                                              '%Y-%m-%dT%H:%M:%S.%f')
+        runs[name] = run
+    return runs
+
+
+def _record_path(config, name):
+    return os.path.join(_directory(config), name + '.json')
+
+
+def _directory(config):
+    return getattr(config, 'MAINTENANCE_DIR', os.path.join(
+        config.SECUREDROP_DATA_ROOT, 'maintenance'))
+
+
+def _record(config, name, started_at, seconds, status, result):
+    directory = _directory(config)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    # written under a temporary name and renamed into place, so that it is
+    # never read half-written
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as f:
+        json.dump({'started_at': started_at.strftime('%Y-%m-%dT%H:%M:%S.%f'),
+                   'seconds': seconds,
+                   'status': status,
+                   'result': result}, f)
+    os.rename(f.name, _record_path(config, name))
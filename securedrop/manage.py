@@ -6,25 +6,22 @@ import codecs
 import logging
 import os
 import pwd
-import qrcode
 import shutil
 import signal
 import sys
-import time
 import traceback
 
-from flask import current_app
-from sqlalchemy import text
-from sqlalchemy.orm.exc import NoResultFound
-
 os.environ['SECUREDROP_ENV'] = 'dev'  # noqa
-from sdconfig import config
-import journalist_app
+import maintenance
+import worker
 
-from db import db
-from models import Journalist, PasswordError, InvalidUsernameException
+from sdconfig import config
 from management.run import run
 
+# The journalist app, the models and the rest of the web stack take most of
+# a second to import, so they are imported by the subcommands that use them
+# rather than here: maintenance, which cron runs, never needs them.
+
 logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s')
 log = logging.getLogger(__name__)
 
@@ -45,6 +42,8 @@ def reset(args):
     except OSError:
         pass
 
+    from db import db
+
     # Regenerate the database
     with app_context():
         db.create_all()
@@ -74,6 +73,8 @@ def add_journalist(args):
 
 
 def _get_username():
+    from models import Journalist, InvalidUsernameException
+
     while True:
         username = raw_input('Username: ')
         try:
@@ -98,6 +99,9 @@ def _get_yubikey_usage():
 
 
 def _make_password():
+    from flask import current_app
+    from models import Journalist, PasswordError
+
     while True:
         password = current_app.crypto_util.genrandomid(7)
         try:
@@ -108,6 +112,10 @@ def _make_password():
 
 
 def _add_user(is_admin=False):
+    import qrcode
+    from db import db
+    from models import Journalist
+
     context = app_context()
     context.push()
     username = _get_username()
@@ -185,6 +193,10 @@ def _get_delete_confirmation(user):
 
 def delete_user(args):
     """Deletes a journalist or administrator from the application."""
+    from sqlalchemy.orm.exc import NoResultFound
+    from db import db
+    from models import Journalist
+
     context = app_context()
     context.push()
     username = _get_username_to_delete()
@@ -224,32 +236,118 @@ def clean_tmp(args):  # pragma: no cover
         log.debug('{} does not exist, do nothing'.format(args.directory))
         return 0
 
-    def listdir_fullpath(d):
-        return [os.path.join(d, f) for f in os.listdir(d)]
+    removed, kept = maintenance.remove_old_files(args.directory,
+                                                 args.days * 24 * 60 * 60)
+    for path in removed:
+        log.debug('{} removed'.format(path))
+    for path in kept:
+        log.debug('{} modified less than {} days ago'.format(
+            path, args.days))
+
+    return 0
 
-    too_old = args.days * 24 * 60 * 60
-    for path in listdir_fullpath(args.directory):
-        if time.time() - os.stat(path).st_mtime > too_old:
-            os.remove(path)
-            log.debug('{} removed'.format(path))
-        else:
-            log.debug('{} modified less than {} days ago'.format(
-                path, args.days))
 
+def run_maintenance(args):
+    """Queue the maintenance tasks and the retries of the failed jobs which
+    are due, or run the tasks given right away, or print how the last run of
+    each task went."""
+    if args.status:
+        runs = maintenance.status(config)
+        intervals = maintenance.intervals(config)
+        for name in maintenance.TASKS:
+            run = runs.get(name)
+            if run is None:
+                print('{}: never run (every {}s)'.format(name,
+                                                         intervals[name]))
+                continue
+            print('{}: {} at {} UTC, in {:.3f}s (every {}s): {}'.format(
+                name, run['status'], run['started_at'].replace(microsecond=0),
+                run['seconds'], intervals[name],
+                ', '.join('{} {}'.format(*item)
+                          for item in sorted(run['result'].items())
+                          if item[0] != 'seconds')))
+        return 0
+
+    if args.run:
+        for name in args.run:
+            result = maintenance.run(name, config)
+            print('{} took {:.3f}s'.format(name, result['seconds']))
+        return 0
+
+    for job in maintenance.schedule(config):
+        log.info('queued {}'.format(job.description))
+    for job in worker.retry_due_jobs():
+        log.info('retrying {} (attempt {})'.format(
+            job.description, job.meta['attempts'] + 1))
+    # the local job queues run the jobs in this process
+    if isinstance(worker.get_queue(), worker.LocalQueue):
+        worker.get_queue().join()
+    return 0
+
+
+def jobs(args):
+    """Print the statistics of the background job queues and the failed
+    jobs, after queuing again or discarding the failed jobs given."""
+    for job_id in args.requeue:
+        if worker.requeue(job_id) is None:
+            log.error('there is no failed job {}'.format(job_id))
+            return 1
+        print('Job {} queued again'.format(job_id))
+    for job_id in args.discard:
+        if not worker.discard(job_id):
+            log.error('there is no failed job {}'.format(job_id))
+            return 1
+        print('Job {} discarded'.format(job_id))
+
+    def age(seconds):
+        return '-' if seconds is None else '{:.0f}s'.format(seconds)
+
+    row = '{:<12} {:>7} {:>7} {:>8} {:>7} {:>8} {:>8} {:>8} {:>7}'
+    print(row.format('queue', 'workers', 'queued', 'oldest', 'started',
+                     'longest', 'finished', 'jobs/min', 'failed'))
+    for queue in worker.stats():
+        print(row.format(queue['name'], queue['workers'], queue['queued'],
+                         age(queue['oldest_queued']), queue['started'],
+                         age(queue['longest_started']), queue['finished'],
+                         '{:.1f}'.format(queue['jobs_per_minute']),
+                         queue['failed']))
+
+    failed = worker.failed_jobs()
+    if failed:
+        print('\nFailed jobs, oldest first:')
+    for job in failed:
+        error = (job.exc_info or '').strip().splitlines()[-1:]
+        print('{} {} ({}, {} attempt(s)): {}'.format(
+            job.id, job.description, job.origin,
+            job.meta.get('attempts', 1), ''.join(error)))
     return 0
 
 
 def init_db(args):
-    with journalist_app.create_app(config).app_context():
+    from sqlalchemy import text
+    from db import db
+
+    with app_context():
         db.create_all()
-        db.session.execute(text('PRAGMA secure_delete = ON'))
-        db.session.execute(text('PRAGMA auto_vacuum = FULL'))
+        # the free pages are given back by the incremental_vacuum
+        # maintenance task, rather than on every commit
+        db.session.execute(text('PRAGMA auto_vacuum = INCREMENTAL'))
         db.session.commit()
 
     user = pwd.getpwnam(args.user)
     os.chown('/var/lib/securedrop/db.sqlite', user.pw_uid, user.pw_gid)
 
 
+def upgrade_db(args):
+    """Create the tables added since the database was initialized, such as
+    the journal of changes, in the database of an upgraded instance. The
+    existing tables are left alone, so it can be run on every upgrade."""
+    from db import db
+
+    with app_context():
+        db.create_all()
+
+
 def get_args():
     parser = argparse.ArgumentParser(prog=__file__, description='Management '
                                      'and testing utility for SecureDrop.')
@@ -286,12 +384,40 @@ def get_args():
     set_clean_tmp_parser(subps, 'clean-tmp')
     set_clean_tmp_parser(subps, 'clean_tmp')
 
+    jobs_subp = subps.add_parser('jobs', help='Show the background job '
+                                 'queues and the failed jobs.')
+    jobs_subp.add_argument('--requeue', metavar='JOB_ID', action='append',
+                           default=[], help='queue the failed job JOB_ID '
+                           'again (may be repeated)')
+    jobs_subp.add_argument('--discard', metavar='JOB_ID', action='append',
+                           default=[], help='discard the failed job JOB_ID '
+                           '(may be repeated)')
+    jobs_subp.set_defaults(func=jobs)
+
+    maintenance_subp = subps.add_parser(
+        'maintenance', help='Queue the maintenance tasks which are due, '
+        'e.g. the cleanup of the temp directory, and the retries of the '
+        'failed jobs (run by cron).')
+    maintenance_subp.add_argument(
+        '--run', metavar='TASK', action='append', default=[],
+        choices=maintenance.TASKS,
+        help='run TASK now, in this process (may be repeated): one of '
+        '{}'.format(', '.join(maintenance.TASKS)))
+    maintenance_subp.add_argument(
+        '--status', action='store_true',
+        help='show when each task last ran, and how long it took')
+    maintenance_subp.set_defaults(func=run_maintenance)
+
     init_db_subp = subps.add_parser('init-db', help='initialize the DB')
     init_db_subp.add_argument('-u', '--user',
                               help='Unix user for the DB',
                               required=True)
     init_db_subp.set_defaults(func=init_db)
 
+    upgrade_db_subp = subps.add_parser('upgrade-db', help='create the tables '
+                                       'added by this version in the DB')
+    upgrade_db_subp.set_defaults(func=upgrade_db)
+
     return parser
 
 
@@ -321,6 +447,8 @@ def setup_verbosity(args):
 
 
 def app_context():
+    import journalist_app
+
     return journalist_app.create_app(config).app_context()
 
 
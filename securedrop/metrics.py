@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""Aggregate timing of the requests of both interfaces.
+
+For every endpoint, this records a histogram of the latency of its requests
+and, for each of the CATEGORIES of work below, a histogram of the time its
+requests spent doing it. Only endpoint names and totals are kept: neither
+URLs, sources, codenames nor individual requests are.
+
+Work is attributed to a category by wrapping it with :class:`timed`, which
+only counts the time not already attributed to a nested category, e.g. the
+gpg calls made while a file is being stored count as `gpg` time, not as
+`storage` time.
+
+Each process periodically dumps its metrics as JSON in METRICS_DIR, so that
+the admin interface of the journalist interface can show those of all the
+processes of both interfaces, merged, as a table or as Prometheus text.
+"""
+import functools
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+log = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the buckets of the histograms
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+           10.0, float('inf'))
+
+CATEGORIES = (
+    'hash_codename',  # scrypt
+    'gpg',  # python-gnupg calls, each running gpg
+    'db',  # SQL statements
+    'storage',  # files read from and written to the store
+)
+
+# How often, in seconds, a process dumps its metrics
+DUMP_INTERVAL = 60
+
+# Dumps older than this, in seconds, are left out, as their process is gone
+STALE_DUMP_AGE = 24 * 60 * 60
+
+
+class Histogram(object):
+
+    def __init__(self, counts=None, total=0.0):
+        self.counts = list(counts) if counts else [0] * len(BUCKETS)
+        self.total = total
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+
+    def quantile(self, q):
+        """Return the upper bound of the bucket holding the `q` quantile."""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if count and seen >= rank:
+                return bound
+        return None
+
+    def to_dict(self):
+        return {'counts': self.counts, 'total': self.total}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['counts'], d['total'])
+
+
+class Metrics(object):
+    """The metrics of the process serving the `interface`, e.g. 'source'."""
+
+    def __init__(self, interface, dump_dir=None):
+        self.interface = interface
+        self.dump_dir = dump_dir
+        self.__lock = threading.Lock()
+        self.__latency = {}  # endpoint -> Histogram
+        self.__breakdown = {}  # (endpoint, category) -> Histogram
+        self.__stats = {}  # name -> callable returning a dict of numbers
+        self.__last_dump = time.time()
+
+    @property
+    def dump_path(self):
+        return os.path.join(self.dump_dir, '{}-{}.json'.format(
+            self.interface, os.getpid()))
+
+    def register_stats(self, name, stats):
+        """Export the counters returned by `stats()`, e.g. cache hits."""
+        self.__stats[name] = stats
+
+    def observe(self, endpoint, seconds, timings):
+        with self.__lock:
+            self.__latency.setdefault(endpoint, Histogram()).observe(seconds)
+            for category in CATEGORIES:
+                self.__breakdown.setdefault(
+                    (endpoint, category), Histogram()).observe(
+                        timings.get(category, 0.0))
+
+    def snapshot(self):
+        with self.__lock:
+            latency = dict((endpoint, histogram.to_dict())
+                           for endpoint, histogram in self.__latency.items())
+            breakdown = {}
+            for (endpoint, category), histogram in self.__breakdown.items():
+                breakdown.setdefault(endpoint, {})[category] = \
+                    histogram.to_dict()
+        stats = dict((name, stats()) for name, stats in self.__stats.items())
+        return {self.interface: {'latency': latency,
+                                 'breakdown': breakdown,
+                                 'stats': stats}}
+
+    def maybe_dump(self):
+        if self.dump_dir and time.time() - self.__last_dump >= DUMP_INTERVAL:
+            self.dump()
+
+    def dump(self):
+        self.__last_dump = time.time()
+        try:
+            fd, path = tempfile.mkstemp(dir=self.dump_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.rename(path, self.dump_path)
+        except (IOError, OSError) as e:
+            log.warning("Could not dump the metrics: %s", e)
+
+    def collect(self):
+        """Return the snapshot of this process merged with the latest dumps
+        of the other processes."""
+        snapshots = [self.snapshot()]
+        if self.dump_dir:
+            now = time.time()
+            for path in glob.glob(os.path.join(self.dump_dir, '*.json')):
+                if path == self.dump_path:
+                    continue
+                try:
+                    if now - os.path.getmtime(path) > STALE_DUMP_AGE:
+                        continue
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except (IOError, OSError, ValueError) as e:
+                    log.warning("Could not load %s: %s", path, e)
+        return merge(snapshots)
+
+
+def merge(snapshots):
+    """Merge `snapshots` into a dict mapping each interface to the histograms
+    of its endpoints and to its counters, summed over its processes."""
+    merged = {}
+    for snapshot in snapshots:
+        for interface, metrics in snapshot.items():
+            into = merged.setdefault(interface, {'latency': {},
+                                                 'breakdown': {},
+                                                 'stats': {}})
+            for endpoint, histogram in metrics['latency'].items():
+                into['latency'].setdefault(endpoint, Histogram()).merge(
+                    Histogram.from_dict(histogram))
+            for endpoint, categories in metrics['breakdown'].items():
+                for category, histogram in categories.items():
+                    into['breakdown'].setdefault(endpoint, {}).setdefault(
+                        category, Histogram()).merge(
+                            Histogram.from_dict(histogram))
+            for name, stats in metrics['stats'].items():
+                for key, value in stats.items():
+                    counters = into['stats'].setdefault(name, {})
+                    counters[key] = counters.get(key, 0) + value
+    return merged
+
+
+def exposition(merged):
+    """Format `merged` metrics in the Prometheus text exposition format."""
+    lines = []
+
+    def histogram_lines(name, labels, histogram):
+        cumulative = 0
+        for bound, count in zip(BUCKETS, histogram.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                name, labels, le, cumulative))
+        lines.append('{}_sum{{{}}} {!r}'.format(name, labels, histogram.total))
+        lines.append('{}_count{{{}}} {}'.format(name, labels, cumulative))
+
+    lines.append('# HELP securedrop_request_duration_seconds '
+                 'Latency of the requests, per endpoint.')
+    lines.append('# TYPE securedrop_request_duration_seconds histogram')
+    for interface, metrics in sorted(merged.items()):
+        for endpoint, histogram in sorted(metrics['latency'].items()):
+            histogram_lines('securedrop_request_duration_seconds',
+                            'interface="{}",endpoint="{}"'.format(
+                                interface, endpoint),
+                            histogram)
+
+    lines.append('# HELP securedrop_request_time_seconds '
+                 'Time spent by each request on each category of work.')
+    lines.append('# TYPE securedrop_request_time_seconds histogram')
+    for interface, metrics in sorted(merged.items()):
+        for endpoint, categories in sorted(metrics['breakdown'].items()):
+            for category, histogram in sorted(categories.items()):
+                histogram_lines('securedrop_request_time_seconds',
+                                'interface="{}",endpoint="{}",'
+                                'category="{}"'.format(interface, endpoint,
+                                                       category),
+                                histogram)
+
+    for interface, metrics in sorted(merged.items()):
+        for name, stats in sorted(metrics['stats'].items()):
+            for key, value in sorted(stats.items()):
+                lines.append('securedrop_{}_{}{{interface="{}"}} {}'.format(
+                    name, key, interface, value))
+    return '\n'.join(lines) + '\n'
+
+
+class _RequestTimings(object):
+
+    def __init__(self):
+        self.start = time.time()
+        self.timings = {}
+        # [category, start] of the work being timed, innermost last
+        self.stack = []
+
+
+def _request_timings():
+    if has_request_context():
+        return getattr(g, '_request_timings', None)
+    return None
+
+
+class timed(object):
+    """Attribute the time spent in a `with` block, or in calls to the
+    decorated function, to `category` for the current request, if any."""
+
+    def __init__(self, category):
+        self.category = category
+
+    def __enter__(self):
+        timings = _request_timings()
+        if timings is not None:
+            now = time.time()
+            if timings.stack:
+                self.__pause(timings, now)
+            timings.stack.append([self.category, now])
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        timings = _request_timings()
+        if timings is not None and timings.stack:
+            now = time.time()
+            self.__pause(timings, now)
+            timings.stack.pop()
+            if timings.stack:
+                timings.stack[-1][1] = now
+
+    @staticmethod
+    def __pause(timings, now):
+        category, start = timings.stack[-1]
+        timings.timings[category] = \
+            timings.timings.get(category, 0.0) + now - start
+
+    def __call__(self, f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            with timed(self.category):
+                return f(*args, **kwargs)
+        return wrapper
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    timer = timed('db')
+    timer.__enter__()
+    conn.info.setdefault('metrics_timers', []).append(timer)
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    timers = conn.info.get('metrics_timers')
+    if timers:
+        timers.pop().__exit__(None, None, None)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(exception_context):
+    timers = exception_context.connection.info.get('metrics_timers')
+    if timers:
+        timers.pop().__exit__(None, None, None)
+
+
+def setup_app(config, app, interface):
+    """Time the requests of `app`. This should be called before any other
+    `before_request` hook is registered, so that those are timed too."""
+    dump_dir = getattr(config, 'METRICS_DIR',
+                       os.path.join(config.SECUREDROP_DATA_ROOT, 'metrics'))
+    if dump_dir:
+        try:
+            os.makedirs(dump_dir, 0o700)
+        except OSError:
+            pass  # it already exists
+        if not os.access(dump_dir, os.W_OK):
+            log.warning("Cannot dump the metrics in %s", dump_dir)
+            dump_dir = None
+    app.metrics = Metrics(interface, dump_dir=dump_dir)
+
+    @app.before_request
+    def start_request_timings():
+        g._request_timings = _RequestTimings()
+
+    @app.teardown_request
+    def record_request_timings(exc):
+        timings = g.pop('_request_timings', None)
+        if timings is None:
+            return
+        app.metrics.observe(request.endpoint or 'unmatched',
+                            time.time() - timings.start,
+                            timings.timings)
+        app.metrics.maybe_dump()
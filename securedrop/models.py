@@ -5,9 +5,7 @@ import base64
 import os
 import scrypt
 import pyotp
-import qrcode
-# Using svg because it doesn't require additional dependencies
-import qrcode.image.svg
+import uuid
 
 # Find the best implementation available on this platform
 try:
@@ -17,7 +15,7 @@ except ImportError:
 
 from flask import current_app
 from jinja2 import Markup
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, event, func, inspect
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy import Column, Integer, String, Boolean, DateTime, Binary
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
@@ -174,6 +172,140 @@ class SourceStar(db.Model):
         self.starred = starred
 
 
+class Change(db.Model):
+    """An entry in the journal of changes to sources and their collections.
+
+    The `id` of a change serves as a cursor: API clients remember the last
+    one they have seen and only fetch the changes that come after it. When a
+    source is deleted, its history is replaced by a single deletion entry,
+    a tombstone keyed by a random id rather than by the source's
+    `filesystem_id`, so the journal never outlives the data it describes:
+    clients learn that a source is gone, and find out which one by listing
+    the sources again. The tombstones, of sources as of their submissions
+    and replies, are purged by the `prune_changes` maintenance task.
+    """
+    __tablename__ = 'changes'
+    # AUTOINCREMENT so that the ids of purged changes are never reused, which
+    # would make clients skip the changes that get them
+    __table_args__ = {'sqlite_autoincrement': True}
+    id = Column(Integer, primary_key=True)
+    type = Column(String(16), nullable=False)
+    action = Column(String(16), nullable=False)
+    filesystem_id = Column(String(96), nullable=False, index=True)
+    filename = Column(String(255))
+
+    ADD = 'add'
+    UPDATE = 'update'
+    DELETE = 'delete'
+
+    def __init__(self, type, action, filesystem_id, filename=None):
+        self.type = type
+        self.action = action
+        self.filesystem_id = filesystem_id
+        self.filename = filename
+
+    def __repr__(self):
+        return '<Change %r %r %r>' % (self.id, self.type, self.action)
+
+    def to_json(self):
+        return {'cursor': self.id,
+                'type': self.type,
+                'action': self.action,
+                'filesystem_id': self.filesystem_id,
+                'filename': self.filename}
+
+    @staticmethod
+    def last_id(filesystem_id=None):
+        """Return the cursor of the last change, to the source
+        `filesystem_id` if given, or 0 if there is none."""
+        query = db.session.query(func.max(Change.id))
+        if filesystem_id is not None:
+            query = query.filter(Change.filesystem_id == filesystem_id)
+        return query.scalar() or 0
+
+    @staticmethod
+    def record_source_deletions(session, filesystem_ids):
+        """Replace the history of each of the deleted sources
+        `filesystem_ids` by a single deletion entry."""
+        if not filesystem_ids:
+            return
+        session.query(Change).filter(
+            Change.filesystem_id.in_(filesystem_ids)).delete(
+                synchronize_session=False)
+        for _ in filesystem_ids:
+            session.add(Change('source', Change.DELETE, uuid.uuid4().hex))
+
+
+@event.listens_for(db.session, 'before_flush')
+def record_changes(session, flush_context, instances):
+    """Journal the changes to sources and their collections that are about to
+    be flushed, see :class:`Change`. Bulk deletions bypass this hook, and
+    have to call :meth:`Change.record_source_deletions` themselves."""
+    deleted_sources = [obj.filesystem_id for obj in session.deleted
+                       if isinstance(obj, Source)]
+    Change.record_source_deletions(session, deleted_sources)
+
+    # the sources of the flushed submissions, replies and stars: those which
+    # are not loaded already are read at once
+    source_ids = set(obj.source_id
+                     for objects in (session.new, session.dirty,
+                                     session.deleted)
+                     for obj in objects
+                     if isinstance(obj, (Submission, Reply, SourceStar)))
+    source_ids.discard(None)
+    filesystem_ids = {}
+    for obj in session.identity_map.values():
+        state = inspect(obj)
+        if isinstance(obj, Source) and 'filesystem_id' in state.dict:
+            filesystem_ids[state.identity[0]] = state.dict['filesystem_id']
+    missing = source_ids - set(filesystem_ids)
+    if missing:
+        with session.no_autoflush:
+            filesystem_ids.update(
+                session.query(Source.id, Source.filesystem_id)
+                       .filter(Source.id.in_(missing)))
+
+    # inserted together, rather than one by one by the flush
+    changes = []
+    for model, type in ((Source, 'source'), (Submission, 'submission'),
+                        (Reply, 'reply'), (SourceStar, 'star')):
+        for objects, action in ((session.new, Change.ADD),
+                                (session.dirty, Change.UPDATE),
+                                (session.deleted, Change.DELETE)):
+            for obj in objects:
+                if not isinstance(obj, model):
+                    continue
+                if (action == Change.UPDATE and
+                        not session.is_modified(obj,
+                                                include_collections=False)):
+                    continue
+
+                if model is Source:
+                    if action == Change.DELETE or obj.pending is not False:
+                        # pending sources are not shown to journalists
+                        continue
+                    if True in inspect(obj).attrs.pending.history.deleted:
+                        # the source has just submitted for the first time
+                        action = Change.ADD
+                    filesystem_id = obj.filesystem_id
+                    filename = None
+                else:
+                    filesystem_id = filesystem_ids.get(obj.source_id)
+                    if (filesystem_id is None or
+                            filesystem_id in deleted_sources):
+                        continue
+                    filename = getattr(obj, 'filename', None)
+
+                if model is SourceStar:
+                    action = Change.UPDATE
+                changes.append({'type': type,
+                                'action': action,
+                                'filesystem_id': filesystem_id,
+                                'filename': filename})
+    if changes:
+        session.execute(Change.__table__.insert(), changes)
+
+
 class InvalidUsernameException(Exception):
 
     """Raised when a user logs in with an invalid username"""
@@ -335,6 +467,12 @@ class Journalist(db.Model):
 
     @property
     def shared_secret_qrcode(self):
+        # Only needed when setting up two-factor authentication, so not
+        # imported by every process
+        import qrcode
+        # Using svg because it doesn't require additional dependencies
+        import qrcode.image.svg
+
         uri = self.totp.provisioning_uri(
             self.username,
             issuer_name="SecureDrop")
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""Notifications of new submissions, from the source interface to the
+journalist interface, over Redis pub/sub.
+
+A notification only wakes up the journalist interface, which then reads what
+is new from the change journal (see :class:`models.Change`). A notification
+that is lost, because Redis is down or nobody was listening, can therefore
+delay the news of a submission, but never lose it.
+
+The notifications go through the Redis connection of the job queue (see
+:func:`worker.get_queue`), made when they are first published or subscribed
+to. When the jobs are run locally, without Redis, there are none, and the
+journalist interface falls back to polling.
+"""
+import json
+import logging
+import os
+import time
+
+from redis.exceptions import RedisError
+
+import worker
+
+CHANNEL = 'securedrop:{}:submissions'.format(
+    'test' if os.environ.get('SECUREDROP_ENV') == 'test' else 'default')
+
+log = logging.getLogger(__name__)
+
+_redis = None
+
+
+def get_redis():
+    """Return the Redis connection the notifications go through, or None if
+    the job queue does not use Redis."""
+    if _redis is not None:
+        return _redis
+    queue = worker.get_queue()
+    if isinstance(queue, worker.RQQueue):
+        return queue.connection
+    return None
+
+
+def set_redis(redis):
+    """Send the notifications through `redis`, e.g. an in-process stand-in,
+    instead of the connection of the job queue, or through the latter again
+    if None, and return the previous one, if any."""
+    global _redis
+    previous, _redis = _redis, redis
+    return previous
+
+
+def publish_submissions(filesystem_id, count):
+    """Announce that the source `filesystem_id` has just made `count`
+    submissions. Failures are logged, and never fail the submission."""
+    redis = get_redis()
+    if redis is None:
+        return
+    try:
+        redis.publish(CHANNEL, json.dumps({'filesystem_id': filesystem_id,
+                                           'count': count}))
+    except RedisError as e:
+        log.warning("Could not publish a submission notification: %s", e)
+
+
+class Subscription(object):
+    """A subscription to the submission notifications, to be taken *before*
+    reading the change journal, so that nothing published in between is
+    missed."""
+
+    def __init__(self):
+        self.__pubsub = None
+        redis = get_redis()
+        if redis is None:
+            return
+        try:
+            self.__pubsub = redis.pubsub(ignore_subscribe_messages=True)
+            self.__pubsub.subscribe(CHANNEL)
+        except RedisError as e:
+            log.warning("Could not subscribe to submission notifications: "
+                        "%s", e)
+
+    def wait(self, timeout):
+        """Block until a submission is announced, and return True, or until
+        `timeout` seconds have passed, and return False. Without Redis, this
+        simply waits `timeout` seconds, so that clients keep polling at a
+        reasonable pace."""
+        deadline = time.time() + timeout
+        if self.__pubsub is not None:
+            try:
+                while time.time() < deadline:
+                    message = self.__pubsub.get_message(
+                        timeout=deadline - time.time())
+                    if message is not None:
+                        return True
+                return False
+            except RedisError as e:
+                log.warning("Lost the submission notifications: %s", e)
+        time.sleep(max(0, deadline - time.time()))
+        return False
+
+    def close(self):
+        if self.__pubsub is not None:
+            try:
+                self.__pubsub.close()
+            except RedisError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""Counting of the SQL statements run by a block of code or by a request.
+
+A :class:`QueryCounter` counts the statements run by its thread while it is
+active, how long they took, and how often each statement *shape* was run. A
+shape is a statement stripped of its literals, with its lists of bound
+parameters collapsed, so that the same query run for each item of a list,
+the telltale sign of an N+1 query pattern, shows up as one shape run many
+times. Neither parameters nor literals are kept, only shapes.
+
+The tests use it to hold key views to a query budget, and :func:`setup_app`
+counts the queries of a sample of the requests in production, logging those
+which run the same shape too often.
+"""
+import collections
+import random
+import re
+import threading
+import time
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PARAMETER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+_active = threading.local()
+
+
+def statement_shape(statement):
+    """Return `statement` without its literals, with its lists of bound
+    parameters collapsed and its whitespace normalized."""
+    shape = _LITERAL.sub('?', statement)
+    shape = _PARAMETER_LIST.sub('(?)', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+class QueryCounter(object):
+    """The SQL statements run by the current thread between :meth:`start`
+    and :meth:`stop`, or within a `with` block."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = collections.Counter()
+
+    def start(self):
+        if not hasattr(_active, 'counters'):
+            _active.counters = []
+        _active.counters.append(self)
+        return self
+
+    def stop(self):
+        _active.counters.remove(self)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.duration += seconds
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold):
+        """Return the (shape, count) of the shapes run at least `threshold`
+        times, most frequent first."""
+        return [(shape, count) for shape, count in self.shapes.most_common()
+                if count >= threshold]
+
+    def report(self):
+        lines = ['{} queries in {:.1f} ms'.format(self.count,
+                                                  self.duration * 1000)]
+        for shape, count in self.shapes.most_common():
+            lines.append('{:5d} x {}'.format(count, shape))
+        return '\n'.join(lines)
+
+
+def _active_counters():
+    return getattr(_active, 'counters', None)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    if _active_counters():
+        conn.info.setdefault('query_counter_starts', []).append(time.time())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    starts = conn.info.get('query_counter_starts')
+    if not starts:
+        return
+    seconds = time.time() - starts.pop()
+    for counter in _active_counters() or ():
+        counter.record(statement, seconds)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(exception_context):
+    starts = exception_context.connection.info.get('query_counter_starts')
+    if starts:
+        starts.pop()
+
+
+def setup_app(config, app):
+    """Count the queries of a sample of the requests of `app`, as set by
+    `SQL_QUERY_SAMPLE_RATE`, and log the shapes those requests run at least
+    `SQL_REPEATED_QUERY_THRESHOLD` times."""
+    rate = getattr(config, 'SQL_QUERY_SAMPLE_RATE', 0.01)
+    threshold = getattr(config, 'SQL_REPEATED_QUERY_THRESHOLD', 10)
+    if not rate:
+        return
+
+    @app.before_request
+    def start_counting_queries():
+        if random.random() < rate:
+            g._query_counter = QueryCounter().start()
+
+    @app.teardown_request
+    def log_queries(exc):
+        counter = g.pop('_query_counter', None)
+        if counter is None:
+            return
+        counter.stop()
+        endpoint = request.endpoint or 'unmatched'
+        app.logger.debug('%s: %d queries in %.1f ms', endpoint,
+                         counter.count, counter.duration * 1000)
+        for shape, count in counter.repeated(threshold):
+            app.logger.warning('%s ran %d times: %s', endpoint, count, shape)
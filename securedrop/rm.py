@@ -16,9 +16,143 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
+import binascii
+import logging
+import os
 import subprocess
+import time
+
+import worker
+
+log = logging.getLogger(__name__)
+
+# Each pass overwrites the whole file with fresh random data and is fsynced
+# before the next one starts, so that every pass actually reaches the disk
+# instead of being coalesced in the page cache.
+DEFAULT_PASSES = 3
+# Files are overwritten with large sequential writes of this many bytes.
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+
+class SecureDeletionError(Exception):
+
+    """Raised by a deletion job when some of its paths could not be
+    securely deleted. The job then ends up in the failed queue, where it
+    can be inspected and requeued."""
+
+    def __init__(self, failed):
+        self.failed = failed
+
+    def __str__(self):
+        return "could not securely delete {} path(s): {}".format(
+            len(self.failed), ', '.join(self.failed))
 
 
 def srm(fn):
     subprocess.check_call(['srm', '-r', fn])
     return "success"
+
+
+def secure_delete(paths, passes=DEFAULT_PASSES,
+                  buffer_size=DEFAULT_BUFFER_SIZE):
+    """Securely delete every file in `paths` in-process. Directories are
+    walked bottom-up: their files are shredded and the emptied directories
+    removed.
+
+    Each file is overwritten `passes` times with large sequential writes,
+    fsynced after every pass, renamed to a random name, truncated and
+    finally unlinked. Paths that do not exist are ignored.
+
+    Returns a dict of statistics (files, bytes, seconds, bytes_per_second)
+    and raises :exc:`SecureDeletionError` listing the paths that could not
+    be deleted, once all the others have been processed.
+    """
+    stats = {'files': 0, 'bytes': 0}
+    failed = []
+    start = time.time()
+
+    def onerror(path, e):
+        log.error("could not securely delete a file: {}".format(e))
+        failed.append(path)
+
+    for path in paths:
+        if os.path.isdir(path) and not os.path.islink(path):
+            for root, dirs, files in os.walk(path, topdown=False):
+                for name in files:
+                    _shred_into(os.path.join(root, name), passes,
+                                buffer_size, stats, onerror)
+                for name in dirs:
+                    _rmdir(os.path.join(root, name), onerror)
+            _rmdir(path, onerror)
+        elif os.path.lexists(path):
+            _shred_into(path, passes, buffer_size, stats, onerror)
+
+    stats['seconds'] = time.time() - start
+    stats['bytes_per_second'] = (stats['bytes'] * passes / stats['seconds']
+                                 if stats['seconds'] else 0)
+    if failed:
+        raise SecureDeletionError(failed)
+    return stats
+
+
+def secure_delete_batch(paths, passes=DEFAULT_PASSES):
+    """Worker job: securely delete `paths` with :func:`secure_delete` and
+    record the throughput statistics in the job's metadata."""
+    stats = secure_delete(paths, passes=passes)
+    log.info("securely deleted {files} file(s), {bytes} bytes x {passes} "
+             "pass(es) in {seconds:.3f}s ({rate:.1f} MiB/s)".format(
+                 passes=passes,
+                 rate=stats['bytes_per_second'] / (1024 * 1024),
+                 **stats))
+    job = worker.get_current_job()
+    if job is not None:
+        job.meta['secure_delete'] = stats
+        job.save_meta()
+    return "success"
+
+
+def shred(path, passes=DEFAULT_PASSES, buffer_size=DEFAULT_BUFFER_SIZE):
+    """Overwrite, truncate and unlink a single file. Returns its size."""
+    if os.path.islink(path):
+        os.unlink(path)
+        return 0
+
+    size = os.path.getsize(path)
+    with open(path, 'r+b', 0) as f:
+        for _ in range(passes):
+            f.seek(0)
+            # One random buffer per pass keeps the overwrite sequential and
+            # cheap; the data only needs to differ from the original.
+            chunk = os.urandom(min(buffer_size, size) or 1)
+            remaining = size
+            while remaining > 0:
+                n = min(remaining, len(chunk))
+                f.write(chunk[:n])
+                remaining -= n
+            f.flush()
+            os.fsync(f.fileno())
+
+    # Do not leave the original file name behind in the directory entry
+    scrubbed = os.path.join(os.path.dirname(path),
+                            binascii.hexlify(os.urandom(16)))
+    os.rename(path, scrubbed)
+    with open(scrubbed, 'r+b', 0) as f:
+        f.truncate(0)
+        os.fsync(f.fileno())
+    os.unlink(scrubbed)
+    return size
+
+
+def _shred_into(path, passes, buffer_size, stats, onerror):
+    try:
+        stats['bytes'] += shred(path, passes, buffer_size)
+        stats['files'] += 1
+    except (IOError, OSError) as e:
+        onerror(path, e)
+
+
+def _rmdir(path, onerror):
+    try:
+        os.rmdir(path)
+    except OSError as e:
+        onerror(path, e)
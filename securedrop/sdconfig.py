@@ -27,6 +27,35 @@ class SDConfig(object):
         except AttributeError:
             pass
 
+        try:
+            self.BULK_ARCHIVE_ASYNC_THRESHOLD = \
+                _config.BULK_ARCHIVE_ASYNC_THRESHOLD  # type: ignore
+        except AttributeError:
+            pass
+
+        try:
+            self.BULK_ARCHIVE_TTL_MINUTES = \
+                _config.BULK_ARCHIVE_TTL_MINUTES  # type: ignore
+        except AttributeError:
+            pass
+
+        try:
+            self.MAX_LONG_POLLS = _config.MAX_LONG_POLLS  # type: ignore
+        except AttributeError:
+            pass
+
+        try:
+            self.CODENAME_POOL_SIZE = \
+                _config.CODENAME_POOL_SIZE  # type: ignore
+        except AttributeError:
+            pass
+
+        try:
+            self.CODENAME_POOL_REFILL_THRESHOLD = \
+                _config.CODENAME_POOL_REFILL_THRESHOLD  # type: ignore
+        except AttributeError:
+            pass
+
         try:
             self.DATABASE_FILE = _config.DATABASE_FILE  # type: ignore
         except AttributeError:
@@ -72,6 +101,16 @@ class SDConfig(object):
         except AttributeError:
             pass
 
+        try:
+            self.JOB_QUEUE_BACKEND = _config.JOB_QUEUE_BACKEND  # type: ignore
+        except AttributeError:
+            pass
+
+        try:
+            self.JOB_QUEUE_WORKERS = _config.JOB_QUEUE_WORKERS  # type: ignore
+        except AttributeError:
+            pass
+
         try:
             self.JOURNALIST_KEY = _config.JOURNALIST_KEY  # type: ignore
         except AttributeError:
@@ -82,6 +121,28 @@ class SDConfig(object):
         except AttributeError:
             pass
 
+        try:
+            self.LOGIN_ATTEMPT_MAX_AGE_DAYS = \
+                _config.LOGIN_ATTEMPT_MAX_AGE_DAYS  # type: ignore
+        except AttributeError:
+            pass
+
+        try:
+            self.MAINTENANCE_DIR = _config.MAINTENANCE_DIR  # type: ignore
+        except AttributeError:
+            pass
+
+        try:
+            self.MAINTENANCE_INTERVALS = \
+                _config.MAINTENANCE_INTERVALS  # type: ignore
+        except AttributeError:
+            pass
+
+        try:
+            self.METRICS_DIR = _config.METRICS_DIR  # type: ignore
+        except AttributeError:
+            pass
+
         try:
             self.NOUNS = _config.NOUNS  # type: ignore
         except AttributeError:
@@ -102,6 +163,12 @@ class SDConfig(object):
         except AttributeError:
             pass
 
+        try:
+            self.SECURE_DELETE_PASSES = \
+                _config.SECURE_DELETE_PASSES  # type: ignore
+        except AttributeError:
+            pass
+
         try:
             self.SECUREDROP_DATA_ROOT = _config.SECUREDROP_DATA_ROOT  # type: ignore # noqa: E501
         except AttributeError:
@@ -118,12 +185,30 @@ class SDConfig(object):
         except AttributeError:
             pass
 
+        try:
+            self.SOURCE_ROW_CACHE_SIZE = \
+                _config.SOURCE_ROW_CACHE_SIZE  # type: ignore
+        except AttributeError:
+            pass
+
         try:
             self.SOURCE_TEMPLATES_DIR = \
                 _config.SOURCE_TEMPLATES_DIR  # type: ignore
         except AttributeError:
             pass
 
+        try:
+            self.SQL_QUERY_SAMPLE_RATE = \
+                _config.SQL_QUERY_SAMPLE_RATE  # type: ignore
+        except AttributeError:
+            pass
+
+        try:
+            self.SQL_REPEATED_QUERY_THRESHOLD = \
+                _config.SQL_REPEATED_QUERY_THRESHOLD  # type: ignore
+        except AttributeError:
+            pass
+
         try:
             self.STORE_DIR = _config.STORE_DIR  # type: ignore
         except AttributeError:
@@ -135,11 +220,35 @@ class SDConfig(object):
         except AttributeError:
             pass
 
+        try:
+            self.TEMPLATE_CACHE_DIR = \
+                _config.TEMPLATE_CACHE_DIR  # type: ignore
+        except AttributeError:
+            pass
+
         try:
             self.TEMP_DIR = _config.TEMP_DIR  # type: ignore
         except AttributeError:
             pass
 
+        try:
+            self.TEMP_FILE_MAX_AGE_DAYS = \
+                _config.TEMP_FILE_MAX_AGE_DAYS  # type: ignore
+        except AttributeError:
+            pass
+
+        try:
+            self.VACUUM_PAGES_PER_STEP = \
+                _config.VACUUM_PAGES_PER_STEP  # type: ignore
+        except AttributeError:
+            pass
+
+        try:
+            self.VACUUM_TIME_BUDGET = \
+                _config.VACUUM_TIME_BUDGET  # type: ignore
+        except AttributeError:
+            pass
+
         try:
             self.WORD_LIST = _config.WORD_LIST  # type: ignore
         except AttributeError:
@@ -3,8 +3,10 @@
 from sdconfig import config
 
 from source_app import create_app
+from warmup import warm_up
 
 app = create_app(config)
+warm_up(app)
 
 
 if __name__ == "__main__":  # pragma: no cover
@@ -1,3 +1,5 @@
+import json
+
 from datetime import datetime, timedelta
 from flask import (Flask, render_template, flash, Markup, request, g, session,
                    url_for, redirect)
@@ -9,6 +11,10 @@ from os import path
 from sqlalchemy.orm.exc import NoResultFound
 
 import i18n
+import metrics
+import query_counter
+import static_assets
+import template_cache
 import template_filters
 import version
 
@@ -17,6 +23,8 @@ from db import db
 from models import Source
 from request_that_secures_file_uploads import RequestThatSecuresFileUploads
 from source_app import main, info, api
+from source_app.cached_response import CachedResponse
+from source_app.codename_pool import CodenamePool
 from source_app.decorators import ignore_static
 from source_app.utils import logged_in
 from store import Storage
@@ -40,6 +48,10 @@ def create_app(config):
     app.config.from_object(config.SourceInterfaceFlaskConfig)
     app.sdconfig = config
 
+    # before the other before_request hooks are registered, to time them too
+    metrics.setup_app(config, app, 'source')
+    query_counter.setup_app(config, app)
+
     # The default CSRF token expiration is 1 hour. Since large uploads can
     # take longer than an hour over Tor, we increase the valid window to 24h.
     app.config['WTF_CSRF_TIME_LIMIT'] = 60 * 60 * 24
@@ -75,6 +87,30 @@ def create_app(config):
         gpg_key_dir=config.GPG_KEY_DIR,
     )
 
+    app.codename_pool = CodenamePool(
+        app,
+        size=getattr(config, 'CODENAME_POOL_SIZE', 10),
+        refill_threshold=getattr(config,
+                                 'CODENAME_POOL_REFILL_THRESHOLD',
+                                 None),
+    )
+
+    # Both change with the keyring at most, so they are served from memory
+    app.cached_responses = {
+        'journalist_key': CachedResponse(
+            lambda: app.crypto_util.export_pubkey(config.JOURNALIST_KEY),
+            lambda: app.crypto_util.keyring_version(),
+            mimetype='application/pgp-keys',
+            attachment_filename=config.JOURNALIST_KEY + '.asc'),
+        'metadata': CachedResponse(
+            lambda: json.dumps({'gpg_fpr': config.JOURNALIST_KEY,
+                                'sd_version': version.__version__}),
+            lambda: None,
+            mimetype='application/json'),
+    }
+    for name, cached_response in app.cached_responses.items():
+        app.metrics.register_stats(name + '_response', cached_response.stats)
+
     @app.errorhandler(CSRFError)
     def handle_csrf_error(e):
         msg = render_template('session_timeout.html')
@@ -84,11 +120,13 @@ def create_app(config):
 
     assets = Environment(app)
     app.config['assets'] = assets
+    static_assets.setup_app(app, assets)
 
     i18n.setup_app(config, app)
 
     app.jinja_env.trim_blocks = True
     app.jinja_env.lstrip_blocks = True
+    template_cache.setup_app(config, app)
     app.jinja_env.globals['version'] = version.__version__
     if getattr(config, 'CUSTOM_HEADER_IMAGE', None):
         app.jinja_env.globals['header_image'] = \
@@ -126,6 +164,7 @@ def create_app(config):
     def setup_g():
         """Store commonly used values in Flask's special g object"""
         g.locale = i18n.get_locale(config)
+        request.babel_translations = i18n.get_translations(g.locale)
         g.text_direction = i18n.get_text_direction(g.locale)
         g.html_lang = i18n.locale_to_rfc_5646(g.locale)
         g.locales = i18n.get_locale2name()
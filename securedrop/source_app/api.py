@@ -1,8 +1,4 @@
-import json
-
-from flask import Blueprint, make_response
-
-import version
+from flask import Blueprint, current_app
 
 
 def make_blueprint(config):
@@ -10,11 +6,6 @@ def make_blueprint(config):
 
     @view.route('/metadata')
     def metadata():
-        meta = {'gpg_fpr': config.JOURNALIST_KEY,
-                'sd_version': version.__version__,
-                }
-        resp = make_response(json.dumps(meta))
-        resp.headers['Content-Type'] = 'application/json'
-        return resp
+        return current_app.cached_responses['metadata'].make_response()
 
     return view
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import threading
+
+from flask import current_app, request
+
+
+class CachedResponse(object):
+    """The body of a public response which is costly to compute but rarely
+    changes, such as the export of the journalist's public key.
+
+    The body is computed on first use, and again whenever `version()`
+    changes, then served from memory along with an ETag, so that clients can
+    revalidate it for free. No Last-Modified date is sent: it would tell
+    anyone when the body last changed, e.g. when a key was replaced.
+    """
+
+    def __init__(self, compute, version, mimetype, attachment_filename=None):
+        self.__compute = compute
+        self.__version = version
+        self.mimetype = mimetype
+        self.attachment_filename = attachment_filename
+        self.__lock = threading.Lock()
+        # (version, body, etag)
+        self.__cached = None
+
+        self.computed = 0
+        self.served = 0
+        self.not_modified = 0
+
+    def get(self):
+        """Return the body and its ETag."""
+        version = self.__version()
+        cached = self.__cached
+        if cached is None or cached[0] != version:
+            with self.__lock:
+                cached = self.__cached
+                if cached is None or cached[0] != version:
+                    cached = self.__cached = self.__recompute(version)
+        return cached[1:]
+
+    def __recompute(self, version):
+        body = self.__compute()
+        if isinstance(body, unicode):
+            body = body.encode('utf-8')
+        self.computed += 1
+        return (version, body, hashlib.sha256(body).hexdigest())
+
+    def make_response(self):
+        body, etag = self.get()
+        resp = current_app.response_class(body, mimetype=self.mimetype)
+        if self.attachment_filename:
+            resp.headers.add('Content-Disposition', 'attachment',
+                             filename=self.attachment_filename)
+        resp.set_etag(etag)
+        resp.make_conditional(request)
+        with self.__lock:
+            if resp.status_code == 304:
+                self.not_modified += 1
+            else:
+                self.served += 1
+        return resp
+
+    def stats(self):
+        return {'computed': self.computed,
+                'served': self.served,
+                'not_modified': self.not_modified}
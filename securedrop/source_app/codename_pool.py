@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import threading
+import time
+
+from source_app.utils import new_unique_codename
+
+import typing
+# https://www.python.org/dev/peps/pep-0484/#runtime-or-type-checking
+if typing.TYPE_CHECKING:
+    # flake8 can not understand type annotation yet.
+    # That is why all type annotation relative import
+    # statements has to be marked as noqa.
+    # http://flake8.pycqa.org/en/latest/user/error-codes.html?highlight=f401
+    from typing import Dict, Set  # noqa: F401
+
+
+class CodenamePool(object):
+    """A per-language pool of codenames that have already been checked for
+    uniqueness, so that `/generate` does not have to pay for scrypt and a
+    database lookup while the source waits.
+
+    Candidates are only ever held in process memory, are never written to
+    disk, and are removed from the pool as soon as they are handed out. A
+    candidate could in theory be claimed by another process between being
+    vetted and being used; `/create` already handles that case by refusing
+    to log the source in on an `IntegrityError`.
+
+    Pools are refilled by a short-lived background thread that exits once
+    the pool is back to `size` candidates.
+    """
+
+    def __init__(self, app, size, refill_threshold=None):
+        self.__app = app
+        self.size = size
+        if refill_threshold is None:
+            refill_threshold = size // 2
+        self.refill_threshold = refill_threshold
+
+        self.__lock = threading.Lock()
+        self.__pools = {}  # type: Dict[str, collections.deque]
+        self.__refilling = set()  # type: Set[str]
+
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+
+    @property
+    def enabled(self):
+        return self.size > 0
+
+    def get(self, language):
+        """Pop a vetted codename for `language`, or return None if the pool
+        is empty or disabled. A refill is scheduled in the background when
+        the pool drops to `refill_threshold` candidates or fewer.
+        """
+        if not self.enabled:
+            return None
+
+        with self.__lock:
+            pool = self.__pools.setdefault(language, collections.deque())
+            try:
+                codename = pool.popleft()
+                self.hits += 1
+            except IndexError:
+                codename = None
+                self.misses += 1
+            schedule_refill = (len(pool) <= self.refill_threshold and
+                               language not in self.__refilling)
+            if schedule_refill:
+                self.__refilling.add(language)
+
+        if schedule_refill:
+            thread = threading.Thread(target=self.__refill_in_background,
+                                      args=(language,))
+            thread.daemon = True
+            thread.start()
+
+        return codename
+
+    def refill(self, language):
+        """Synchronously top up the pool for `language` to `size`
+        candidates. Returns the number of candidates added."""
+        added = 0
+        with self.__app.app_context():
+            while True:
+                with self.__lock:
+                    pool = self.__pools.setdefault(language,
+                                                   collections.deque())
+                    if len(pool) >= self.size:
+                        break
+
+                # scrypt (slow), done without holding the lock
+                codename = new_unique_codename(language)
+
+                with self.__lock:
+                    if codename not in pool and len(pool) < self.size:
+                        pool.append(codename)
+                        added += 1
+        return added
+
+    def __refill_in_background(self, language):
+        start = time.time()
+        try:
+            added = self.refill(language)
+        except Exception as e:
+            self.__app.logger.error(
+                "Could not refill the codename pool for '{}': {}".format(
+                    language, e))
+        else:
+            self.refills += 1
+            self.__app.logger.debug(
+                "Added {} codenames to the '{}' pool in {:.3f}s".format(
+                    added, language, time.time() - start))
+        finally:
+            with self.__lock:
+                self.__refilling.discard(language)
+
+    def stats(self):
+        """Return aggregate counters suitable for logging or monitoring. The
+        codenames themselves are never included."""
+        with self.__lock:
+            depths = dict((language, len(pool))
+                          for language, pool in self.__pools.items())
+        return {'size': self.size,
+                'refill_threshold': self.refill_threshold,
+                'depth': depths,
+                'hits': self.hits,
+                'misses': self.misses,
+                'refills': self.refills}
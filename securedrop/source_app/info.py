@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 
-from cStringIO import StringIO
-from flask import Blueprint, render_template, send_file, current_app
+from flask import Blueprint, render_template, current_app
 
 
 def make_blueprint(config):
@@ -17,12 +16,7 @@ def make_blueprint(config):
 
     @view.route('/journalist-key')
     def download_journalist_pubkey():
-        journalist_pubkey = current_app.crypto_util.gpg.export_keys(
-            config.JOURNALIST_KEY)
-        return send_file(StringIO(journalist_pubkey),
-                         mimetype="application/pgp-keys",
-                         attachment_filename=config.JOURNALIST_KEY + ".asc",
-                         as_attachment=True)
+        return current_app.cached_responses['journalist_key'].make_response()
 
     @view.route('/why-journalist-key')
     def why_download_journalist_pubkey():
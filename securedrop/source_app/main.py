@@ -7,9 +7,11 @@ from flask import (Blueprint, render_template, flash, redirect, url_for, g,
 from flask_babel import gettext
 from sqlalchemy.exc import IntegrityError
 
+import deletion
+
 from db import db
 from models import Source, Submission, Reply, get_one_or_else
-from rm import srm
+from notifications import publish_submissions
 from source_app.decorators import login_required
 from source_app.utils import (logged_in, generate_unique_codename,
                               async_genkey, normalize_timestamps,
@@ -188,6 +190,7 @@ def make_blueprint(config):
         g.source.last_updated = datetime.utcnow()
         db.session.commit()
         normalize_timestamps(g.filesystem_id)
+        publish_submissions(g.filesystem_id, len(fnames))
 
         return redirect(url_for('main.lookup'))
 
@@ -197,9 +200,7 @@ def make_blueprint(config):
         query = Reply.query.filter(
             Reply.filename == request.form['reply_filename'])
         reply = get_one_or_else(query, current_app.logger, abort)
-        srm(current_app.storage.path(g.filesystem_id, reply.filename))
-        db.session.delete(reply)
-        db.session.commit()
+        deletion.delete_items(g.filesystem_id, [reply])
 
         flash(gettext("Reply deleted"), "notification")
         return redirect(url_for('.lookup'))
@@ -213,10 +214,7 @@ def make_blueprint(config):
                                      "expected")
             return redirect(url_for('.lookup'))
 
-        for reply in replies:
-            srm(current_app.storage.path(g.filesystem_id, reply.filename))
-            db.session.delete(reply)
-        db.session.commit()
+        deletion.delete_items(g.filesystem_id, replies)
 
         flash(gettext("All replies have been deleted"), "notification")
         return redirect(url_for('.lookup'))
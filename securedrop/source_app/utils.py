@@ -1,5 +1,5 @@
 import logging
-import subprocess
+import os
 
 from datetime import datetime
 from flask import session, current_app, abort, g
@@ -10,7 +10,8 @@ from threading import Thread
 import i18n
 
 from crypto_util import CryptoException
-from models import Source
+from db import db
+from models import Source, Submission
 
 
 def logged_in():
@@ -31,11 +32,20 @@ def valid_codename(codename):
 
 
 def generate_unique_codename(config):
+    """Return an unused codename, from the pre-vetted pool if possible"""
+    language = i18n.get_language(config)
+    codename = current_app.codename_pool.get(language)
+    if codename is None:
+        codename = new_unique_codename(language)
+    return codename
+
+
+def new_unique_codename(language):
     """Generate random codenames until we get an unused one"""
     while True:
         codename = current_app.crypto_util.genrandomid(
             Source.NUM_WORDS,
-            i18n.get_language(config))
+            language)
 
         # The maximum length of a word in the wordlist is 9 letters and the
         # codename length is 7 words, so it is currently impossible to
@@ -100,14 +110,28 @@ def normalize_timestamps(filesystem_id):
     the latest submission. This minimizes metadata that could be useful to
     investigators. See #301.
     """
-    sub_paths = [current_app.storage.path(filesystem_id, submission.filename)
-                 for submission in g.source.submissions]
+    filenames = db.session.query(Submission.filename) \
+                          .filter(Submission.source_id == g.source.id) \
+                          .order_by(Submission.id)
+    sub_paths = [current_app.storage.path(filesystem_id, filename)
+                 for (filename,) in filenames]
     if len(sub_paths) > 1:
-        args = ["touch"]
-        args.extend(sub_paths[:-1])
-        rc = subprocess.call(args)
-        if rc != 0:
+        failures = 0
+        try:
+            # Whole seconds: utime can not reproduce the sub-second part of
+            # an mtime exactly, and it would only give more away
+            latest = int(os.stat(sub_paths[-1]).st_mtime)
+        except OSError:
+            failures = len(sub_paths)
+        else:
+            for path in sub_paths:
+                try:
+                    if os.stat(path).st_mtime != latest:
+                        os.utime(path, (latest, latest))
+                except OSError:
+                    failures += 1
+        if failures:
             current_app.logger.warning(
                 "Couldn't normalize submission "
-                "timestamps (touch exited with %d)" %
-                rc)
+                "timestamps ({} of {} failed)".format(failures,
+                                                      len(sub_paths)))
@@ -17,6 +17,25 @@ function enhance_ui() {
   $('button#delete-selected').attr('value', 'delete');
 }
 
+// Show the new unread count of a source on its row of the index, or a notice
+// to reload the page if the source has no row yet
+function update_source_row(source) {
+  var row = $('li.source[data-filesystem-id="' + source.filesystem_id + '"]');
+  if (!row.length) {
+    $('#new-sources-notice').show();
+    return;
+  }
+
+  var unread = row.find('.unread');
+  if (!unread.length) {
+    unread = $('<span class="unread"><a class="btn small"></a></span>');
+    unread.find('a').attr('href', '/download_unread/' + source.filesystem_id);
+    row.find('.submission-count').append(unread);
+  }
+  unread.find('a').html('<i class="fa fa-download"></i> ' +
+    get_string("num-unread-string").supplant({ num_unread: source.unread }));
+}
+
 function get_string(string_id) {
   return $("#js-strings > #" + string_id)[0].innerHTML;
 }
@@ -88,6 +107,44 @@ $(function () {
       return confirm(get_string("delete-user-confirm-string").supplant({ username: username }));
   });
 
+  // Poll the status of a bulk archive being prepared by the worker, and
+  // download it once it is ready
+  var archive_status = $('#archive-status[data-status="building"]');
+  if (archive_status.length) {
+    var poll_archive = function() {
+      $.getJSON(window.location.pathname + '?status', function(data) {
+        if (data.status == 'building') {
+          setTimeout(poll_archive, 2000);
+        } else {
+          window.location.reload();
+        }
+      });
+    };
+    setTimeout(poll_archive, 2000);
+  }
+
+  // Long poll for new submissions while the index is open, and update the
+  // rows of their sources in place
+  var index = $('[data-notifications-cursor]');
+  if (index.length) {
+    var cursor = index.attr('data-notifications-cursor');
+    var poll_notifications = function() {
+      $.getJSON('/api/v1/notifications', { since: cursor })
+        .done(function(data) {
+          cursor = data.cursor;
+          $.each(data.sources, function(i, source) {
+            update_source_row(source);
+          });
+          setTimeout(poll_notifications, 1000);
+        })
+        .fail(function() {
+          // e.g. the session expired: back off
+          setTimeout(poll_notifications, 60000);
+        });
+    };
+    poll_notifications();
+  }
+
   // Confirm before resetting two-factor authentication on edit user page
   $('.reset-two-factor').submit(function(event) {
       var username = $(this).attr('data-username');
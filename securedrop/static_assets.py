@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Content-hashed static assets.
+
+When the package is built, this script bundles the JavaScript into
+`static/dist/`, then copies every static file to a name carrying a hash of
+its content, e.g. `css/source.css` to `css/source.0123456789ab.css`, along
+with a gzipped variant of the text files, and lists the copies in
+`static/manifest.json`.
+
+The apps load that manifest once, and their templates refer to static files
+through `static_url`, which looks the hashed name up. As those names change
+whenever the content does, they can be cached by browsers for good. Without
+a manifest, as in development, the files are referred to by their own name
+and the JavaScript bundles are built when they are first used.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import posixpath
+import re
+
+from flask import url_for
+from webassets import Bundle, Environment
+
+log = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = 'manifest.json'
+
+# output: (filters, contents)
+BUNDLES = {
+    'gen/journalist.js': ('jsmin', ('js/libs/jquery-2.1.4.min.js',
+                                    'js/journalist.js')),
+    'gen/source.js': ('jsmin', ('js/libs/jquery-2.1.4.min.js',
+                                'js/source.js')),
+}
+
+# Where the bundles are built with the package: `gen/`, where Flask-Assets
+# builds them on demand, is emptied when the package is installed
+DIST_DIR = 'dist'
+
+# Files that are replaced while the app runs, and can therefore not be hashed
+# when the package is built
+MUTABLE = frozenset(['i/logo.png'])
+
+# Files which are worth compressing
+COMPRESSIBLE = frozenset(['.css', '.eot', '.js', '.svg', '.ttf'])
+
+# How long browsers may cache the hashed files
+HASHED_MAX_AGE = 365 * 24 * 60 * 60
+
+_CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")?#]+)([^'")]*)\1\s*\)''')
+
+
+def load_manifest(static_dir):
+    """Return the manifest of `static_dir`, which maps the name of each
+    static file to the name of its hashed copy, or {} if there is none."""
+    try:
+        with open(os.path.join(static_dir, MANIFEST_FILENAME)) as f:
+            return json.load(f)
+    except IOError:
+        return {}
+
+
+def register_bundles(assets, directory=None):
+    """Register BUNDLES with the Flask-Assets environment `assets`, under
+    their name, to be built there or into `directory` if given."""
+    for output, (filters, contents) in BUNDLES.items():
+        assets.register(output, Bundle(*contents, filters=filters,
+                                       output=_bundle_path(output, directory)))
+
+
+def _bundle_path(output, directory=None):
+    if directory is None:
+        return output
+    return posixpath.join(directory, posixpath.basename(output))
+
+
+def setup_app(app, assets):
+    manifest = load_manifest(app.static_folder)
+    register_bundles(assets)
+
+    def static_url(filename):
+        """Return the URL of the static file `filename`."""
+        hashed = manifest.get(filename)
+        if hashed is not None:
+            return url_for('static', filename=hashed)
+        if filename in BUNDLES:
+            # no manifest: build the bundle if its contents changed
+            return assets[filename].urls()[0]
+        return url_for('static', filename=filename)
+
+    app.jinja_env.globals['static_url'] = static_url
+
+    hashed_files = frozenset(manifest.values())
+    default_max_age = app.get_send_file_max_age
+
+    def get_send_file_max_age(filename):
+        if filename in hashed_files:
+            return HASHED_MAX_AGE
+        return default_max_age(filename)
+
+    app.get_send_file_max_age = get_send_file_max_age
+
+
+def build(static_dir):
+    """Build the bundles, hash the static files of `static_dir`, write its
+    manifest and return it."""
+    previous = load_manifest(static_dir)
+    for hashed in previous.values():
+        for stale in (hashed, hashed + '.gz'):
+            try:
+                os.remove(os.path.join(static_dir, stale))
+            except OSError:
+                pass
+
+    assets = Environment(static_dir, '/static')
+    assets.cache = False
+    assets.manifest = False
+    register_bundles(assets, DIST_DIR)
+    for output in sorted(BUNDLES):
+        log.debug('bundling %s', output)
+        assets[output].build(force=True)
+
+    names = []
+    for dirpath, dirnames, filenames in os.walk(static_dir):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.') and
+                       not (dirpath == static_dir and d == 'gen')]
+        for filename in filenames:
+            name = os.path.relpath(os.path.join(dirpath, filename),
+                                   static_dir).replace(os.sep, '/')
+            if (filename.startswith('.') or name == MANIFEST_FILENAME or
+                    name in MUTABLE):
+                continue
+            names.append(name)
+
+    manifest = {}
+    # The stylesheets refer to other files, so hash those first
+    for name in sorted(names, key=lambda n: (n.endswith('.css'), n)):
+        with open(os.path.join(static_dir, name), 'rb') as f:
+            content = f.read()
+        if name.endswith('.css'):
+            content = _rewrite_css_urls(name, content, manifest)
+        manifest[name] = _write_hashed(static_dir, name, content)
+        log.debug('%s -> %s', name, manifest[name])
+    # the templates refer to the bundles by their name in gen/
+    for output in BUNDLES:
+        manifest[output] = manifest.pop(_bundle_path(output, DIST_DIR))
+
+    with open(os.path.join(static_dir, MANIFEST_FILENAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    log.info('hashed %d static files', len(manifest))
+    return manifest
+
+
+def _rewrite_css_urls(name, content, manifest):
+    """Make the stylesheet `name` refer to the hashed copies of the files
+    listed in `manifest`."""
+    directory = posixpath.dirname(name)
+
+    def rewrite(match):
+        quote, url, suffix = match.groups()
+        if url.startswith('/static/'):
+            target = url[len('/static/'):]
+        elif '://' in url or url.startswith(('/', 'data:')):
+            return match.group(0)
+        else:
+            target = posixpath.normpath(posixpath.join(directory, url))
+        if target not in manifest:
+            return match.group(0)
+        if url.startswith('/static/'):
+            url = '/static/' + manifest[target]
+        else:
+            url = posixpath.relpath(manifest[target], directory)
+        return 'url({0}{1}{2}{0})'.format(quote, url, suffix)
+
+    return _CSS_URL.sub(rewrite, content)
+
+
+def _write_hashed(static_dir, name, content):
+    root, ext = posixpath.splitext(name)
+    hashed = '{}.{}{}'.format(root, hashlib.sha256(content).hexdigest()[:12],
+                              ext)
+    path = os.path.join(static_dir, hashed)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+    if ext in COMPRESSIBLE:
+        # a fixed mtime keeps the builds reproducible
+        with open(path + '.gz', 'wb') as raw:
+            with gzip.GzipFile(filename='', mode='wb', fileobj=raw,
+                               mtime=0) as f:
+                f.write(content)
+        if os.path.getsize(path + '.gz') >= len(content):
+            os.remove(path + '.gz')
+    return hashed
+
+
+def _run_from_commandline():  # pragma: no cover
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-v', '--verbose', action='store_true')
+    parser.add_argument('--static-dir', default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'static'))
+    args = parser.parse_args()
+    log.setLevel(logging.DEBUG if args.verbose else logging.INFO)
+    build(args.static_dir)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    _run_from_commandline()
@@ -1,13 +1,17 @@
 # -*- coding: utf-8 -*-
 import gzip
+import hashlib
 import os
 import re
 import tempfile
+import time
 import zipfile
 
 from flask import current_app
 from werkzeug.utils import secure_filename
 
+import metrics
+
 from secure_tempfile import SecureTemporaryFile
 
 
@@ -16,6 +20,41 @@ VALIDATE_FILENAME = re.compile(
     "(?P<file_type>msg|doc\.(gz|zip)|reply)\.gpg$").match
 
 
+BULK_ARCHIVE_PREFIX = 'tmp_securedrop_bulk_dl_'
+VALIDATE_BULK_ARCHIVE = re.compile(
+    "^" + BULK_ARCHIVE_PREFIX + "[A-Za-z0-9_]+$").match
+
+
+def bulk_archive_entry(submission):
+    """Describe a :class:`models.Submission` for a bulk archive as a tuple
+    of plain data: (filesystem_id, filename, journalist_designation,
+    journalist_filename, date of the source's last update)."""
+    source = submission.source
+    return (source.filesystem_id,
+            submission.filename,
+            source.journalist_designation,
+            source.journalist_filename,
+            str(source.last_updated.date()))
+
+
+def bulk_archive_name(entries, zip_directory=''):
+    """Name the archive of `entries` after its content, so that requests for
+    the same selection share one archive."""
+    digest = hashlib.sha256(repr((sorted(entries), zip_directory)))
+    return BULK_ARCHIVE_PREFIX + digest.hexdigest()
+
+
+def build_bulk_archive(storage_path, temp_dir, name, entries,
+                       zip_directory='', max_age=None):
+    """Worker job: build the bulk archive `name`, after removing the
+    archives older than `max_age` seconds."""
+    storage = Storage(storage_path, temp_dir, None)
+    if max_age is not None:
+        storage.remove_expired_bulk_archives(max_age)
+    storage.build_bulk_archive(name, entries, zip_directory)
+    return "success"
+
+
 class PathException(Exception):
 
     """An exception raised by `util.verify` when it encounters a bad path. A path
@@ -76,38 +115,74 @@ class Storage:
         self.verify(absolute)
         return absolute
 
-    def get_bulk_archive(self, selected_submissions, zip_directory=''):
-        """Generate a zip file from the selected submissions"""
-        zip_file = tempfile.NamedTemporaryFile(
-            prefix='tmp_securedrop_bulk_dl_',
-            dir=self.__temp_dir,
-            delete=False)
-        sources = set([i.source.journalist_designation
-                       for i in selected_submissions])
+    def bulk_archive_path(self, name):
+        """Get the absolute path of the bulk archive `name`, as built by
+        :meth:`build_bulk_archive`, within the temp directory."""
+        if not VALIDATE_BULK_ARCHIVE(name):
+            raise PathException("Invalid bulk archive name %s" % (name, ))
+        return os.path.join(self.__temp_dir, name)
+
+    def write_bulk_archive(self, zip_file, entries, zip_directory=''):
+        """Write the submissions described by `entries` (see
+        :func:`bulk_archive_entry`) to `zip_file`. This only needs plain
+        data, so it can run in the worker as well as in a request."""
+        sources = set([entry[2] for entry in entries])
         # The below nested for-loops are there to create a more usable
         # folder structure per #383
         with zipfile.ZipFile(zip_file, 'w') as zip:
             for source in sources:
                 fname = ""
-                submissions = [s for s in selected_submissions
-                               if s.source.journalist_designation == source]
-                for submission in submissions:
-                    filename = self.path(submission.source.filesystem_id,
-                                         submission.filename)
+                submissions = [e for e in entries if e[2] == source]
+                for (filesystem_id, submission_filename, _,
+                     journalist_filename, last_updated) in submissions:
+                    filename = self.path(filesystem_id, submission_filename)
                     self.verify(filename)
-                    document_number = submission.filename.split('-')[0]
-                    if zip_directory == submission.source.journalist_filename:
+                    document_number = submission_filename.split('-')[0]
+                    if zip_directory == journalist_filename:
                         fname = zip_directory
                     else:
                         fname = os.path.join(zip_directory, source)
                     zip.write(filename, arcname=os.path.join(
                         fname,
-                        "%s_%s" % (document_number,
-                                   submission.source.last_updated.date()),
+                        "%s_%s" % (document_number, last_updated),
                         os.path.basename(filename)
                     ))
-        return zip_file
 
+    @metrics.timed('storage')
+    def build_bulk_archive(self, name, entries, zip_directory=''):
+        """Build the shared bulk archive `name` (see
+        :func:`bulk_archive_name`). The archive is written under a
+        temporary name and renamed into place once complete, so its mere
+        existence means it is ready to be downloaded."""
+        final_path = self.bulk_archive_path(name)
+        zip_file = tempfile.NamedTemporaryFile(
+            prefix='tmp_securedrop_bulk_build_',
+            dir=self.__temp_dir,
+            delete=False)
+        try:
+            with zip_file:
+                self.write_bulk_archive(zip_file, entries, zip_directory)
+            os.rename(zip_file.name, final_path)
+        except Exception:
+            os.remove(zip_file.name)
+            raise
+        return final_path
+
+    def remove_expired_bulk_archives(self, max_age):
+        """Remove the bulk archives, and leftovers of interrupted builds,
+        that are older than `max_age` seconds."""
+        now = time.time()
+        for name in os.listdir(self.__temp_dir):
+            if not name.startswith('tmp_securedrop_bulk_'):
+                continue
+            path = os.path.join(self.__temp_dir, name)
+            try:
+                if now - os.stat(path).st_mtime > max_age:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    @metrics.timed('storage')
     def save_file_submission(self, filesystem_id, count, journalist_filename,
                              filename, stream):
         sanitized_filename = secure_filename(filename)
@@ -145,6 +220,7 @@ class Storage:
 
         return encrypted_file_name
 
+    @metrics.timed('storage')
     def save_message_submission(self, filesystem_id, count,
                                 journalist_filename, message):
         filename = "{0}-{1}-msg.gpg".format(count, journalist_filename)
@@ -152,6 +228,7 @@ class Storage:
         current_app.crypto_util.encrypt(message, self.__gpg_key, msg_loc)
         return filename
 
+    @metrics.timed('storage')
     def rename_submission(self,
                           filesystem_id,
                           orig_filename,
@@ -0,0 +1,546 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Generate large synthetic datasets, for load and capacity testing.
+
+    ./synthetic_data.py generate --sources 10000 --placeholder
+    ./synthetic_data.py key-pool /var/tmp/key-pool --size 500
+    ./synthetic_data.py generate --sources 500 --key-pool /var/tmp/key-pool
+
+`generate` adds `--sources` sources to the database and store of the
+configured data root, each with a number of submissions and replies, and
+submissions of a size, drawn from the given distributions. Submissions are
+encrypted to the journalist key and replies to the keys of the source and
+of the journalist, like real ones. With `--placeholder`, random bytes of
+the size of the ciphertext are written instead, which is much faster.
+
+Only sources with a key can be replied to, and generating their 4096-bit
+keys is by far the slowest part. `key-pool` generates identities ahead of
+time: codenames, with their filesystem id and key. `generate --key-pool`
+then gives those identities to the first sources it creates. A pool only
+works with the peppers and scrypt parameters it was made with. The other
+sources only get a key with `--generate-keys`.
+
+The files are written by `--jobs` processes, and the database by the main
+one. A JSON manifest of the dataset is written to `--manifest`. It lists
+the codename of each source, so that load tests can log in as them. The
+same `--seed` gives the same counts, sizes and dates, whatever `--jobs`.
+
+Only ever run this against a development or test data root.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import math
+import multiprocessing
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+
+from datetime import datetime
+from sqlalchemy import func
+
+from crypto_util import CryptoUtil
+from db import db
+from models import Journalist, Reply, Source, SourceStar, Submission
+
+log = logging.getLogger(__name__)
+
+# The largest submission the source interface accepts
+MAX_SIZE = 500 * 1024 * 1024
+
+# Roughly what encrypting adds to the size of a file, per recipient key
+CIPHERTEXT_OVERHEAD = 550
+
+# Sources generated by each task given to a worker
+CHUNK_SIZE = 50
+
+KEY_POOL_FILENAME = 'pool.json'
+
+# Set in the main process before the workers are forked
+_worker_config = None
+_worker_crypto_util = None
+
+
+class Distribution(object):
+    """A distribution of non-negative integers, given as `N`, `MIN-MAX`
+    (uniform) or `lognormal:MEDIAN:SIGMA`."""
+
+    def __init__(self, spec):
+        self.spec = spec
+        if spec.startswith('lognormal:'):
+            _, median, sigma = spec.split(':')
+            self.__mu = math.log(float(median))
+            self.__sigma = float(sigma)
+            self.__range = None
+        elif '-' in spec:
+            low, high = spec.split('-')
+            self.__range = (int(low), int(high))
+        else:
+            self.__range = (int(spec), int(spec))
+        if self.__range and not 0 <= self.__range[0] <= self.__range[1]:
+            raise ValueError('invalid distribution: {}'.format(spec))
+
+    def sample(self, rng):
+        if self.__range:
+            return rng.randint(*self.__range)
+        return int(round(rng.lognormvariate(self.__mu, self.__sigma)))
+
+    def __repr__(self):
+        return self.spec
+
+
+def _as_distribution(value):
+    if isinstance(value, Distribution):
+        return value
+    return Distribution(str(value))
+
+
+def _crypto_util(config, gpg_key_dir=None):
+    return CryptoUtil(
+        scrypt_params=config.SCRYPT_PARAMS,
+        scrypt_id_pepper=config.SCRYPT_ID_PEPPER,
+        scrypt_gpg_pepper=config.SCRYPT_GPG_PEPPER,
+        securedrop_root=config.SECUREDROP_ROOT,
+        word_list=config.WORD_LIST,
+        nouns_file=config.NOUNS,
+        adjectives_file=config.ADJECTIVES,
+        gpg_key_dir=gpg_key_dir or config.GPG_KEY_DIR,
+    )
+
+
+def _init_worker():
+    global _worker_crypto_util
+    _worker_crypto_util = _crypto_util(_worker_config)
+
+
+def _map(function, tasks, jobs):
+    """Yield the results of `function` for each of `tasks`, run by `jobs`
+    worker processes, or in this process if `jobs` is 1."""
+    if jobs == 1:
+        _init_worker()
+        for task in tasks:
+            yield function(task)
+        return
+    pool = multiprocessing.Pool(jobs, initializer=_init_worker)
+    try:
+        for result in pool.imap_unordered(function, tasks):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _key_pool_digest(crypto_util):
+    """Identify the peppers and scrypt parameters that the identities of a
+    key pool depend on, without revealing them."""
+    return hashlib.sha256(json.dumps([crypto_util.scrypt_id_pepper,
+                                      crypto_util.scrypt_gpg_pepper,
+                                      crypto_util.scrypt_params],
+                                     sort_keys=True)).hexdigest()
+
+
+def _write_file(path, size, recipients, placeholder, compress=False):
+    """Write a file of `size` random bytes encrypted to `recipients`, or
+    random bytes of about the size of its ciphertext, at `path`, and return
+    its size."""
+    chunk = 1024 * 1024
+    if placeholder:
+        with open(path, 'wb') as f:
+            remaining = size + CIPHERTEXT_OVERHEAD * len(recipients)
+            while remaining > 0:
+                f.write(os.urandom(min(chunk, remaining)))
+                remaining -= chunk
+        return os.path.getsize(path)
+
+    with tempfile.TemporaryFile(dir=_worker_config.TEMP_DIR) as plaintext:
+        if compress:
+            out = gzip.GzipFile(filename='document', mode='wb',
+                                fileobj=plaintext)
+        else:
+            out = plaintext
+        for offset in range(0, size, chunk):
+            out.write(os.urandom(min(chunk, size - offset)))
+        if compress:
+            out.close()
+        plaintext.seek(0)
+        result = _worker_crypto_util.gpg.encrypt(plaintext, *recipients,
+                                                 output=path,
+                                                 always_trust=True,
+                                                 armor=False)
+    if not result.ok:
+        raise RuntimeError('could not encrypt {}: {}'.format(path,
+                                                             result.stderr))
+    return os.path.getsize(path)
+
+
+def _generate_sources(task):
+    """Worker task: create the identities and files of a chunk of sources,
+    and return their description."""
+    first_id, identities, count, seed, journalist_ids, parameters = task
+    config = _worker_config
+    crypto_util = _worker_crypto_util
+    now = time.time()
+    sources = []
+    for source_id in range(first_id, first_id + count):
+        # the same seed makes the same dataset, however it is chunked
+        index = source_id - parameters['first_id']
+        rng = random.Random(seed * 1000003 + index)
+        if identities:
+            identity = identities.pop(0)
+        else:
+            codename = crypto_util.genrandomid()
+            identity = {'codename': codename,
+                        'filesystem_id': crypto_util.hash_codename(codename),
+                        'fingerprint': None}
+            if parameters['generate_keys']:
+                identity['fingerprint'] = crypto_util.genkeypair(
+                    identity['filesystem_id'], codename).fingerprint
+        filesystem_id = identity['filesystem_id']
+        directory = os.path.join(config.STORE_DIR, filesystem_id)
+        os.mkdir(directory)
+        designation = crypto_util.display_id()
+        journalist_filename = Source(filesystem_id,
+                                     designation).journalist_filename
+
+        # the source submits first, then replies and submissions alternate
+        kinds = (['submission'] *
+                 max(1, parameters['submissions'].sample(rng)))
+        if identity['fingerprint'] and journalist_ids:
+            kinds += ['reply'] * parameters['replies'].sample(rng)
+        rng.shuffle(kinds)
+        kinds.remove('submission')
+        kinds.insert(0, 'submission')
+
+        submissions = []
+        replies = []
+        for interaction, kind in enumerate(kinds, 1):
+            if kind == 'reply':
+                filename = '{}-{}-reply.gpg'.format(interaction,
+                                                    journalist_filename)
+                size = _write_file(
+                    os.path.join(directory, filename),
+                    min(MAX_SIZE, parameters['message_size'].sample(rng)),
+                    [identity['fingerprint'], config.JOURNALIST_KEY],
+                    parameters['placeholder'])
+                replies.append({'filename': filename,
+                                'size': size,
+                                'journalist_id': rng.choice(journalist_ids)})
+                continue
+            document = rng.random() < parameters['document_ratio']
+            filename = '{}-{}-{}.gpg'.format(interaction, journalist_filename,
+                                             'doc.gz' if document else 'msg')
+            distribution = parameters['document_size' if document
+                                      else 'message_size']
+            size = _write_file(os.path.join(directory, filename),
+                               min(MAX_SIZE, distribution.sample(rng)),
+                               [config.JOURNALIST_KEY],
+                               parameters['placeholder'], compress=document)
+            submissions.append({
+                'filename': filename,
+                'size': size,
+                'downloaded': rng.random() < parameters['read_ratio']})
+
+        # like source_app.utils.normalize_timestamps
+        last_updated = int(now - rng.uniform(0, parameters['days'] * 86400))
+        for name in os.listdir(directory):
+            os.utime(os.path.join(directory, name),
+                     (last_updated, last_updated))
+
+        sources.append({
+            'id': source_id,
+            'filesystem_id': filesystem_id,
+            'codename': identity['codename'],
+            'journalist_designation': designation,
+            'last_updated': datetime.utcfromtimestamp(last_updated),
+            'starred': rng.random() < parameters['star_ratio'],
+            'has_key': identity['fingerprint'] is not None,
+            'interaction_count': len(kinds),
+            'submissions': submissions,
+            'replies': replies,
+        })
+    return sources
+
+
+def _insert(sources):
+    db.session.execute(Source.__table__.insert(), [
+        {'id': s['id'],
+         'filesystem_id': s['filesystem_id'],
+         'journalist_designation': s['journalist_designation'],
+         'last_updated': s['last_updated'],
+         'pending': False,
+         'interaction_count': s['interaction_count']}
+        for s in sources])
+    stars = [{'source_id': s['id'], 'starred': True}
+             for s in sources if s['starred']]
+    if stars:
+        db.session.execute(SourceStar.__table__.insert(), stars)
+    submissions = [dict(submission, source_id=s['id'])
+                   for s in sources for submission in s['submissions']]
+    db.session.execute(Submission.__table__.insert(), submissions)
+    replies = [dict(reply, source_id=s['id'])
+               for s in sources for reply in s['replies']]
+    if replies:
+        db.session.execute(Reply.__table__.insert(), replies)
+    db.session.commit()
+
+
+def _take_identities(config, crypto_util, key_pool, count):
+    """Return up to `count` unused identities from `key_pool`, after
+    importing their keys."""
+    with open(os.path.join(key_pool, KEY_POOL_FILENAME)) as f:
+        pool = json.load(f)
+    if pool['digest'] != _key_pool_digest(crypto_util):
+        raise ValueError('the key pool {} was made with other peppers or '
+                         'scrypt parameters'.format(key_pool))
+    used = set(filesystem_id for (filesystem_id,)
+               in db.session.query(Source.filesystem_id))
+    identities = [identity for identity in pool['identities']
+                  if identity['filesystem_id'] not in used][:count]
+    if identities:
+        # gnupg cannot import protected secret keys without a pinentry, which
+        # gpg does not need in batch mode
+        keys = '\n'.join(identity.pop('key') for identity in identities)
+        gpg = subprocess.Popen(
+            ['gpg2', '--homedir', config.GPG_KEY_DIR, '--batch',
+             '--import'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE)
+        error = gpg.communicate(keys)[1]
+        if gpg.returncode != 0:
+            raise RuntimeError('could not import the keys: {}'.format(error))
+    else:
+        log.warning('all the identities of the key pool are in use')
+    return identities
+
+
+def generate(config, sources, submissions='1-6', replies='0-3',
+             message_size='lognormal:1024:1',
+             document_size='lognormal:1048576:1.5', document_ratio=0.3,
+             star_ratio=0.1, read_ratio=0.7, days=90, placeholder=False,
+             key_pool=None, generate_keys=False, jobs=None, seed=None,
+             manifest=None):
+    """Add `sources` synthetic sources to the data root and database of
+    `config`, and return the manifest of the dataset, see the module
+    docstring. This must run in an application context."""
+    global _worker_config
+    _worker_config = config
+    crypto_util = _crypto_util(config)
+    start = time.time()
+    if seed is None:
+        seed = random.SystemRandom().randint(0, 2 ** 32)
+    jobs = jobs or multiprocessing.cpu_count()
+    first_id = (db.session.query(func.max(Source.id)).scalar() or 0) + 1
+    parameters = {
+        'first_id': first_id,
+        'submissions': _as_distribution(submissions),
+        'replies': _as_distribution(replies),
+        'message_size': _as_distribution(message_size),
+        'document_size': _as_distribution(document_size),
+        'document_ratio': document_ratio,
+        'star_ratio': star_ratio,
+        'read_ratio': read_ratio,
+        'days': days,
+        'placeholder': placeholder,
+        'generate_keys': generate_keys,
+    }
+
+    journalist_ids = [id for (id,) in db.session.query(Journalist.id)]
+    if not journalist_ids:
+        log.warning('there is no journalist to reply to the sources')
+    identities = []
+    if key_pool:
+        identities = _take_identities(config, crypto_util, key_pool,
+                                      sources)
+    tasks = []
+    for offset in range(0, sources, CHUNK_SIZE):
+        tasks.append((first_id + offset,
+                      identities[offset:offset + CHUNK_SIZE],
+                      min(CHUNK_SIZE, sources - offset),
+                      seed,
+                      journalist_ids,
+                      parameters))
+    # The database is only used by this process: close its connections
+    # before the workers are forked
+    db.session.remove()
+
+    generated = []
+    for chunk in _map(_generate_sources, tasks, jobs):
+        _insert(chunk)
+        generated.extend(chunk)
+        log.info('%d/%d sources', len(generated), sources)
+    generated.sort(key=lambda s: s['id'])
+
+    result = {
+        'parameters': dict(
+            ((name, repr(value) if isinstance(value, Distribution)
+              else value) for name, value in parameters.items()),
+            seed=seed, key_pool=key_pool),
+        'totals': {
+            'sources': len(generated),
+            'submissions': sum(len(s['submissions']) for s in generated),
+            'replies': sum(len(s['replies']) for s in generated),
+            'bytes': sum(f['size'] for s in generated
+                         for f in s['submissions'] + s['replies']),
+            'seconds': time.time() - start,
+        },
+        'sources': [dict(s, last_updated=s['last_updated'].isoformat() + 'Z',
+                         submissions=[f['filename'] for f in s['submissions']],
+                         replies=[f['filename'] for f in s['replies']])
+                    for s in generated],
+    }
+    if manifest:
+        with open(manifest, 'w') as f:
+            json.dump(result, f, indent=1, sort_keys=True)
+    return result
+
+
+def _generate_identity(directory):
+    """Worker task: generate an identity for a key pool, with its key in a
+    keyring of its own within `directory`."""
+    homedir = tempfile.mkdtemp(dir=directory)
+    crypto_util = _crypto_util(_worker_config, gpg_key_dir=homedir)
+    codename = crypto_util.genrandomid()
+    filesystem_id = crypto_util.hash_codename(codename)
+    try:
+        fingerprint = crypto_util.genkeypair(filesystem_id,
+                                             codename).fingerprint
+        public = crypto_util.gpg.export_keys(fingerprint)
+        # the secret key can only be exported with its passphrase
+        passphrase = crypto_util.hash_codename(
+            codename, salt=crypto_util.scrypt_gpg_pepper)
+        export = subprocess.Popen(
+            ['gpg2', '--homedir', homedir, '--batch', '--armor',
+             '--pinentry-mode', 'loopback', '--passphrase-fd', '0',
+             '--export-secret-keys', fingerprint],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE)
+        secret, error = export.communicate(passphrase + '\n')
+        if export.returncode != 0:
+            raise RuntimeError('could not export a key: {}'.format(error))
+    finally:
+        try:
+            subprocess.call(['gpgconf', '--homedir', homedir, '--kill',
+                             'gpg-agent'])
+        except OSError:
+            pass  # gpg 2.0 has no gpgconf --kill, nor a lingering agent
+        shutil.rmtree(homedir, ignore_errors=True)
+    return {'codename': codename,
+            'filesystem_id': filesystem_id,
+            'fingerprint': fingerprint,
+            'key': public + secret}
+
+
+def make_key_pool(config, directory, size, jobs=None):
+    """Generate `size` identities, with their keys, in `directory`."""
+    global _worker_config
+    _worker_config = config
+    if not os.path.isdir(directory):
+        os.makedirs(directory, 0o700)
+    identities = []
+    for identity in _map(_generate_identity, [directory] * size,
+                         jobs or multiprocessing.cpu_count()):
+        identities.append(identity)
+        log.info('%d/%d identities', len(identities), size)
+    pool = {'digest': _key_pool_digest(_crypto_util(config)),
+            'identities': identities}
+    with open(os.path.join(directory, KEY_POOL_FILENAME), 'w') as f:
+        json.dump(pool, f, indent=1)
+    return pool
+
+
+def _ratio(value):
+    value = float(value)
+    if not 0 <= value <= 1:
+        raise argparse.ArgumentTypeError('not between 0 and 1: {}'.format(
+            value))
+    return value
+
+
+def _run_from_commandline():  # pragma: no cover
+    import journalist_app
+    from sdconfig import config
+
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s')
+    log.setLevel(logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='worker processes (default: one per CPU)')
+    subparsers = parser.add_subparsers()
+
+    generate_parser = subparsers.add_parser(
+        'generate', help='add synthetic sources to the data root')
+    generate_parser.add_argument('--sources', type=int, default=1000)
+    generate_parser.add_argument(
+        '--submissions', type=Distribution, default='1-6',
+        help='submissions per source: N, MIN-MAX or '
+        'lognormal:MEDIAN:SIGMA (default: %(default)s)')
+    generate_parser.add_argument(
+        '--replies', type=Distribution, default='0-3',
+        help='replies per source with a key (default: %(default)s)')
+    generate_parser.add_argument(
+        '--message-size', type=Distribution, default='lognormal:1024:1',
+        help='bytes per message and reply (default: %(default)s)')
+    generate_parser.add_argument(
+        '--document-size', type=Distribution,
+        default='lognormal:1048576:1.5',
+        help='bytes per document (default: %(default)s)')
+    generate_parser.add_argument('--document-ratio', type=_ratio,
+                                 default=0.3,
+                                 help='share of the submissions that are '
+                                 'documents (default: %(default)s)')
+    generate_parser.add_argument('--star-ratio', type=_ratio, default=0.1)
+    generate_parser.add_argument('--read-ratio', type=_ratio, default=0.7,
+                                 help='share of the submissions that have '
+                                 'been downloaded (default: %(default)s)')
+    generate_parser.add_argument('--days', type=float, default=90,
+                                 help='spread the last updates of the '
+                                 'sources over that many days')
+    generate_parser.add_argument('--placeholder', action='store_true',
+                                 help='write random bytes instead of '
+                                 'encrypting')
+    generate_parser.add_argument('--key-pool',
+                                 help='take identities from this key pool')
+    generate_parser.add_argument('--generate-keys', action='store_true',
+                                 help='generate a key for the sources which '
+                                 'get none from the key pool')
+    generate_parser.add_argument('--seed', type=int)
+    generate_parser.add_argument(
+        '--manifest', default=os.path.join(config.SECUREDROP_DATA_ROOT,
+                                           'synthetic-data.json'))
+    generate_parser.set_defaults(command='generate')
+
+    pool_parser = subparsers.add_parser(
+        'key-pool', help='generate identities for generate --key-pool')
+    pool_parser.add_argument('directory')
+    pool_parser.add_argument('--size', type=int, default=100)
+    pool_parser.set_defaults(command='key-pool')
+    args = parser.parse_args()
+
+    if args.command == 'key-pool':
+        make_key_pool(config, args.directory, args.size, jobs=args.jobs)
+        return
+
+    with journalist_app.create_app(config).app_context():
+        result = generate(
+            config, args.sources, submissions=args.submissions,
+            replies=args.replies, message_size=args.message_size,
+            document_size=args.document_size,
+            document_ratio=args.document_ratio, star_ratio=args.star_ratio,
+            read_ratio=args.read_ratio, days=args.days,
+            placeholder=args.placeholder, key_pool=args.key_pool,
+            generate_keys=args.generate_keys, jobs=args.jobs, seed=args.seed,
+            manifest=args.manifest)
+    log.info('%(sources)d sources, %(submissions)d submissions, '
+             '%(replies)d replies, %(bytes)d bytes in %(seconds).1fs',
+             result['totals'])
+    log.info('manifest written to %s', args.manifest)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    _run_from_commandline()
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""Share the compiled templates between the web processes, and across their
+restarts, through a bytecode cache in TEMPLATE_CACHE_DIR (by default
+`template_cache` in the data root; set it to None to disable the cache)."""
+import os
+
+from jinja2 import FileSystemBytecodeCache
+
+
+def setup_app(config, app):
+    template_cache_dir = getattr(
+        config, 'TEMPLATE_CACHE_DIR',
+        os.path.join(config.SECUREDROP_DATA_ROOT, 'template_cache'))
+    if not template_cache_dir:
+        return
+    try:
+        os.makedirs(template_cache_dir, 0o700)
+    except OSError:
+        pass  # it already exists
+    # without a cache, templates are still compiled by every process
+    if os.access(template_cache_dir, os.W_OK):
+        app.jinja_env.bytecode_cache = \
+            FileSystemBytecodeCache(template_cache_dir)
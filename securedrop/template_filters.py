@@ -39,7 +39,10 @@ def filesizeformat(value):
     # on purpose
     #
     if value < base:
-        return units.format_unit(value, "byte", locale=locale, length="long")
+        # "digital-byte" rather than "byte", which Babel would otherwise
+        # look up among all the units of the locale on every call
+        return units.format_unit(value, "digital-byte", locale=locale,
+                                 length="long")
     else:
         i = min(int(math.log(value, base)), len(prefixes)) - 1
         prefix = prefixes[i]
@@ -9,6 +9,8 @@ import shutil
 import signal
 import subprocess
 
+from contextlib import contextmanager
+
 os.environ['SECUREDROP_ENV'] = 'test'  # noqa
 from sdconfig import SDConfig, config as original_config
 
@@ -16,8 +18,10 @@ from os import path
 
 from db import db
 from journalist_app import create_app as create_journalist_app
+from query_counter import QueryCounter
 from source_app import create_app as create_source_app
 import utils
+import worker
 
 # TODO: the PID file for the redis worker is hard-coded below.
 # Ideally this constant would be provided by a test harness.
@@ -25,6 +29,12 @@ import utils
 # in order to isolate the test vars from prod vars.
 TEST_WORKER_PIDFILE = '/tmp/securedrop_test_worker.pid'
 
+# The background jobs are run by threads of the test process, so that the
+# tests need neither Redis nor a worker, and the failed jobs are retried
+# at once, so that the tests never wait for them.
+worker.set_queue(worker.LocalQueue())
+worker.RETRY_BACKOFF = 0
+
 # Quiet down gnupg output. (See Issue #2595)
 gnupg_logger = logging.getLogger(gnupg.__name__)
 gnupg_logger.setLevel(logging.ERROR)
@@ -80,6 +90,9 @@ def config(tmpdir):
     cnf.GPG_KEY_DIR = str(keys)
     cnf.STORE_DIR = str(store)
     cnf.TEMP_DIR = str(tmp)
+    cnf.TEMPLATE_CACHE_DIR = str(data.join('template_cache'))
+    cnf.METRICS_DIR = str(data.join('metrics'))
+    cnf.MAINTENANCE_DIR = str(data.join('maintenance'))
     cnf.DATABASE_FILE = str(sqlite)
 
     return cnf
@@ -101,6 +114,20 @@ def journalist_app(config):
     return app
 
 
+@pytest.fixture(scope='function')
+def query_budget():
+    '''Fail the test if the code run within `with query_budget(n):` runs
+    more than `n` SQL queries, or runs the same query more than
+    `max_repeats` times, the way N+1 query patterns do.'''
+    @contextmanager
+    def budget(max_queries, max_repeats=1):
+        with QueryCounter() as counter:
+            yield counter
+        assert counter.count <= max_queries, counter.report()
+        assert not counter.repeated(max_repeats + 1), counter.report()
+    return budget
+
+
 @pytest.fixture(scope='function')
 def test_journo(journalist_app):
     with journalist_app.app_context():
@@ -139,7 +166,7 @@ def test_source(journalist_app):
 def _start_test_rqworker(config):
     if not psutil.pid_exists(_get_pid_from_file(TEST_WORKER_PIDFILE)):
         tmp_logfile = open('/tmp/test_rqworker.log', 'w')
-        subprocess.Popen(['rqworker', 'test',
+        subprocess.Popen(['rqworker', 'test-interactive', 'test-bulk',
                           '-P', config.SECUREDROP_ROOT,
                           '--pid', TEST_WORKER_PIDFILE],
                          stdout=tmp_logfile,
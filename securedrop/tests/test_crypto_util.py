@@ -3,6 +3,7 @@ import os
 import unittest
 
 from flask import current_app
+from mock import patch
 
 os.environ['SECUREDROP_ENV'] = 'test'  # noqa
 from sdconfig import config
@@ -33,6 +34,26 @@ class TestCryptoUtil(unittest.TestCase):
                               + current_app.crypto_util.nouns
                               + current_app.crypto_util.adjectives))
 
+    def test_keyring_and_word_lists_are_loaded_on_first_use(self):
+        with patch('gnupg.GPG') as GPG:
+            cu = CryptoUtil(
+                scrypt_params=config.SCRYPT_PARAMS,
+                scrypt_id_pepper=config.SCRYPT_ID_PEPPER,
+                scrypt_gpg_pepper=config.SCRYPT_GPG_PEPPER,
+                securedrop_root=config.SECUREDROP_ROOT,
+                word_list=config.WORD_LIST,
+                nouns_file=config.NOUNS,
+                adjectives_file='/nonexistent',
+                gpg_key_dir=config.GPG_KEY_DIR)
+            assert not GPG.called
+            assert cu.gpg is cu.gpg
+            GPG.assert_called_once_with(binary='gpg2',
+                                        homedir=config.GPG_KEY_DIR)
+
+        assert cu.nouns == current_app.crypto_util.nouns
+        with self.assertRaises(IOError):
+            cu.adjectives
+
     def test_clean(self):
         ok = (' !#%$&)(+*-1032547698;:=?@acbedgfihkjmlonqpsrutwvyxzABCDEFGHIJ'
               'KLMNOPQRSTUVWXYZ')
@@ -206,6 +227,24 @@ class TestCryptoUtil(unittest.TestCase):
         """
         current_app.crypto_util.delete_reply_keypair('Reality Winner')
 
+    def test_delete_reply_keypairs_single_keyring_operation(self):
+        source_1, _ = utils.db_helper.init_source()
+        source_2, _ = utils.db_helper.init_source()
+        crypto = current_app.crypto_util
+
+        with patch.object(crypto.gpg, 'list_keys',
+                          wraps=crypto.gpg.list_keys) as list_keys:
+            with patch.object(crypto.gpg, 'delete_keys',
+                              wraps=crypto.gpg.delete_keys) as delete_keys:
+                crypto.delete_reply_keypairs([source_1.filesystem_id,
+                                              source_2.filesystem_id,
+                                              'never flagged'])
+
+        self.assertEqual(list_keys.call_count, 1)
+        self.assertEqual(delete_keys.call_count, 2)
+        self.assertIsNone(crypto.getkey(source_1.filesystem_id))
+        self.assertIsNone(crypto.getkey(source_2.filesystem_id))
+
     def test_getkey(self):
         source, _ = utils.db_helper.init_source()
 
@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
 import pytest
+import sqlite3
 
-from mock import MagicMock
+from mock import MagicMock, patch
 
+import query_counter
+
+from db import db
 from utils import db_helper
-from models import (Journalist, Submission, Reply, get_one_or_else,
+from models import (Change, Journalist, Submission, Reply, get_one_or_else,
                     LoginThrottledException)
 
 
@@ -90,3 +94,38 @@ def test_journalist_string_representation(journalist_app, test_journo):
 def test_source_string_representation(journalist_app, test_source):
     with journalist_app.app_context():
         test_source['source'].__repr__()
+
+
+def test_connections_overwrite_deleted_content(journalist_app):
+    with journalist_app.app_context():
+        db.engine.dispose()
+        with db.engine.connect() as connection:
+            assert connection.execute('PRAGMA secure_delete').scalar() == 1
+
+    # whatever the default of the SQLite library
+    off = sqlite3.connect(':memory:')
+    off.execute('PRAGMA secure_delete = OFF')
+    with journalist_app.app_context():
+        with patch.object(db.engine.dialect.dbapi, 'connect',
+                          return_value=off):
+            with db.engine.connect() as connection:
+                assert connection.execute(
+                    'PRAGMA secure_delete').scalar() == 1
+
+
+def test_changes_are_journalled_with_one_query_for_their_sources(
+        journalist_app):
+    with journalist_app.app_context():
+        submissions = []
+        for _ in range(3):
+            source, _ = db_helper.init_source()
+            submissions += db_helper.submit(source, 2)
+        db.session.expunge_all()
+        submissions = Submission.query.all()
+        for submission in submissions:
+            submission.downloaded = True
+
+        with query_counter.QueryCounter() as counter:
+            db.session.commit()
+        assert counter.repeated(2) == []
+        assert Change.query.filter_by(action=Change.UPDATE).count() == 6
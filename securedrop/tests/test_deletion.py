@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import os
+import pytest
+
+from flask import current_app
+from mock import patch
+
+import deletion
+import rm
+import utils
+
+from models import Source, Submission
+
+
+def test_delete_items_removes_rows_and_queues_one_job(journalist_app,
+                                                      test_source):
+    with journalist_app.app_context():
+        source = Source.query.filter_by(
+            filesystem_id=test_source['filesystem_id']).one()
+        submissions = utils.db_helper.submit(source, 3)
+        paths = [current_app.storage.path(source.filesystem_id, s.filename)
+                 for s in submissions]
+
+        with patch('worker.enqueue') as enqueue:
+            deletion.delete_items(source.filesystem_id, submissions)
+
+        assert Submission.query.filter_by(source_id=source.id).count() == 0
+        assert enqueue.call_count == 1
+        args, _ = enqueue.call_args
+        assert args == (rm.secure_delete_batch, paths)
+
+
+def test_queue_paths_batches_per_source_directory(journalist_app):
+    with journalist_app.app_context():
+        paths = [current_app.storage.path('a', '1-a-msg.gpg'),
+                 current_app.storage.path('b', '1-b-msg.gpg'),
+                 current_app.storage.path('a', '2-a-reply.gpg'),
+                 current_app.storage.path('c')]
+
+        with patch('worker.enqueue') as enqueue:
+            jobs = deletion.queue_paths(paths)
+
+        assert len(jobs) == 3
+        batches = [call[0][1] for call in enqueue.call_args_list]
+        assert batches == [[paths[0], paths[2]], [paths[1]], [paths[3]]]
+
+
+def test_shred_overwrites_and_unlinks(tmpdir):
+    path = str(tmpdir.join('1-a-msg.gpg'))
+    with open(path, 'wb') as f:
+        f.write('secret' * 1000)
+
+    with patch.object(os, 'fsync', wraps=os.fsync) as fsync:
+        assert rm.shred(path, passes=2, buffer_size=1024) == 6000
+    # one fsync per overwrite pass, plus one after truncating
+    assert fsync.call_count == 3
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test_secure_delete_directory(tmpdir):
+    source_dir = tmpdir.mkdir('source')
+    source_dir.join('1-a-msg.gpg').write('a' * 10)
+    source_dir.join('2-a-reply.gpg').write('b' * 20)
+
+    stats = rm.secure_delete([str(source_dir), str(tmpdir.join('gone'))],
+                             passes=1)
+
+    assert not source_dir.check()
+    assert stats['files'] == 2
+    assert stats['bytes'] == 30
+
+
+def test_secure_delete_reports_failures_after_processing_others(tmpdir):
+    tmpdir.join('ok').write('x')
+    tmpdir.join('stuck').write('x')
+    real_shred = rm.shred
+
+    def flaky_shred(path, *args):
+        if path.endswith('stuck'):
+            raise OSError('nope')
+        return real_shred(path, *args)
+
+    with patch.object(rm, 'shred', side_effect=flaky_shred):
+        with pytest.raises(rm.SecureDeletionError) as exc:
+            rm.secure_delete([str(tmpdir.join('stuck')),
+                              str(tmpdir.join('ok'))])
+    assert exc.value.failed == [str(tmpdir.join('stuck'))]
+    assert not tmpdir.join('ok').check()
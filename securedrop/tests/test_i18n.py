@@ -24,6 +24,7 @@ import unittest
 
 from flask import request, session, render_template_string, render_template
 from flask_babel import gettext
+from mock import patch
 from werkzeug.datastructures import Headers
 
 os.environ['SECUREDROP_ENV'] = 'test'  # noqa
@@ -296,3 +297,52 @@ class TestI18N(unittest.TestCase):
         resp = app.get('/generate?l=fr_FR', follow_redirects=True)
         html = resp.data.decode('utf-8')
         assert re.compile('<html .*lang="fr".*>').search(html), html
+
+    def test_accept_languages_negotiation_is_cached(self):
+        fake_config = self.get_fake_config()
+        fake_config.SUPPORTED_LOCALES = ['fr_FR', 'en_US']
+        app = journalist_app.create_app(fake_config)
+
+        def negotiate(accept_language):
+            headers = Headers([('Accept-Language', accept_language)])
+            with app.test_request_context(headers=headers):
+                return i18n.get_locale(fake_config)
+
+        with patch.object(i18n.core, 'negotiate_locale',
+                          wraps=i18n.core.negotiate_locale) as negotiated:
+            assert negotiate('fr-FR') == 'fr_FR'
+            assert negotiate('fr-FR') == 'fr_FR'
+            assert negotiated.call_count == 1
+            assert negotiate('en-US') == 'en_US'
+            assert negotiated.call_count == 2
+
+            with patch.object(i18n, 'ACCEPT_LANGUAGES_CACHE_SIZE', 1):
+                assert negotiate('fr') == 'fr_FR'
+                assert negotiated.call_count == 3
+                # 'fr-FR' was evicted to make room for 'fr'
+                assert negotiate('fr-FR') == 'fr_FR'
+                assert negotiated.call_count == 4
+
+    def test_locale_names_follow_supported_locales(self):
+        fake_config = self.get_fake_config()
+        fake_config.SUPPORTED_LOCALES = ['en_US']
+        journalist_app.create_app(fake_config)
+        assert i18n.get_locale2name().keys() == ['en_US']
+
+        fake_config.SUPPORTED_LOCALES = ['fr_FR', 'en_US']
+        journalist_app.create_app(fake_config)
+        assert i18n.get_locale2name().items() == [('fr_FR', u'français'),
+                                                  ('en_US', u'English')]
+        assert i18n.get_text_direction('fr_FR') == 'ltr'
+        assert i18n.get_text_direction('ar') == 'rtl'
+
+    def test_message_catalogs_are_loaded_once_per_process(self):
+        fake_config = self.get_fake_config()
+        fake_config.SUPPORTED_LOCALES = ['fr_FR', 'en_US']
+        app = source_app.create_app(fake_config).test_client()
+        with patch.object(i18n.support.Translations, 'load',
+                          wraps=i18n.support.Translations.load) as load:
+            for _ in range(2):
+                resp = app.get('/?l=fr_FR')
+                assert 'lang="fr"' in resp.data
+        assert load.call_count == 1
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import json
 import os
 import pytest
 import random
@@ -6,19 +7,23 @@ import unittest
 import zipfile
 
 from cStringIO import StringIO
+from datetime import datetime
 from flask import url_for, escape, session, current_app, g
 from flask_testing import TestCase
-from mock import patch
+from mock import Mock, patch
 from pyotp import TOTP
 from sqlalchemy.sql.expression import func
 from sqlalchemy.orm.exc import StaleDataError
 from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import NotFound
 
 import crypto_util
 import models
 import journalist
 import journalist_app as journalist_app_module
+import store
 import utils
+import worker
 
 os.environ['SECUREDROP_ENV'] = 'test'  # noqa
 from sdconfig import SDConfig, config
@@ -132,6 +137,15 @@ def test_nonempty_replies_are_accepted(journalist_app, test_journo,
         assert EMPTY_REPLY_TEXT not in text
 
 
+def test_custom_header_image_credits_securedrop(config):
+    config.CUSTOM_HEADER_IMAGE = 'custom.png'
+    app = journalist_app_module.create_app(config)
+    with app.test_client() as client:
+        resp = client.get('/login')
+        url = app.jinja_env.globals['static_url']('i/securedrop_small.png')
+    assert 'src="{}" alt="SecureDrop"'.format(url) in resp.data
+
+
 def test_unauthorized_access_redirects_to_login(journalist_app):
     with journalist_app.test_client() as app:
         with InstrumentedApp(journalist_app) as ins:
@@ -291,6 +305,74 @@ def test_admin_logout_redirects_to_index(journalist_app, test_admin):
             ins.assert_redirects(resp, '/')
 
 
+def test_admin_views_request_metrics(journalist_app, test_admin):
+    with journalist_app.test_client() as app:
+        _login_user(app, test_admin['username'], test_admin['password'],
+                    test_admin['otp_secret'])
+        resp = app.get('/admin/metrics')
+        assert resp.status_code == 200
+        text = resp.data.decode('utf-8')
+        assert 'id="metrics-journalist"' in text
+        assert '<td>main.login</td>' in text
+
+        resp = app.get('/admin/metrics.txt')
+        assert resp.headers['Content-Type'].startswith('text/plain')
+        assert ('securedrop_request_duration_seconds_count'
+                '{interface="journalist",endpoint="admin.request_metrics"} 1'
+                ) in resp.data
+
+
+def test_user_cannot_view_request_metrics(journalist_app, test_journo):
+    with journalist_app.test_client() as app:
+        _login_user(app, test_journo['username'], test_journo['password'],
+                    test_journo['otp_secret'])
+        for url in ('/admin/metrics', '/admin/metrics.txt'):
+            resp = app.get(url)
+            assert resp.status_code == 302
+            assert 'securedrop_' not in resp.data
+
+
+def test_admin_views_jobs(journalist_app, test_admin):
+    queue = worker.LocalQueue()
+    saved_queue = worker.set_queue(queue)
+    try:
+        failed = worker.enqueue(int, 'nan', job_id='failed-job',
+                                description='parse a number')
+        queue.join()
+        with journalist_app.test_client() as app:
+            _login_user(app, test_admin['username'], test_admin['password'],
+                        test_admin['otp_secret'])
+            resp = app.get('/admin/jobs')
+            assert resp.status_code == 200
+            text = resp.data.decode('utf-8')
+            assert '<td>interactive</td>' in text
+            assert '<td>parse a number</td>' in text
+            assert 'invalid literal for int()' in text
+            assert '<td>clean_tmp</td>' in text
+
+            resp = app.post('/admin/jobs/failed-job/requeue')
+            assert resp.status_code == 302
+            queue.join()
+            assert failed.is_failed
+
+            resp = app.post('/admin/jobs/failed-job/discard',
+                            follow_redirects=True)
+            assert 'No job has failed.' in resp.data
+            assert worker.fetch_job('failed-job') is None
+            assert app.post('/admin/jobs/failed-job/discard'
+                            ).status_code == 404
+    finally:
+        worker.set_queue(saved_queue)
+
+
+def test_user_cannot_view_jobs(journalist_app, test_journo):
+    with journalist_app.test_client() as app:
+        _login_user(app, test_journo['username'], test_journo['password'],
+                    test_journo['otp_secret'])
+        assert app.get('/admin/jobs').status_code == 302
+        assert app.post('/admin/jobs/some-job/discard').status_code == 302
+
+
 def test_user_logout_redirects_to_index(journalist_app, test_journo):
     with journalist_app.test_client() as app:
         with InstrumentedApp(journalist_app) as ins:
@@ -548,6 +630,285 @@ def test_admin_edits_user_password_too_long_warning(journalist_app,
                                        'Password not changed.', 'error')
 
 
+def test_download_single_submission_supports_ranges(journalist_app,
+                                                    test_journo,
+                                                    test_source):
+    with journalist_app.app_context():
+        source = Source.query.filter_by(
+            filesystem_id=test_source['filesystem_id']).one()
+        submission = utils.db_helper.submit(source, 1)[0]
+        url = '/col/{}/{}'.format(source.filesystem_id, submission.filename)
+        with open(journalist_app.storage.path(source.filesystem_id,
+                                              submission.filename)) as f:
+            content = f.read()
+
+    with journalist_app.test_client() as app:
+        _login_user(app, test_journo['username'], test_journo['password'],
+                    test_journo['otp_secret'])
+        resp = app.get(url)
+        assert resp.status_code == 200
+        assert resp.headers['Accept-Ranges'] == 'bytes'
+        etag = resp.headers['ETag']
+        assert resp.data == content
+
+        resp = app.get(url, headers={'Range': 'bytes=10-',
+                                     'If-Range': etag})
+        assert resp.status_code == 206
+        assert resp.data == content[10:]
+
+        resp = app.get(url, headers={'If-None-Match': etag})
+        assert resp.status_code == 304
+        assert resp.data == ''
+
+
+def test_bulk_archive_url_is_resumable(journalist_app, test_journo,
+                                       test_source):
+    with journalist_app.app_context():
+        source = Source.query.filter_by(
+            filesystem_id=test_source['filesystem_id']).one()
+        submissions = utils.db_helper.submit(source, 2)
+        selected = [submission.filename for submission in submissions]
+
+    with journalist_app.test_client() as app:
+        _login_user(app, test_journo['username'], test_journo['password'],
+                    test_journo['otp_secret'])
+        resp = app.post('/bulk', data=dict(
+            action='download',
+            filesystem_id=test_source['filesystem_id'],
+            doc_names_selected=selected))
+        assert resp.status_code == 302
+        archive_url = resp.location
+
+        resp = app.get(archive_url)
+        assert resp.status_code == 200
+        assert resp.content_type == 'application/zip'
+        content = resp.data
+
+        # the same URL can be used to resume the download
+        resp = app.get(archive_url, headers={'Range': 'bytes=100-'})
+        assert resp.status_code == 206
+        assert resp.data == content[100:]
+
+
+def test_bulk_archive_url_expires(journalist_app, test_journo, test_source):
+    with journalist_app.app_context():
+        source = Source.query.filter_by(
+            filesystem_id=test_source['filesystem_id']).one()
+        submissions = utils.db_helper.submit(source, 1)
+        entries = [store.bulk_archive_entry(s) for s in submissions]
+        archive_name = store.bulk_archive_name(entries)
+        os.utime(journalist_app.storage.build_bulk_archive(archive_name,
+                                                           entries),
+                 (0, 0))
+
+    with journalist_app.test_client() as app:
+        _login_user(app, test_journo['username'], test_journo['password'],
+                    test_journo['otp_secret'])
+        resp = app.get('/col/archive/{}/all.zip'.format(archive_name))
+        assert resp.status_code == 404
+        resp = app.get('/col/archive/not_an_archive/all.zip')
+        assert resp.status_code == 404
+
+
+def test_identical_bulk_downloads_share_one_archive(journalist_app,
+                                                    test_journo,
+                                                    test_source):
+    with journalist_app.app_context():
+        source = Source.query.filter_by(
+            filesystem_id=test_source['filesystem_id']).one()
+        submissions = utils.db_helper.submit(source, 2)
+        selected = [submission.filename for submission in submissions]
+
+    with patch.object(journalist_app.storage, 'build_bulk_archive',
+                      wraps=journalist_app.storage.build_bulk_archive) \
+            as build_bulk_archive:
+        with journalist_app.test_client() as app:
+            _login_user(app, test_journo['username'],
+                        test_journo['password'], test_journo['otp_secret'])
+            locations = []
+            for _ in range(2):
+                resp = app.post('/bulk', data=dict(
+                    action='download',
+                    filesystem_id=test_source['filesystem_id'],
+                    doc_names_selected=selected))
+                assert resp.status_code == 302
+                locations.append(resp.location.rsplit('/', 1)[0])
+
+    assert locations[0] == locations[1]
+    assert build_bulk_archive.call_count == 1
+
+
+def test_large_bulk_download_is_built_by_worker(journalist_app, test_journo,
+                                                test_source):
+    journalist_app.sdconfig.BULK_ARCHIVE_ASYNC_THRESHOLD = 0
+    with journalist_app.app_context():
+        source = Source.query.filter_by(
+            filesystem_id=test_source['filesystem_id']).one()
+        submissions = utils.db_helper.submit(source, 2)
+        selected = [submission.filename for submission in submissions]
+
+    with journalist_app.test_client() as app:
+        _login_user(app, test_journo['username'], test_journo['password'],
+                    test_journo['otp_secret'])
+        resp = app.post('/bulk', data=dict(
+            action='download',
+            filesystem_id=test_source['filesystem_id'],
+            doc_names_selected=selected))
+        assert resp.status_code == 302
+        archive = resp.location.split('/')[-2]
+
+        utils.async.wait_for_redis_worker(worker.fetch_job(archive))
+
+        archive_url = resp.location
+        resp = app.get(archive_url + '&status')
+        assert json.loads(resp.data) == {'status': 'ready'}
+        resp = app.get(archive_url)
+        assert resp.status_code == 200
+        assert resp.content_type == 'application/zip'
+
+
+def test_bulk_archive_progress_page(journalist_app, test_journo):
+    job = Mock(is_failed=False, is_finished=False, meta={})
+    archive = store.BULK_ARCHIVE_PREFIX + 'being_built'
+    url = '/col/archive/{}/all.zip'.format(archive)
+
+    with patch('worker.fetch_job', return_value=job):
+        with journalist_app.test_client() as app:
+            _login_user(app, test_journo['username'],
+                        test_journo['password'], test_journo['otp_secret'])
+            resp = app.get(url)
+            assert resp.status_code == 202
+            assert 'id="archive-status" data-status="building"' in resp.data
+
+            resp = app.get(url + '?status')
+            assert json.loads(resp.data) == {'status': 'building'}
+
+            # failed, but to be retried
+            job.is_failed = True
+            job.meta['retry_at'] = datetime.utcnow()
+            resp = app.get(url + '?status')
+            assert json.loads(resp.data) == {'status': 'building'}
+            assert app.get(url).status_code == 202
+
+            del job.meta['retry_at']
+            resp = app.get(url + '?status')
+            assert json.loads(resp.data) == {'status': 'failed'}
+
+            # back to the collection, or the index, with an error
+            resp = app.get(url + '?filesystem_id=abc')
+            assert resp.status_code == 302
+            assert resp.location.endswith('/col/abc')
+            resp = app.get(url, follow_redirects=True)
+            assert resp.status_code == 200
+            assert 'The archive could not be prepared.' in resp.data
+
+            job.is_failed = False
+            job.is_finished = True
+            resp = app.get(url)
+            assert resp.status_code == 404
+
+
+def _init_listed_sources(count):
+    filesystem_ids = []
+    for _ in range(count):
+        source, _ = utils.db_helper.init_source()
+        source.pending = False
+        utils.db_helper.submit(source, 2)
+        filesystem_ids.append(source.filesystem_id)
+    return filesystem_ids
+
+
+def test_index_reuses_cached_source_rows(journalist_app, test_journo):
+    with journalist_app.app_context():
+        filesystem_ids = _init_listed_sources(2)
+    cache = journalist_app.source_row_cache
+
+    with journalist_app.test_client() as app:
+        _login_user(app, test_journo['username'],
+                    test_journo['password'], test_journo['otp_secret'])
+        # logging in rendered the index, and its rows, once
+        assert cache.stats()['misses'] == 2
+        resp = app.get('/')
+        assert cache.stats()['hits'] == 2
+        assert cache.stats()['misses'] == 2
+        assert 'id="un-starred-source-link-2"' in resp.data
+        assert '2 unread' in resp.data
+        assert 'ago</time>' in resp.data
+
+        # only the row of the source that changed is rendered again
+        app.post('/col/add_star/' + filesystem_ids[0])
+        resp = app.get('/')
+        assert cache.stats()['misses'] == 3
+        text = resp.data.decode('utf-8')
+        assert 'id="starred-source-link-1"' in text
+        assert 'id="un-starred-source-link-1"' in text
+        assert 'id="un-starred-source-link-2"' not in text
+
+        app.post('/col/process', data=dict(action='download-unread',
+                                           cols_selected=filesystem_ids[1]))
+        resp = app.get('/')
+        assert cache.stats()['misses'] == 4
+        assert resp.data.count('2 unread') == 1
+
+
+def test_key_views_query_budgets(journalist_app, test_journo, query_budget):
+    """The number of queries run by the views listing or downloading
+    several collections must not grow with the number of collections."""
+    with journalist_app.app_context():
+        filesystem_ids = _init_listed_sources(10)
+
+    with journalist_app.test_client() as app:
+        _login_user(app, test_journo['username'],
+                    test_journo['password'], test_journo['otp_secret'])
+        with query_budget(4):
+            assert app.get('/').status_code == 200
+        with query_budget(4):
+            assert app.get('/col/' + filesystem_ids[0]).status_code == 200
+        with query_budget(4):
+            resp = app.post('/col/process', data=dict(
+                action='download-unread', cols_selected=filesystem_ids))
+            assert resp.status_code == 302
+        with query_budget(2):
+            resp = app.post('/col/process', data=dict(
+                action='download-all', cols_selected=filesystem_ids))
+            assert resp.status_code == 302
+
+
+def test_index_forgets_rows_of_deleted_sources(journalist_app, test_journo):
+    with journalist_app.app_context():
+        filesystem_ids = _init_listed_sources(2)
+    cache = journalist_app.source_row_cache
+
+    with journalist_app.test_client() as app:
+        _login_user(app, test_journo['username'],
+                    test_journo['password'], test_journo['otp_secret'])
+        app.get('/')
+        assert len(cache) == 2
+
+        app.post('/col/delete/' + filesystem_ids[0])
+        resp = app.get('/')
+        assert len(cache) == 1
+        assert filesystem_ids[0] not in resp.data
+
+
+def test_source_rows_are_cached_per_locale(journalist_app):
+    with journalist_app.app_context():
+        _init_listed_sources(1)
+
+    with journalist_app.test_request_context('/'):
+        source = Source.query.one()
+        source.num_unread = 2
+        source.docs_msgs_count = {'messages': 2, 'documents': 0}
+        cache = journalist_app.source_row_cache
+        for locale in ('en_US', 'fr_FR', 'en_US'):
+            g.locale = locale
+            rows = journalist_app_module.utils.render_source_rows([source])
+            assert 'id="un-starred-source-link-1"' in rows[0]
+        assert cache.stats()['misses'] == 2
+        assert cache.stats()['hits'] == 1
+        assert len(cache) == 2
+
+
 class TestJournalistApp(TestCase):
 
     # A method required by flask_testing.TestCase
@@ -1028,6 +1389,11 @@ class TestJournalistApp(TestCase):
         urls = [url_for('main.index'), url_for('col.col', filesystem_id='1'),
                 url_for('col.download_single_submission',
                         filesystem_id='1', fn='1'),
+                url_for('col.download_archive',
+                        archive='tmp_securedrop_bulk_dl_1', filename='1'),
+                url_for('api.changes'), url_for('api.sources'),
+                url_for('api.submissions', filesystem_id='1'),
+                url_for('api.replies', filesystem_id='1'),
                 url_for('account.edit')]
 
         for url in urls:
@@ -1184,6 +1550,45 @@ class TestJournalistApp(TestCase):
         # Encrypted documents no longer exist
         self.assertFalse(os.path.exists(dir_source_docs))
 
+    def test_delete_collections_bulk(self):
+        """Deleting several collections at once uses one commit, one keyring
+        scan and one deletion job."""
+        sources = [utils.db_helper.init_source()[0] for _ in range(3)]
+        for source in sources:
+            utils.db_helper.submit(source, 2)
+            utils.db_helper.reply(self.user, source, 1)
+        filesystem_ids = [source.filesystem_id for source in sources]
+
+        crypto = current_app.crypto_util
+        with patch.object(db.session, 'commit',
+                          wraps=db.session.commit) as commit, \
+                patch.object(crypto.gpg, 'list_keys',
+                             wraps=crypto.gpg.list_keys) as list_keys, \
+                patch('worker.enqueue') as enqueue:
+            journalist_app_module.utils.delete_collections(filesystem_ids)
+
+        self.assertEqual(commit.call_count, 1)
+        self.assertEqual(list_keys.call_count, 1)
+        self.assertEqual(enqueue.call_count, 1)
+        self.assertEqual(
+            enqueue.call_args[0][1],
+            [current_app.storage.path(filesystem_id)
+             for filesystem_id in filesystem_ids])
+        self.assertEqual(Source.query.count(), 0)
+        self.assertEqual(Submission.query.count(), 0)
+        self.assertEqual(Reply.query.count(), 0)
+        for filesystem_id in filesystem_ids:
+            self.assertIsNone(crypto.getkey(filesystem_id))
+
+    def test_delete_collections_unknown_source_deletes_nothing(self):
+        source, _ = utils.db_helper.init_source()
+        with patch('worker.enqueue') as enqueue:
+            with self.assertRaises(NotFound):
+                journalist_app_module.utils.delete_collections(
+                    [source.filesystem_id, 'does not exist'])
+        self.assertFalse(enqueue.called)
+        self.assertEqual(Source.query.count(), 1)
+
     def test_download_selected_submissions_from_source(self):
         source, _ = utils.db_helper.init_source()
         submissions = utils.db_helper.submit(source, 4)
@@ -1196,7 +1601,8 @@ class TestJournalistApp(TestCase):
         resp = self.client.post(
             '/bulk', data=dict(action='download',
                                filesystem_id=source.filesystem_id,
-                               doc_names_selected=selected_fnames))
+                               doc_names_selected=selected_fnames),
+            follow_redirects=True)
 
         # The download request was succesful, and the app returned a zipfile
         self.assertEqual(resp.status_code, 200)
@@ -1260,7 +1666,8 @@ class TestJournalistApp(TestCase):
             url_for('col.process'),
             data=dict(action='download-unread',
                       cols_selected=[self.source0.filesystem_id,
-                                     self.source1.filesystem_id]))
+                                     self.source1.filesystem_id]),
+            follow_redirects=True)
 
         # The download request was succesful, and the app returned a zipfile
         self.assertEqual(self.resp.status_code, 200)
@@ -1322,12 +1729,14 @@ class TestJournalistApp(TestCase):
         self.resp = self.client.post(
             url_for('col.process'),
             data=dict(action='download-all',
-                      cols_selected=[self.source1.filesystem_id]))
+                      cols_selected=[self.source1.filesystem_id]),
+            follow_redirects=True)
 
         resp = self.client.post(
             url_for('col.process'),
             data=dict(action='download-all',
-                      cols_selected=[self.source1.filesystem_id]))
+                      cols_selected=[self.source1.filesystem_id]),
+            follow_redirects=True)
 
         # The download request was succesful, and the app returned a zipfile
         self.assertEqual(resp.status_code, 200)
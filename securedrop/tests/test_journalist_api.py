@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+from datetime import datetime, timedelta
+from flask import g, session, url_for
+from mock import patch
+from pyotp import TOTP
+
+os.environ['SECUREDROP_ENV'] = 'test'  # noqa
+import maintenance
+import utils
+
+from db import db
+from journalist_app import create_app
+from models import Journalist, Source
+
+
+def _login_user(app, user):
+    resp = app.post('/login', data={'username': user['username'],
+                                    'password': user['password'],
+                                    'token': TOTP(user['otp_secret']).now()},
+                    follow_redirects=True)
+    assert resp.status_code == 200
+    assert hasattr(g, 'user')  # ensure logged in
+
+
+def _get_changes(app, **params):
+    resp = app.get('/api/v1/changes', query_string=params)
+    assert resp.status_code == 200
+    assert resp.content_type == 'application/json'
+    return json.loads(resp.data)
+
+
+def test_changes_requires_login(journalist_app):
+    with journalist_app.test_client() as app:
+        resp = app.get('/api/v1/changes')
+        assert resp.status_code == 302
+        assert resp.location.endswith('/login')
+
+
+def test_changes_since_cursor(journalist_app, test_journo, test_source):
+    filesystem_id = test_source['filesystem_id']
+
+    with journalist_app.test_client() as app:
+        _login_user(app, test_journo)
+        cursor = _get_changes(app)['cursor']
+
+        with journalist_app.app_context():
+            source = Source.query.filter_by(
+                filesystem_id=filesystem_id).one()
+            source.pending = False
+            submission = utils.db_helper.submit(source, 1)[0]
+            submission_filename = submission.filename
+
+        resp = app.post('/col/add_star/' + filesystem_id)
+        assert resp.status_code == 302
+
+        data = _get_changes(app, since=cursor)
+        assert not data['has_more']
+        assert [(c['type'], c['action'], c['filesystem_id'], c['filename'])
+                for c in data['changes']] == [
+            ('source', 'add', filesystem_id, None),
+            ('submission', 'add', filesystem_id, submission_filename),
+            ('star', 'update', filesystem_id, None),
+        ]
+        cursor = data['cursor']
+        assert cursor == data['changes'][-1]['cursor']
+
+        # nothing new since the last cursor
+        data = _get_changes(app, since=cursor)
+        assert data == {'cursor': cursor, 'has_more': False, 'changes': []}
+
+
+def test_changes_pagination(journalist_app, test_journo, test_source):
+    with journalist_app.app_context():
+        source = Source.query.filter_by(
+            filesystem_id=test_source['filesystem_id']).one()
+        utils.db_helper.submit(source, 3)
+
+    with journalist_app.test_client() as app:
+        _login_user(app, test_journo)
+        cursor = 0
+        filenames = []
+        while True:
+            data = _get_changes(app, since=cursor, limit=2)
+            assert len(data['changes']) <= 2
+            filenames += [c['filename'] for c in data['changes']]
+            cursor = data['cursor']
+            if not data['has_more']:
+                break
+
+        assert len(filenames) == 3
+
+        resp = app.get('/api/v1/changes?since=notanumber')
+        assert resp.status_code == 400
+
+
+def test_deleted_source_history_is_purged(journalist_app, test_journo,
+                                          test_source):
+    filesystem_id = test_source['filesystem_id']
+    with journalist_app.app_context():
+        source = Source.query.filter_by(filesystem_id=filesystem_id).one()
+        source.pending = False
+        utils.db_helper.submit(source, 2)
+        db.session.commit()
+
+    with journalist_app.test_client() as app:
+        _login_user(app, test_journo)
+        cursor = _get_changes(app)['cursor']
+
+        resp = app.post('/col/delete/' + filesystem_id)
+        assert resp.status_code == 302
+
+        # the deletion is reported after the cursor, and is all that is left
+        # of the source's history, without its filesystem_id
+        data = _get_changes(app)
+        assert [(c['type'], c['action'], c['filename'])
+                for c in data['changes']] == [('source', 'delete', None)]
+        assert data['changes'][0]['filesystem_id'] != filesystem_id
+        assert data['cursor'] > cursor
+
+
+def test_changes_since_purged_deletions(journalist_app, test_journo,
+                                        test_source):
+    with journalist_app.app_context():
+        source = Source.query.filter_by(
+            filesystem_id=test_source['filesystem_id']).one()
+        utils.db_helper.submit(source, 2)
+        for _ in range(2):
+            maintenance.run('prune_changes', journalist_app.sdconfig)
+        purged = maintenance.status(
+            journalist_app.sdconfig)['prune_changes']['result']['purged']
+        assert purged > 1
+
+    with journalist_app.test_client() as app:
+        _login_user(app, test_journo)
+        resp = app.get('/api/v1/changes', query_string={'since': 1})
+        assert resp.status_code == 410
+        assert _get_changes(app, since=purged)['changes'] == []
+        assert _get_changes(app)['cursor'] == purged
+
+
+def _get(app, url, status=200, **params):
+    resp = app.get(url, query_string=params)
+    assert resp.status_code == status
+    return resp
+
+
+def test_sources_pagination_and_fields(journalist_app, test_journo):
+    with journalist_app.app_context():
+        filesystem_ids = []
+        for _ in range(3):
+            source, _ = utils.db_helper.init_source()
+            source.pending = False
+            utils.db_helper.submit(source, 2)
+            filesystem_ids.append(source.filesystem_id)
+        # pending sources are not listed
+        utils.db_helper.init_source()
+
+    with journalist_app.test_client() as app:
+        _login_user(app, test_journo)
+
+        data = json.loads(_get(app, '/api/v1/sources').data)
+        assert [s['filesystem_id'] for s in data['sources']] == \
+            filesystem_ids
+        assert data['sources'][0]['submissions_count'] == 2
+        assert data['sources'][0]['starred'] is None
+
+        listed = []
+        cursor = 0
+        while True:
+            data = json.loads(_get(app, '/api/v1/sources', limit=2,
+                                   after=cursor,
+                                   fields='filesystem_id').data)
+            assert all(s.keys() == ['filesystem_id']
+                       for s in data['sources'])
+            listed += [s['filesystem_id'] for s in data['sources']]
+            cursor = data['cursor']
+            if not data['has_more']:
+                break
+        assert listed == filesystem_ids
+
+        _get(app, '/api/v1/sources', status=400, fields='codename')
+        _get(app, '/api/v1/sources', status=400, after='last')
+
+
+def test_sources_etag(journalist_app, test_journo, test_source):
+    filesystem_id = test_source['filesystem_id']
+    with journalist_app.app_context():
+        source = Source.query.filter_by(filesystem_id=filesystem_id).one()
+        source.pending = False
+        utils.db_helper.submit(source, 1)
+
+    with journalist_app.test_client() as app:
+        _login_user(app, test_journo)
+
+        resp = _get(app, '/api/v1/sources')
+        etag = resp.headers['ETag']
+        resp = app.get('/api/v1/sources', headers={'If-None-Match': etag})
+        assert resp.status_code == 304
+        assert resp.headers['ETag'] == etag
+
+        # another selection of fields has another ETag
+        resp = _get(app, '/api/v1/sources', fields='filesystem_id')
+        assert resp.headers['ETag'] != etag
+
+        app.post('/col/add_star/' + filesystem_id)
+        resp = app.get('/api/v1/sources', headers={'If-None-Match': etag})
+        assert resp.status_code == 200
+        assert json.loads(resp.data)['sources'][0]['starred'] is True
+
+
+def test_source_submissions_and_replies(journalist_app, test_journo,
+                                        test_source):
+    filesystem_id = test_source['filesystem_id']
+    with journalist_app.app_context():
+        source = Source.query.filter_by(filesystem_id=filesystem_id).one()
+        submissions = utils.db_helper.submit(source, 3)
+        filenames = [submission.filename for submission in submissions]
+        last_size = submissions[-1].size
+        journalist = Journalist.query.get(test_journo['id'])
+        reply = utils.db_helper.reply(journalist, source, 1)[0]
+        reply_filename = reply.filename
+
+    url = '/api/v1/sources/{}/submissions'.format(filesystem_id)
+    with journalist_app.test_client() as app:
+        _login_user(app, test_journo)
+
+        data = json.loads(_get(app, url, limit=2).data)
+        assert [s['filename'] for s in data['submissions']] == filenames[:2]
+        assert data['has_more']
+        submission = data['submissions'][0]
+        assert submission['downloaded'] is False
+        with journalist_app.test_request_context():
+            assert submission['url'] == url_for(
+                'col.download_single_submission',
+                filesystem_id=filesystem_id, fn=filenames[0])
+
+        data = json.loads(_get(app, url, limit=2, after=data['cursor'],
+                               fields='filename,size').data)
+        assert data['submissions'] == [
+            {'filename': filenames[2], 'size': last_size}]
+        assert not data['has_more']
+
+        # downloading a submission changes the submissions' ETag
+        etag = _get(app, url).headers['ETag']
+        assert app.get(url, headers={'If-None-Match': etag}) \
+                  .status_code == 304
+        _get(app, '/col/{}/{}'.format(filesystem_id, filenames[0]))
+        resp = app.get(url, headers={'If-None-Match': etag})
+        assert resp.status_code == 200
+        assert json.loads(resp.data)['submissions'][0]['downloaded'] is True
+
+        data = json.loads(_get(
+            app, '/api/v1/sources/{}/replies'.format(filesystem_id)).data)
+        assert [r['filename'] for r in data['replies']] == [reply_filename]
+
+        _get(app, '/api/v1/sources/not-a-source/submissions', status=404)
+
+
+def test_notifications_of_new_submissions(journalist_app, test_journo,
+                                          test_source):
+    filesystem_id = test_source['filesystem_id']
+
+    with journalist_app.test_client() as app:
+        _login_user(app, test_journo)
+        data = json.loads(_get(app, '/api/v1/notifications').data)
+        assert data['sources'] == []
+        cursor = data['cursor']
+
+        with journalist_app.app_context():
+            source = Source.query.filter_by(
+                filesystem_id=filesystem_id).one()
+            submissions = utils.db_helper.submit(source, 2)
+            submissions[0].downloaded = True
+            db.session.commit()
+
+        data = json.loads(_get(app, '/api/v1/notifications', since=cursor,
+                               timeout=0).data)
+        assert data['sources'] == [
+            {'filesystem_id': filesystem_id, 'new': 2, 'unread': 1}]
+        cursor = data['cursor']
+
+        data = json.loads(_get(app, '/api/v1/notifications', since=cursor,
+                               timeout=0).data)
+        assert data == {'cursor': cursor, 'sources': []}
+
+
+def test_notifications_wait_for_submissions(journalist_app, test_journo,
+                                            test_source):
+    filesystem_id = test_source['filesystem_id']
+
+    def submit_while_waiting(timeout):
+        with journalist_app.app_context():
+            source = Source.query.filter_by(
+                filesystem_id=filesystem_id).one()
+            utils.db_helper.submit(source, 1)
+        return True
+
+    with journalist_app.test_client() as app:
+        _login_user(app, test_journo)
+        cursor = json.loads(_get(app, '/api/v1/notifications').data)['cursor']
+
+        with patch('notifications.Subscription.wait',
+                   side_effect=submit_while_waiting) as wait:
+            data = json.loads(_get(app, '/api/v1/notifications',
+                                   since=cursor).data)
+        wait.assert_called_once_with(25)
+        assert data['sources'] == [
+            {'filesystem_id': filesystem_id, 'new': 1, 'unread': 1}]
+
+
+def test_notifications_past_the_long_polls_answer_right_away(
+        config, journalist_app, test_journo):
+    config.MAX_LONG_POLLS = 1
+    journalist_app = create_app(config)
+    polls = []
+
+    def poll_while_waiting(timeout):
+        # a second poll, while the first one waits
+        other = journalist_app.test_client()
+        other.cookie_jar = app.cookie_jar
+        polls.append(json.loads(_get(other, '/api/v1/notifications',
+                                     since=cursor).data))
+        return False
+
+    with journalist_app.test_client() as app:
+        _login_user(app, test_journo)
+        cursor = json.loads(_get(app, '/api/v1/notifications').data)['cursor']
+
+        with patch('notifications.Subscription.wait',
+                   side_effect=poll_while_waiting) as wait:
+            data = json.loads(_get(app, '/api/v1/notifications',
+                                   since=cursor).data)
+        wait.assert_called_once_with(25)
+        assert data == polls[0] == {'cursor': cursor, 'sources': []}
+
+        # the first poll is over: the next one waits again
+        with patch('notifications.Subscription.wait',
+                   return_value=False) as wait:
+            _get(app, '/api/v1/notifications', since=cursor)
+        wait.assert_called_once_with(25)
+
+
+def test_notifications_do_not_extend_the_session(journalist_app,
+                                                 test_journo):
+    with journalist_app.test_client() as app:
+        _login_user(app, test_journo)
+        expires = datetime.utcnow().replace(microsecond=0) + \
+            timedelta(minutes=1)
+        with app.session_transaction() as sess:
+            sess['expires'] = expires
+
+        _get(app, '/api/v1/notifications', since=0, timeout=0)
+        assert session['expires'] == expires
+
+        # unlike any other request
+        _get(app, '/api/v1/changes')
+        assert session['expires'] > expires
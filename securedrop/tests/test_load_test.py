@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import os
+
+os.environ['SECUREDROP_ENV'] = 'test'  # noqa
+import load_test
+import notifications
+import worker
+
+from db import db
+from models import Reply, Source, Submission
+from utils.db_helper import init_source, submit
+
+
+def test_percentile():
+    values = range(1, 101)
+    assert load_test.percentile(values, 50) == 50
+    assert load_test.percentile(values, 99) == 99
+    assert load_test.percentile([7], 95) == 7
+
+
+def test_local_redis():
+    saved = worker.get_queue()
+    with load_test.local_redis() as queue:
+        job = worker.enqueue(sum, [1, 2], job_id='sum')
+        with notifications.Subscription() as subscription:
+            notifications.publish_submissions('abc', 1)
+            assert subscription.wait(1)
+        queue.join()
+        assert worker.fetch_job('sum').is_finished
+        assert job.result == 3
+    assert worker.get_queue() is saved
+
+
+def test_source_sessions(journalist_app):
+    result = load_test.run(
+        journalist_app.sdconfig, users=2, duration=None, flows=6,
+        mix={'new_source': 1, 'returning_source': 1}, think_time=0,
+        message_size='100', file_size='1000', file_ratio=0.5, seed=1)
+
+    steps = result['steps']
+    assert sum(flow['count'] for flow in result['flows'].values()) == 6
+    assert not any(flow['failed'] for flow in result['flows'].values())
+    assert not any(step['errors'] for step in steps.values())
+    assert steps['source.lookup']['count'] == 12
+    assert steps['source.login']['count'] + \
+        steps['source.create']['count'] == 6
+    with journalist_app.app_context():
+        assert Source.query.count() == steps['source.create']['count']
+        assert Submission.query.count() >= 6
+
+
+def test_journalist_sessions(journalist_app):
+    with journalist_app.app_context():
+        source, _ = init_source()
+        source.pending = False
+        submit(source, 2)
+        path = journalist_app.storage.path(source.filesystem_id)
+
+    result = load_test.run(
+        journalist_app.sdconfig, users=1, duration=None, flows=2,
+        mix={'journalist': 1}, think_time=0, message_size='10',
+        reply_ratio=1, delete_ratio=1, seed=1)
+
+    steps = result['steps']
+    assert result['flows'] == {'journalist': {'count': 2, 'failed': 0}}
+    for step in ('login', 'index', 'col', 'download', 'reply', 'delete'):
+        assert steps['journalist.' + step] == dict(
+            steps['journalist.' + step], count=2, errors=0)
+    with journalist_app.app_context():
+        assert Reply.query.count() == 2
+        assert Submission.query.count() == 0
+        db.session.remove()
+    # the files of the deleted submissions are shredded by the worker
+    assert len(os.listdir(path)) == 2
+    assert all(name.endswith('-reply.gpg') for name in os.listdir(path))
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+import os
+import sqlite3
+import time
+
+from datetime import datetime, timedelta
+
+os.environ['SECUREDROP_ENV'] = 'test'  # noqa
+import maintenance
+import worker
+
+from db import db
+from models import Change, JournalistLoginAttempt
+from utils.db_helper import init_journalist, init_source, submit
+
+
+def test_remove_old_files(tmpdir):
+    old, young = tmpdir.join('old'), tmpdir.join('young')
+    for f in (old, young):
+        f.write('')
+    week_ago = time.time() - 7 * 24 * 60 * 60
+    os.utime(str(old), (week_ago, week_ago))
+    tmpdir.mkdir('directory')
+
+    removed, kept = maintenance.remove_old_files(str(tmpdir), 24 * 60 * 60)
+    assert removed == [str(old)]
+    assert kept == [str(young)]
+    assert sorted(os.listdir(str(tmpdir))) == ['directory', 'young']
+
+
+def test_prune_login_attempts(journalist_app):
+    with journalist_app.app_context():
+        journalist, _ = init_journalist()
+        for days in (0, 6, 8):
+            attempt = JournalistLoginAttempt(journalist)
+            attempt.timestamp = datetime.utcnow() - timedelta(days=days)
+            db.session.add(attempt)
+        db.session.commit()
+
+        result = maintenance.run('prune_login_attempts',
+                                 journalist_app.sdconfig)
+        assert result['deleted'] == 1
+        assert result['seconds'] >= 0
+        assert JournalistLoginAttempt.query.count() == 2
+
+    run = maintenance.status(journalist_app.sdconfig)['prune_login_attempts']
+    assert run['status'] == 'finished'
+    assert run['result'] == result
+    assert datetime.utcnow() - run['started_at'] < timedelta(minutes=1)
+
+
+def test_prune_changes(journalist_app):
+    config = journalist_app.sdconfig
+    with journalist_app.app_context():
+        source, _ = init_source()
+        source.pending = False
+        submissions = submit(source, 2)
+        db.session.delete(submissions[0])
+        db.session.commit()
+        assert Change.query.filter_by(action=Change.DELETE).count() == 1
+
+        # the deletions are kept until the run after the one which saw them
+        result = maintenance.run('prune_changes', config)
+        assert (result['deleted'], result['purged']) == (0, 0)
+        assert result['cursor'] == Change.last_id()
+        db.session.delete(submissions[1])
+        db.session.commit()
+        result = maintenance.run('prune_changes', config)
+        assert result['deleted'] == 1
+        assert Change.query.filter_by(action=Change.DELETE).count() == 1
+        assert result['purged'] < result['cursor'] == Change.last_id()
+
+
+def test_incremental_vacuum(config):
+    connection = sqlite3.connect(config.DATABASE_FILE, isolation_level=None)
+    connection.execute('PRAGMA auto_vacuum = FULL')
+    connection.execute('CREATE TABLE t (x)')
+    # databases created with FULL are switched to INCREMENTAL
+    assert maintenance.incremental_vacuum(config) == {'freed': 0, 'free': 0}
+    with maintenance._connect(config) as other:
+        assert other.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+        assert other.execute('PRAGMA secure_delete').fetchone()[0] == 1
+
+    def fill_and_empty():
+        connection.executemany('INSERT INTO t VALUES (?)',
+                               [('x' * 1000,)] * 1000)
+        connection.execute('DELETE FROM t')
+        return connection.execute('PRAGMA freelist_count').fetchone()[0]
+
+    free = fill_and_empty()
+    assert free > 100
+    config.VACUUM_PAGES_PER_STEP = 100
+    assert maintenance.incremental_vacuum(config) == {'freed': free,
+                                                      'free': 0}
+
+    # time-boxed
+    free = fill_and_empty()
+    config.VACUUM_PAGES_PER_STEP = 1
+    config.VACUUM_TIME_BUDGET = 0.3
+    result = maintenance.incremental_vacuum(config)
+    assert 0 < result['freed'] < free
+    assert result['free'] == free - result['freed']
+
+
+def test_schedule(config, monkeypatch):
+    # the jobs use the configuration of the worker
+    monkeypatch.setattr('sdconfig.config', config)
+    config.MAINTENANCE_INTERVALS = {'analyze': 0}
+    sqlite3.connect(config.DATABASE_FILE).close()
+    queue = worker.LocalQueue()
+    saved_queue = worker.set_queue(queue)
+    try:
+        jobs = maintenance.schedule(config)
+        assert [job.id for job in jobs] == [
+            'maintenance-clean_tmp', 'maintenance-prune_login_attempts',
+            'maintenance-prune_changes', 'maintenance-incremental_vacuum']
+        assert jobs[0].origin == 'bulk'
+        # not queued again while queued
+        assert maintenance.schedule(config) == []
+        queue.join()
+    finally:
+        worker.set_queue(saved_queue)
+
+    runs = maintenance.status(config)
+    assert runs['clean_tmp']['status'] == 'finished'
+    # the login attempts table does not exist in this database
+    assert runs['prune_login_attempts']['status'] == 'failed'
+    assert 'no such table' in runs['prune_login_attempts']['result']['error']
+    assert 'analyze' not in runs
+    assert jobs[0].meta['maintenance'] == runs['clean_tmp']['result']
+
+    queue = worker.LocalQueue()
+    saved_queue = worker.set_queue(queue)
+    try:
+        assert maintenance.schedule(config) == []
+        later = datetime.utcnow() + timedelta(hours=2)
+        assert [job.id for job in maintenance.schedule(config, later)] == [
+            'maintenance-prune_login_attempts',
+            'maintenance-incremental_vacuum']
+        queue.join()
+    finally:
+        worker.set_queue(saved_queue)
@@ -8,17 +8,19 @@ from sdconfig import config
 import logging
 import manage
 import mock
+import subprocess
 from sqlalchemy.orm.exc import NoResultFound
 from StringIO import StringIO
 import sys
 import time
 import unittest
 import utils
+import worker
 
 import journalist_app
 
 from db import db
-from models import Journalist
+from models import Change, Journalist
 
 
 YUBIKEY_HOTP = ['cb a0 5f ad 41 a2 ff 4e eb 53 56 3a 1b f7 23 2e ce fc dc',
@@ -202,3 +204,54 @@ class TestManage(object):
         manage.setup_verbosity(args)
         manage.clean_tmp(args)
         assert 'FILE removed' in caplog.text
+
+    def test_jobs(self, capsys, monkeypatch):
+        queue = worker.LocalQueue()
+        monkeypatch.setattr(worker, '_queue', queue)
+        worker.enqueue(int, 'nan', job_id='failed-job')
+        queue.join()
+        args = argparse.Namespace(requeue=[], discard=[])
+        assert manage.jobs(args) == 0
+        out = capsys.readouterr()[0]
+        assert out.splitlines()[1].startswith('interactive ')
+        assert 'failed-job int (bulk, 1 attempt(s)): ValueError' in out
+
+        args = argparse.Namespace(requeue=[], discard=['failed-job'])
+        assert manage.jobs(args) == 0
+        assert 'Failed jobs' not in capsys.readouterr()[0]
+        assert manage.jobs(args) == 1
+
+    def test_maintenance(self, capsys):
+        args = argparse.Namespace(status=False, run=['clean_tmp', 'analyze'])
+        assert manage.run_maintenance(args) == 0
+        out = capsys.readouterr()[0]
+        assert 'clean_tmp took ' in out and 'analyze took ' in out
+
+        args = argparse.Namespace(status=True, run=[])
+        assert manage.run_maintenance(args) == 0
+        out = capsys.readouterr()[0]
+        assert 'clean_tmp: finished at ' in out
+        assert 'removed 0' in out
+        assert 'prune_login_attempts: never run (every 3600s)' in out
+
+    def test_upgrade_db(self):
+        # the schema of the databases created before the journal of changes
+        Change.__table__.drop(db.engine)
+        args = argparse.Namespace()
+        manage.upgrade_db(args)
+        manage.upgrade_db(args)
+
+        source, _ = utils.db_helper.init_source()
+        utils.db_helper.submit(source, 1)
+        assert Change.query.filter_by(
+            filesystem_id=source.filesystem_id).count() == 1
+
+    def test_clean_tmp_does_not_load_the_web_stack(self):
+        # clean-tmp and maintenance run from cron, and should start quickly
+        loaded = subprocess.check_output(
+            [sys.executable, '-c',
+             'import sys, manage; '
+             'print(sorted(set(sys.modules) & '
+             'set(["journalist_app", "models", "flask", "sqlalchemy"])))'],
+            cwd=dirname(dirname(abspath(__file__))))
+        assert loaded.strip() == '[]'
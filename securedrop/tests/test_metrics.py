@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+
+from flask import g, session
+from mock import patch
+
+os.environ['SECUREDROP_ENV'] = 'test'  # noqa
+import metrics
+
+from utils.db_helper import new_codename
+
+
+def test_histogram():
+    histogram = metrics.Histogram()
+    for seconds in (0.0005, 0.002, 0.003, 0.2, 30):
+        histogram.observe(seconds)
+    assert histogram.count == 5
+    assert histogram.quantile(0.5) == 0.005
+    assert histogram.quantile(1) == float('inf')
+
+    other = metrics.Histogram.from_dict(histogram.to_dict())
+    other.merge(histogram)
+    assert other.count == 10
+    assert other.total == 2 * histogram.total
+
+
+def test_nested_work_is_only_counted_once(source_app):
+    clock = iter(range(100))
+    with source_app.test_request_context('/'), \
+            patch('time.time', side_effect=lambda: next(clock)):
+        g._request_timings = metrics._RequestTimings()  # t = 0
+        with metrics.timed('storage'):  # 1
+            with metrics.timed('gpg'):  # 2
+                pass  # 3
+        # 4
+        with metrics.timed('storage'):  # 5
+            pass  # 6
+        assert g._request_timings.timings == {'storage': 3, 'gpg': 1}
+
+
+def test_work_outside_of_requests_is_ignored(source_app):
+    with source_app.app_context():
+        with metrics.timed('gpg'):
+            pass
+        source_app.crypto_util.hash_codename('abc')
+
+
+def test_requests_are_timed(source_app):
+    with source_app.test_client() as app:
+        codename = new_codename(app, session)
+        app.post('/login', data=dict(codename=codename))
+        app.get('/does-not-exist')
+
+    merged = source_app.metrics.collect()['source']
+    login = merged['latency']['main.login']
+    assert login.count == 1
+    assert login.total > 0
+    breakdown = merged['breakdown']['main.login']
+    assert breakdown['hash_codename'].total > 0
+    assert breakdown['db'].total > 0
+    assert breakdown['gpg'].count == 1
+    assert breakdown['gpg'].total == 0
+    assert login.total >= sum(h.total for h in breakdown.values())
+    assert merged['latency']['unmatched'].count == 1
+
+
+def test_metrics_of_other_processes_are_merged(source_app, journalist_app):
+    with source_app.test_client() as app:
+        app.get('/')
+    with journalist_app.test_client() as app:
+        app.get('/login')
+    with patch('os.getpid', return_value=1):
+        source_app.metrics.dump()
+    source_app.metrics.dump()
+    assert len(os.listdir(source_app.metrics.dump_dir)) == 2
+    # dumps of processes that are gone are eventually left out
+    old = time.time() - metrics.STALE_DUMP_AGE - 1
+    os.utime(source_app.metrics.dump_path, (old, old))
+
+    merged = journalist_app.metrics.collect()
+    assert merged['source']['latency']['main.index'].count == 1
+    assert merged['journalist']['latency']['main.login'].count == 1
+
+    text = metrics.exposition(merged)
+    assert ('securedrop_request_duration_seconds_count'
+            '{interface="source",endpoint="main.index"} 1') in text
+    assert ('securedrop_request_time_seconds_bucket{interface="journalist",'
+            'endpoint="main.login",category="gpg",le="0.001"} 1') in text
+    assert 'securedrop_source_row_cache_hits{interface="journalist"}' in text
+    assert 'securedrop_metadata_response_served{interface="source"}' in text
+
+
+def test_metrics_are_dumped_periodically(source_app):
+    with source_app.test_client() as app:
+        app.get('/')
+        assert not os.listdir(source_app.metrics.dump_dir)
+        with patch.object(metrics, 'DUMP_INTERVAL', 0):
+            app.get('/')
+    assert os.listdir(source_app.metrics.dump_dir) == [
+        os.path.basename(source_app.metrics.dump_path)]
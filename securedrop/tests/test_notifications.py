@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+
+import pytest
+from mock import patch
+from redis import Redis
+from redis.exceptions import ConnectionError
+
+os.environ['SECUREDROP_ENV'] = 'test'  # noqa
+import notifications
+import worker
+
+
+@pytest.fixture
+def redis():
+    redis = Redis()
+    saved = notifications.set_redis(redis)
+    yield redis
+    notifications.set_redis(saved)
+
+
+def test_subscription_is_woken_up_by_publication(redis):
+    with notifications.Subscription() as subscription:
+        notifications.publish_submissions('filesystem-id', 2)
+        assert subscription.wait(5)
+
+
+def test_subscription_times_out(redis):
+    with notifications.Subscription() as subscription:
+        start = time.time()
+        assert not subscription.wait(0.2)
+        assert time.time() - start >= 0.2
+
+
+def test_publish_failure_is_logged(redis):
+    with patch.object(redis, 'publish', side_effect=ConnectionError), \
+            patch.object(notifications.log, 'warning') as warning:
+        notifications.publish_submissions('filesystem-id', 1)
+    assert warning.called
+
+
+def test_subscription_without_redis_waits_out_the_timeout(redis):
+    with patch.object(redis, 'pubsub', side_effect=ConnectionError):
+        with notifications.Subscription() as subscription:
+            start = time.time()
+            assert not subscription.wait(0.2)
+            assert time.time() - start >= 0.2
+
+
+def test_redis_of_the_job_queue():
+    # the tests run the jobs locally, without Redis
+    assert notifications.get_redis() is None
+    with patch('redis.Redis.publish') as publish, \
+            patch('redis.Redis.pubsub') as pubsub:
+        notifications.publish_submissions('filesystem-id', 1)
+        with notifications.Subscription() as subscription:
+            assert not subscription.wait(0)
+    assert not publish.called and not pubsub.called
+
+    queue = worker.RQQueue()
+    saved = worker.set_queue(queue)
+    try:
+        assert notifications.get_redis() is queue.connection
+    finally:
+        worker.set_queue(saved)
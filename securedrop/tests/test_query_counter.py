@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import os
+
+from mock import patch
+
+os.environ['SECUREDROP_ENV'] = 'test'  # noqa
+import query_counter
+
+from db import db
+from models import Source
+from source_app import create_app
+
+
+def test_statement_shape():
+    assert query_counter.statement_shape(
+        "SELECT *\n  FROM sources WHERE id IN (?, ?,?) AND name = 'it''s'"
+        " AND pending = 0 AND table_1.id = ?"
+    ) == ("SELECT * FROM sources WHERE id IN (?) AND name = ? AND "
+          "pending = ? AND table_1.id = ?")
+
+
+def test_repeated_queries_are_counted(journalist_app):
+    with journalist_app.app_context():
+        with query_counter.QueryCounter() as outer:
+            for filesystem_id in ('a', 'b', 'c'):
+                Source.query.filter_by(filesystem_id=filesystem_id).first()
+            with query_counter.QueryCounter() as inner:
+                Source.query.count()
+        Source.query.count()
+
+    assert outer.count == 4
+    assert inner.count == 1
+    assert outer.duration >= inner.duration > 0
+    [(shape, count)] = outer.repeated(3)
+    assert count == 3
+    assert shape.startswith('SELECT sources.id AS sources_id')
+    assert '4 queries in' in outer.report()
+
+
+def test_sampled_requests_log_repeated_queries(config):
+    config.SQL_QUERY_SAMPLE_RATE = 1
+    config.SQL_REPEATED_QUERY_THRESHOLD = 2
+    app = create_app(config)
+    with app.app_context():
+        db.create_all()
+
+    @app.route('/n-plus-one')
+    def n_plus_one():
+        for filesystem_id in ('secret-1', 'secret-2'):
+            Source.query.filter_by(filesystem_id=filesystem_id).first()
+        return 'ok'
+
+    with patch.object(app.logger, 'warning') as warning:
+        with app.test_client() as client:
+            client.get('/n-plus-one')
+    warning.assert_called_once()
+    args = warning.call_args[0]
+    assert args[1:3] == ('n_plus_one', 2)
+    assert 'WHERE sources.filesystem_id = ?' in args[3]
+    assert 'secret' not in repr(warning.call_args)
+
+
+def test_requests_are_not_sampled_when_disabled(config):
+    config.SQL_QUERY_SAMPLE_RATE = 0
+    app = create_app(config)
+    with patch('query_counter.QueryCounter') as counter:
+        with app.test_client() as client:
+            client.get('/')
+    assert not counter.called
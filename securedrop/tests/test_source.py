@@ -1,11 +1,11 @@
 # -*- coding: utf-8 -*-
 import gzip
 import json
+import os
 import re
-import subprocess
 
 from cStringIO import StringIO
-from flask import session, escape, current_app
+from flask import session, escape, current_app, g
 from mock import patch, ANY
 
 import crypto_util
@@ -16,6 +16,7 @@ import version
 from db import db
 from models import Source
 from source_app import main as source_app_main
+from source_app.codename_pool import CodenamePool
 from utils.db_helper import new_codename
 from utils.instrument import InstrumentedApp
 
@@ -136,6 +137,41 @@ def test_generate_too_long_codename(source_app):
     )
 
 
+def test_generate_uses_codename_pool(source_app):
+    """A vetted codename is taken from the pool instead of being generated
+    while the source waits, and it is only ever handed out once."""
+    pooled = ['pooled codename one', 'pooled codename two',
+              'pooled codename three']
+    source_app.codename_pool = CodenamePool(source_app, size=3,
+                                            refill_threshold=0)
+    with patch('source_app.codename_pool.new_unique_codename',
+               side_effect=pooled):
+        assert source_app.codename_pool.refill('en') == 3
+
+    with patch('source_app.utils.new_unique_codename') as generate:
+        with source_app.test_client() as app:
+            resp = app.get('/generate')
+            assert resp.status_code == 200
+            assert session['codename'] == pooled[0]
+        with source_app.test_client() as app:
+            resp = app.get('/generate')
+            assert resp.status_code == 200
+            assert session['codename'] == pooled[1]
+        assert not generate.called
+
+    stats = source_app.codename_pool.stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 0
+    assert stats['depth'] == {'en': 1}
+
+
+def test_codename_pool_disabled(source_app):
+    pool = CodenamePool(source_app, size=0)
+    assert not pool.enabled
+    assert pool.get('en') is None
+    assert pool.stats()['misses'] == 0
+
+
 def test_create_duplicate_codename(source_app):
     with patch.object(source.app.logger, 'error') as logger:
         with source_app.test_client() as app:
@@ -169,6 +205,50 @@ def test_lookup(source_app):
         assert "BEGIN PGP PUBLIC KEY BLOCK" in text
 
 
+def test_lookup_query_budget(source_app, query_budget):
+    with source_app.test_client() as app:
+        codename = new_codename(app, session)
+        app.post('/login', data=dict(codename=codename))
+        with query_budget(2):
+            assert app.get('/lookup').status_code == 200
+
+
+def test_journalist_key_is_exported_once(source_app):
+    with patch.object(source_app.crypto_util.gpg, 'export_keys',
+                      wraps=source_app.crypto_util.gpg.export_keys) as export:
+        with source_app.test_client() as app:
+            first = app.get('/journalist-key')
+            assert first.status_code == 200
+            assert first.headers['Content-Type'] == 'application/pgp-keys'
+            assert 'attachment' in first.headers['Content-Disposition']
+            assert 'Last-Modified' not in first.headers
+            assert app.get('/journalist-key').data == first.data
+
+            resp = app.get('/journalist-key',
+                           headers={'If-None-Match': first.headers['ETag']})
+            assert resp.status_code == 304
+    assert export.call_count == 1
+    assert source_app.cached_responses['journalist_key'].stats() == {
+        'computed': 1, 'served': 2, 'not_modified': 1}
+
+
+def test_journalist_key_follows_keyring_changes(source_app):
+    cached_response = source_app.cached_responses['journalist_key']
+    with source_app.test_client() as app:
+        first = app.get('/journalist-key')
+        # e.g. the key's expiration date was extended
+        with patch.object(source_app.crypto_util, 'keyring_version',
+                          return_value='changed'), \
+                patch.object(source_app.crypto_util.gpg, 'export_keys',
+                             return_value=u'new key'):
+            resp = app.get('/journalist-key',
+                           headers={'If-None-Match': first.headers['ETag']})
+    assert resp.status_code == 200
+    assert resp.data == 'new key'
+    assert resp.headers['ETag'] != first.headers['ETag']
+    assert cached_response.computed == 2
+
+
 def test_login_and_logout(source_app):
     with source_app.test_client() as app:
         resp = app.get('/login')
@@ -288,6 +368,18 @@ def test_submit_message(source_app):
         assert "Thanks! We received your message" in text
 
 
+def test_submit_publishes_notification(source_app):
+    with source_app.test_client() as app:
+        new_codename(app, session)
+        with patch('source_app.main.publish_submissions') as publish:
+            resp = app.post('/submit', data=dict(
+                msg="This is a test.",
+                fh=(StringIO('This is a test'), 'test.txt'),
+            ), follow_redirects=True)
+        assert resp.status_code == 200
+        publish.assert_called_once_with(g.filesystem_id, 2)
+
+
 def test_submit_empty_message(source_app):
     with source_app.test_client() as app:
         new_codename(app, session)
@@ -471,6 +563,10 @@ def test_metadata_route(source_app):
         assert json.loads(resp.data.decode('utf-8')).get('sd_version') \
             == version.__version__
 
+        cached = app.get('/metadata',
+                         headers={'If-None-Match': resp.headers['ETag']})
+        assert cached.status_code == 304
+
 
 def test_login_with_overly_long_codename(source_app):
     """Attempting to login with an overly long codename should result in
@@ -489,29 +585,54 @@ def test_login_with_overly_long_codename(source_app):
                 "Called hash_codename for codename w/ invalid length"
 
 
+def test_normalize_timestamps(source_app):
+    """After a submission, all of the source's submissions carry the
+    timestamp of the latest one."""
+    with source_app.test_client() as app:
+        new_codename(app, session)
+        _dummy_submission(app)
+        source_dir = current_app.storage.path(g.filesystem_id)
+        for name in os.listdir(source_dir):
+            os.utime(os.path.join(source_dir, name), (1000, 1000))
+
+        resp = app.post('/submit', data=dict(
+            msg="This is a test.",
+            fh=(StringIO(''), ''),
+        ), follow_redirects=True)
+        assert resp.status_code == 200
+
+        mtimes = set(os.stat(os.path.join(source_dir, name)).st_mtime
+                     for name in os.listdir(source_dir))
+        assert len(mtimes) == 1
+        assert mtimes != set([1000])
+
+
 def test_failed_normalize_timestamps_logs_warning(source_app):
-    """If a normalize timestamps event fails, the subprocess that calls
-    touch will fail and exit 1. When this happens, the submission should
-    still occur, but a warning should be logged (this will trigger an
-    OSSEC alert)."""
+    """If a normalize timestamps event fails, the submission should still
+    occur, but a warning should be logged (this will trigger an OSSEC
+    alert)."""
 
     with patch.object(source_app.logger, 'warning') as logger:
-        with patch.object(subprocess, 'call', return_value=1):
-            with source_app.test_client() as app:
-                new_codename(app, session)
-                _dummy_submission(app)
+        with source_app.test_client() as app:
+            new_codename(app, session)
+            _dummy_submission(app)
+            source_dir = current_app.storage.path(g.filesystem_id)
+            for name in os.listdir(source_dir):
+                os.utime(os.path.join(source_dir, name), (1000, 1000))
+
+            with patch.object(os, 'utime', side_effect=OSError):
                 resp = app.post('/submit', data=dict(
                     msg="This is a test.",
                     fh=(StringIO(''), ''),
                 ), follow_redirects=True)
-                assert resp.status_code == 200
-                text = resp.data.decode('utf-8')
-                assert "Thanks! We received your message" in text
+            assert resp.status_code == 200
+            text = resp.data.decode('utf-8')
+            assert "Thanks! We received your message" in text
 
-                logger.assert_called_once_with(
-                    "Couldn't normalize submission "
-                    "timestamps (touch exited with 1)"
-                )
+            logger.assert_called_once_with(
+                "Couldn't normalize submission "
+                "timestamps (2 of 2 failed)"
+            )
 
 
 def test_source_is_deleted_while_logged_in(source_app):
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import gzip
+import json
+import os
+
+from flask import Flask, render_template_string
+from flask_assets import Environment
+
+os.environ['SECUREDROP_ENV'] = 'test'  # noqa
+import static_assets
+
+
+def make_static_dir(tmpdir):
+    static = tmpdir.mkdir('static')
+    static.mkdir('css').join('source.css').write(
+        '@font-face { src: url("../fonts/icons.eot?#iefix"); }\n'
+        'body { background: url(/static/i/favicon.png); }\n'
+        '.logo { background: url(../i/logo.png); }\n' * 20)
+    static.mkdir('fonts').join('icons.eot').write('font')
+    i = static.mkdir('i')
+    i.join('favicon.png').write('png')
+    i.join('logo.png').write('uploaded at runtime')
+    js = static.mkdir('js')
+    js.mkdir('libs').join('jquery-2.1.4.min.js').write('var jquery;\n')
+    js.join('journalist.js').write('var journalist = 1;\n')
+    js.join('source.js').write('var source = 1;\n')
+    static.mkdir('.webassets-cache').join('junk').write('junk')
+    return static
+
+
+def test_build_hashes_static_files(tmpdir):
+    static = make_static_dir(tmpdir)
+    # built on demand in development, and emptied on installation
+    static.mkdir('gen').join('source.js').write('var stale;\n')
+    manifest = static_assets.build(str(static))
+
+    assert manifest == json.loads(static.join('manifest.json').read())
+    assert set(manifest) == set(['css/source.css', 'fonts/icons.eot',
+                                 'i/favicon.png', 'js/journalist.js',
+                                 'js/libs/jquery-2.1.4.min.js',
+                                 'js/source.js', 'gen/journalist.js',
+                                 'gen/source.js'])
+    for name, hashed in manifest.items():
+        assert hashed != name
+        assert static.join(hashed).check()
+    # the bundles are built outside of gen/
+    assert manifest['gen/source.js'].startswith('dist/source.')
+    assert 'var source' in static.join(manifest['gen/source.js']).read()
+    assert static.join('gen').listdir() == [static.join('gen', 'source.js')]
+
+    css = static.join(manifest['css/source.css'])
+    assert '../{}?#iefix'.format(manifest['fonts/icons.eot']) in css.read()
+    assert '/static/{}'.format(manifest['i/favicon.png']) in css.read()
+    assert 'url(../i/logo.png)' in css.read()
+
+    # only the text files which shrink get a compressed variant
+    with gzip.open(str(css) + '.gz') as f:
+        assert f.read() == css.read()
+    assert not static.join(manifest['i/favicon.png'] + '.gz').check()
+    assert not static.join(manifest['fonts/icons.eot'] + '.gz').check()
+
+
+def test_build_replaces_previous_copies(tmpdir):
+    static = make_static_dir(tmpdir)
+    previous = static_assets.build(str(static))
+    static.join('js', 'source.js').write('var source = 2;\n')
+
+    manifest = static_assets.build(str(static))
+    assert manifest['js/source.js'] != previous['js/source.js']
+    assert not static.join(previous['js/source.js']).check()
+    assert manifest['i/favicon.png'] == previous['i/favicon.png']
+    assert static.join(manifest['i/favicon.png']).check()
+
+
+def test_hashed_files_are_served_for_good(tmpdir):
+    static = make_static_dir(tmpdir)
+    manifest = static_assets.build(str(static))
+    app = Flask(__name__, static_folder=str(static))
+    static_assets.setup_app(app, Environment(app))
+
+    with app.test_request_context('/'):
+        assert render_template_string(
+            "{{ static_url('js/source.js') }} {{ static_url('i/logo.png') }}"
+        ) == '/static/{} /static/i/logo.png'.format(manifest['js/source.js'])
+
+    client = app.test_client()
+    resp = client.get('/static/' + manifest['js/source.js'])
+    assert resp.cache_control.max_age == static_assets.HASHED_MAX_AGE
+    resp = client.get('/static/i/logo.png')
+    assert resp.cache_control.max_age == app.send_file_max_age_default.seconds
+
+
+def test_bundles_are_built_on_use_without_manifest(tmpdir):
+    static = make_static_dir(tmpdir)
+    app = Flask(__name__, static_folder=str(static))
+    static_assets.setup_app(app, Environment(app))
+
+    with app.test_request_context('/'):
+        url = render_template_string("{{ static_url('gen/source.js') }}")
+        assert url.startswith('/static/gen/source.js')
+        assert render_template_string(
+            "{{ static_url('js/source.js') }}") == '/static/js/source.js'
+    assert 'var source' in static.join('gen', 'source.js').read()
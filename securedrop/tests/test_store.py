@@ -135,8 +135,9 @@ class TestStore(unittest.TestCase):
                                   submission.filename)
                      for submission in submissions]
 
-        archive = zipfile.ZipFile(
-            current_app.storage.get_bulk_archive(submissions))
+        entries = [store.bulk_archive_entry(s) for s in submissions]
+        archive = zipfile.ZipFile(current_app.storage.build_bulk_archive(
+            store.bulk_archive_name(entries), entries))
         archivefile_contents = archive.namelist()
 
         for archived_file, actual_file in zip(archivefile_contents, filenames):
@@ -144,6 +145,41 @@ class TestStore(unittest.TestCase):
             zipped_file_content = archive.read(archived_file)
             self.assertEquals(zipped_file_content, actual_file_content)
 
+    def test_build_bulk_archive_job(self):
+        source, _ = utils.db_helper.init_source()
+        submissions = utils.db_helper.submit(source, 2)
+        entries = [store.bulk_archive_entry(s) for s in submissions]
+        name = store.bulk_archive_name(entries, 'all')
+
+        # the same selection is always given the same name
+        self.assertEqual(
+            name, store.bulk_archive_name(list(reversed(entries)), 'all'))
+        self.assertNotEqual(name, store.bulk_archive_name(entries, 'unread'))
+
+        self.assertEqual(
+            store.build_bulk_archive(config.STORE_DIR, config.TEMP_DIR,
+                                     name, entries, 'all'),
+            'success')
+        archive = zipfile.ZipFile(current_app.storage.bulk_archive_path(name))
+        self.assertEqual(len(archive.namelist()), 2)
+        # no partial build is left behind
+        self.assertEqual(
+            [f for f in os.listdir(config.TEMP_DIR)
+             if f.startswith('tmp_securedrop_bulk_')],
+            [name])
+
+    def test_remove_expired_bulk_archives(self):
+        expired = current_app.storage.build_bulk_archive(
+            store.bulk_archive_name([], 'expired'), [])
+        fresh = current_app.storage.build_bulk_archive(
+            store.bulk_archive_name([], 'fresh'), [])
+        os.utime(expired, (0, 0))
+
+        current_app.storage.remove_expired_bulk_archives(3600)
+
+        self.assertFalse(os.path.exists(expired))
+        self.assertTrue(os.path.exists(fresh))
+
     def test_rename_valid_submission(self):
         source, _ = utils.db_helper.init_source()
         old_journalist_filename = source.journalist_filename
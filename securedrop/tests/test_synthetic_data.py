@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+import pytest
+from flask import session
+from mock import patch
+
+os.environ['SECUREDROP_ENV'] = 'test'  # noqa
+import synthetic_data
+
+from models import Reply, Source, SourceStar, Submission
+
+
+def test_distribution():
+    rng = synthetic_data.random.Random(1)
+    assert synthetic_data.Distribution('3').sample(rng) == 3
+    assert 2 <= synthetic_data.Distribution('2-4').sample(rng) <= 4
+    assert synthetic_data.Distribution('lognormal:1000:0').sample(rng) == 1000
+    for spec in ('-1', '4-2', 'lognormal:1', 'many'):
+        with pytest.raises(ValueError):
+            synthetic_data.Distribution(spec)
+
+
+def test_generate_placeholders(journalist_app, test_journo, tmpdir):
+    config = journalist_app.sdconfig
+    manifest = str(tmpdir.join('manifest.json'))
+    with journalist_app.app_context(), \
+            patch.object(synthetic_data, 'CHUNK_SIZE', 3):
+        result = synthetic_data.generate(
+            config, 7, submissions='2-3', message_size='100',
+            document_size='1000', star_ratio=1, read_ratio=0,
+            placeholder=True, jobs=2, seed=1, manifest=manifest)
+        assert result == json.load(open(manifest))
+        assert result['totals']['sources'] == 7
+        assert result['totals']['replies'] == 0  # no source has a key
+
+        assert Source.query.filter_by(pending=False).count() == 7
+        assert SourceStar.query.count() == 7
+        submissions = Submission.query.all()
+        assert len(submissions) == result['totals']['submissions']
+        assert not any(submission.downloaded for submission in submissions)
+        for submission in submissions:
+            path = journalist_app.storage.path(
+                submission.source.filesystem_id, submission.filename)
+            assert os.path.getsize(path) == submission.size
+            assert submission.size > 100
+
+    # the same seed generates the same dataset
+    with journalist_app.app_context():
+        again = synthetic_data.generate(
+            config, 7, submissions='2-3', message_size='100',
+            document_size='1000', star_ratio=1, read_ratio=0,
+            placeholder=True, jobs=1, seed=1)
+    assert ([len(s['submissions']) for s in again['sources']] ==
+            [len(s['submissions']) for s in result['sources']])
+
+
+def test_generate_with_key_pool(journalist_app, source_app, test_journo,
+                                tmpdir):
+    config = journalist_app.sdconfig
+    key_pool = str(tmpdir.join('key-pool'))
+    synthetic_data.make_key_pool(config, key_pool, 2, jobs=1)
+
+    with journalist_app.app_context():
+        result = synthetic_data.generate(
+            config, 3, submissions='1', replies='2', message_size='10',
+            key_pool=key_pool, jobs=1)
+        with_key, _, without_key = result['sources']
+        assert with_key['has_key'] and not without_key['has_key']
+        assert len(with_key['replies']) == 2
+        assert Reply.query.count() == result['totals']['replies'] == 4
+        assert journalist_app.crypto_util.getkey(with_key['filesystem_id'])
+
+        # a second dataset gets the identities that are left: none
+        result = synthetic_data.generate(config, 1, key_pool=key_pool,
+                                         jobs=1)
+        assert not result['sources'][0]['has_key']
+
+    # sources can log in with their codename, and read their replies
+    with source_app.test_client() as app:
+        resp = app.post('/login', data=dict(codename=with_key['codename']),
+                        follow_redirects=True)
+        assert session['logged_in'] is True
+        assert resp.data.count('class="reply"') == 2
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import os
+
+from mock import patch
+from redis.exceptions import ConnectionError
+
+os.environ['SECUREDROP_ENV'] = 'test'  # noqa
+import i18n
+import warmup
+import worker
+
+from journalist_app import create_app as create_journalist_app
+from source_app import create_app as create_source_app
+
+
+def test_warm_up_preloads_shared_state(journalist_app):
+    with patch.object(journalist_app.jinja_env, 'get_template',
+                      wraps=journalist_app.jinja_env.get_template) as get:
+        assert warmup.warm_up(journalist_app) >= 0
+    compiled = set(call[0][0] for call in get.call_args_list)
+    assert set(['index.html', '_source_row.html']) <= compiled
+    assert set(i18n.LOCALES) <= set(i18n.TRANSLATIONS)
+
+    crypto_util = journalist_app.crypto_util
+    with patch('gnupg.GPG') as GPG, patch('__builtin__.open') as open_:
+        crypto_util.gpg
+        crypto_util.nouns
+        crypto_util.get_wordlist('en')
+    assert not GPG.called
+    assert not open_.called
+
+
+def test_warm_up_survives_redis_being_down(source_app):
+    with patch.object(worker, 'ping', side_effect=ConnectionError), \
+            patch.object(warmup.log, 'warning') as warning:
+        warmup.warm_up(source_app)
+    assert warning.called
+
+
+def test_compiled_templates_are_cached_on_disk(config):
+    app = create_journalist_app(config)
+    warmup.warm_up(app)
+    cached = os.listdir(config.TEMPLATE_CACHE_DIR)
+    assert cached
+
+    # another process finds the templates already compiled
+    app = create_journalist_app(config)
+    with patch.object(app.jinja_env, 'compile',
+                      wraps=app.jinja_env.compile) as compile_:
+        app.jinja_env.get_template('index.html')
+    assert not compile_.called
+    assert sorted(os.listdir(config.TEMPLATE_CACHE_DIR)) == sorted(cached)
+
+
+def test_template_cache_can_be_disabled(config):
+    config.TEMPLATE_CACHE_DIR = None
+    app = create_source_app(config)
+    assert app.jinja_env.bytecode_cache is None
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+import os
+import pytest
+import subprocess
+import sys
+import threading
+import time
+
+from datetime import datetime, timedelta
+
+os.environ['SECUREDROP_ENV'] = 'test'  # noqa
+import worker
+
+
+def remember(key, value):
+    worker.get_current_job().meta[key] = value
+    return value
+
+
+def fail():
+    raise ValueError('no luck')
+
+
+def fail_until(attempts):
+    if worker.get_current_job().meta['attempts'] < attempts:
+        raise ValueError('not yet')
+    return 'success'
+
+
+@pytest.fixture
+def queue():
+    queue = worker.LocalQueue()
+    saved = worker.set_queue(queue)
+    yield queue
+    queue.join()
+    worker.set_queue(saved)
+
+
+def test_importing_worker_connects_to_nothing():
+    subprocess.check_call([
+        sys.executable, '-c',
+        'import sys, worker; '
+        'assert worker._queue is None; '
+        'assert "redis" not in sys.modules and "rq" not in sys.modules'],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_make_queue():
+    assert isinstance(worker.make_queue('rq'), worker.RQQueue)
+    queue = worker.make_queue('process', workers=2)
+    assert queue.processes and queue.workers == 2
+    with pytest.raises(ValueError):
+        worker.make_queue('celery')
+
+
+@pytest.mark.parametrize('processes', (False, True))
+def test_local_queue(processes):
+    queue = worker.LocalQueue(workers=2, processes=processes)
+    remembered = queue.enqueue(remember, 'answer', 42, job_id='answer',
+                               description='remember the answer')
+    failed = queue.enqueue(fail)
+    queue.join()
+
+    assert queue.fetch_job('answer') is remembered
+    assert remembered.is_finished
+    assert remembered.result == 42
+    assert remembered.meta == {'answer': 42}
+    assert remembered.description == 'remember the answer'
+    assert failed.get_status() == 'failed'
+    assert 'ValueError: no luck' in failed.exc_info
+    assert queue.fetch_job('unknown') is None
+
+
+@pytest.mark.parametrize('processes', (False, True))
+def test_local_queue_timeout(processes):
+    queue = worker.LocalQueue(processes=processes)
+    start = time.time()
+    slow = queue.enqueue(time.sleep, 2, timeout=0.2)
+    quick = queue.enqueue(sum, [1, 2])
+    queue.join()
+    assert time.time() - start < 1.5
+    assert slow.is_failed
+    assert 'JobTimeoutException' in slow.exc_info
+    assert quick.result == 3
+
+
+def test_ended_jobs_are_forgotten():
+    queue = worker.LocalQueue()
+    job = queue.enqueue(sum, [1], result_ttl=0)
+    queue.join()
+    queue.enqueue(sum, [2])
+    assert queue.fetch_job(job.id) is None
+
+
+def test_job_types(queue):
+    import rm
+    import store
+    assert worker.job_type(store.build_bulk_archive) == \
+        worker.JOB_TYPES['store.build_bulk_archive']
+    assert worker.job_type(sum) == worker.DEFAULT_JOB_TYPE
+
+    job = worker.enqueue(rm.secure_delete_batch, [], passes=1)
+    assert (job.origin, job.timeout) == ('bulk', 3600)
+    assert job.function is worker._retry
+    assert job.args[2] == {'passes': 1}
+    assert job.description == 'secure_delete_batch'
+
+    job = worker.enqueue(rm.secure_delete_batch, [], queue='interactive',
+                         timeout=5, job_id='deletion', description='nothing')
+    assert (job.id, job.origin, job.timeout) == ('deletion', 'interactive', 5)
+    assert job.description == 'nothing'
+
+    job = worker.enqueue(sum, [1, 2])
+    assert (job.origin, job.function) == ('bulk', sum)
+    queue.join()
+    assert job.result == 3
+    assert worker.fetch_job('deletion').result == 'success'
+
+
+def test_retries(queue):
+    retried = worker.enqueue(fail_until, 3, retries=2)
+    exhausted = worker.enqueue(fail_until, 3, retries=1, job_id='exhausted')
+    queue.join()
+
+    assert retried.result == 'success'
+    assert retried.meta['attempts'] == 3
+    assert exhausted.is_failed
+    assert exhausted.meta['attempts'] == 2
+    assert 'ValueError: not yet' in exhausted.exc_info
+
+    # the dead letters are kept until they are requeued, with as many
+    # attempts again, or discarded
+    assert worker.failed_jobs() == [exhausted]
+    assert worker.requeue(retried.id) is None
+    assert worker.requeue('exhausted') is exhausted
+    assert worker.failed_jobs() == []
+    queue.join()
+    assert exhausted.is_failed
+    assert exhausted.meta['attempts'] == 2
+    assert worker.failed_jobs() == [exhausted]
+    assert worker.discard('exhausted')
+    assert not worker.discard('exhausted')
+    assert worker.failed_jobs() == []
+    assert worker.fetch_job('exhausted') is None
+
+
+@pytest.fixture
+def rq_queue(monkeypatch):
+    # queues of their own, which the test rqworker does not serve
+    monkeypatch.setattr(worker, 'queue_prefix', 'test-rq-')
+    monkeypatch.setattr(worker, 'RETRY_BACKOFF', 60)
+    queue = worker.RQQueue()
+    saved = worker.set_queue(queue)
+    yield queue
+    worker.set_queue(saved)
+    for job in queue.failed_jobs():
+        if job.origin.startswith(worker.queue_prefix):
+            queue.discard(job.id)
+
+
+def work(queue):
+    """Run the jobs queued in the RQQueue `queue` until there are none
+    left."""
+    from rq import Queue, SimpleWorker
+    SimpleWorker([Queue(worker.queue_prefix + name,
+                        connection=queue.connection)
+                  for name in worker.QUEUES],
+                 connection=queue.connection).work(burst=True)
+
+
+def _ids(jobs):
+    return [job.id for job in jobs]
+
+
+def test_rq_retries_are_queued_again_when_due(rq_queue):
+    job = worker.enqueue(fail_until, 2, retries=1)
+    start = time.time()
+    work(rq_queue)
+    # failed, without holding up the worker until the retry
+    assert time.time() - start < 30
+    job.refresh()
+    assert job.is_failed
+    assert job.meta['attempts'] == 1
+    assert job.id not in _ids(worker.failed_jobs())
+
+    assert worker.retry_due_jobs() == []
+    later = datetime.utcnow() + timedelta(minutes=2)
+    assert _ids(worker.retry_due_jobs(later)) == [job.id]
+    work(rq_queue)
+    job.refresh()
+    assert job.result == 'success'
+    assert job.meta['attempts'] == 2
+    job.delete()
+
+
+def test_rq_requeue_and_discard(rq_queue):
+    from rq import get_failed_queue
+    job = worker.enqueue(fail, retries=1, job_id='rq-exhausted')
+    work(rq_queue)
+    later = datetime.utcnow() + timedelta(minutes=2)
+    assert _ids(worker.retry_due_jobs(later)) == [job.id]
+    work(rq_queue)
+    job.refresh()
+    assert job.is_failed
+    assert job.meta == {'attempts': 2}
+    assert 'ValueError: no luck' in job.exc_info
+    assert job.id in _ids(worker.failed_jobs())
+
+    # queued again with as many attempts as at first
+    assert worker.requeue('rq-exhausted').id == job.id
+    assert job.id not in _ids(rq_queue.failed_jobs())
+    assert worker.requeue('rq-exhausted') is None
+    work(rq_queue)
+    job.refresh()
+    assert job.is_failed
+    assert job.meta['attempts'] == 1
+    assert job.id not in _ids(worker.failed_jobs())
+
+    assert worker.discard('rq-exhausted')
+    assert job.id not in get_failed_queue(rq_queue.connection).job_ids
+    assert worker.fetch_job('rq-exhausted') is None
+    assert not worker.discard('rq-exhausted')
+
+
+def test_queues_and_stats(queue):
+    release = threading.Event()
+    blocking = worker.enqueue(release.wait, 5, queue='bulk')
+    waiting = worker.enqueue(sum, [1], queue='bulk')
+    worker.enqueue(fail, queue='interactive')
+    quick = worker.enqueue(sum, [2], queue='interactive')
+    while not quick.is_finished:  # not held up by the bulk queue
+        time.sleep(0.01)
+
+    interactive, bulk = worker.stats()
+    assert interactive == dict(interactive, name='interactive', queued=0,
+                               started=0, finished=1, failed=1, workers=1,
+                               oldest_queued=None, longest_started=None)
+    assert interactive['jobs_per_minute'] > 0
+    assert bulk == dict(bulk, name='bulk', queued=1, started=1, finished=0,
+                        failed=0)
+    assert bulk['oldest_queued'] >= 0 and bulk['longest_started'] >= 0
+
+    release.set()
+    queue.join()
+    assert blocking.is_finished and waiting.is_finished
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Load, before a process serves its first request, what requests would
+otherwise load on first use: the word lists, the keyring, the message
+catalogs, the journalist's public key, the compiled templates and the
+connections to the database and to Redis.
+
+The WSGI entry points (source.py and journalist.py) call :func:`warm_up`
+right after creating their app, and mod_wsgi is configured to import them
+when it starts a daemon process, so this happens before the process
+accepts any traffic instead of during the first requests.
+"""
+import logging
+import time
+
+from redis.exceptions import RedisError
+from sqlalchemy.exc import SQLAlchemyError
+
+import i18n
+import worker
+
+from db import db
+
+log = logging.getLogger(__name__)
+
+
+def warm_up(app):
+    """Preload the shared state of `app`, and return how many seconds it
+    took. Failing to reach the database or Redis is logged, since they may
+    well be up by the time requests arrive."""
+    start = time.time()
+    with app.app_context():
+        crypto_util = app.crypto_util
+        for locale in i18n.LOCALES:
+            crypto_util.get_wordlist(locale.split('_')[0])
+            i18n.get_translations(locale)
+        crypto_util.nouns
+        crypto_util.adjectives
+        crypto_util.gpg
+        for cached_response in getattr(app, 'cached_responses', {}).values():
+            cached_response.get()
+
+        for name in app.jinja_env.list_templates():
+            app.jinja_env.get_template(name)
+
+        try:
+            db.session.execute('SELECT 1')
+        except SQLAlchemyError as e:
+            log.warning("Could not connect to the database: %s", e)
+        finally:
+            db.session.remove()
+
+        try:
+            worker.ping()
+        except RedisError as e:
+            log.warning("Could not connect to Redis: %s", e)
+
+    seconds = time.time() - start
+    log.info("%s warmed up in %.3fs", app.name, seconds)
+    return seconds
@@ -1,14 +1,609 @@
+# -*- coding: utf-8 -*-
+"""The queues of the background jobs, e.g. secure deletions and bulk archives.
+
+The jobs are run by the backend set by JOB_QUEUE_BACKEND:
+
+- `rq`, the default: the jobs are queued in Redis and run by the rqworker
+  services;
+- `thread` or `process`: the jobs are run by up to JOB_QUEUE_WORKERS threads
+  per queue of the process which queued them, each job within the thread or
+  in a child process of its own. This needs neither Redis nor a worker
+  service, which suits small instances, the tests and the load and benchmark
+  harnesses, but the jobs still queued when the process exits are lost.
+
+Each job goes to one of QUEUES, with the timeout and the number of retries
+of its type (see JOB_TYPES): the `interactive` queue, for the jobs someone
+is waiting for, has workers of its own, so that an hour-long secure deletion
+on the `bulk` queue never holds up a bulk archive. A job which fails after
+its retries is kept among the failed jobs, the dead letters, until it is
+requeued or discarded from the admin interface or `manage.py jobs`.
+
+Either way, :func:`enqueue` takes the arguments of `rq.Queue.enqueue` the
+apps use (`job_id`, `description` and `timeout`), and returns a job with the
+interface of an rq job they use (`id`, `get_status()`, `is_finished`,
+`is_failed`, `result` and `meta`). The queue is only created, and Redis only
+connected to, when it is first used, so importing this opens no connection.
+
+A failed job which has retries left is not retried right away, and no worker
+waits for it: it stays among the failed jobs, with the time of its next
+attempt, until :func:`retry_due_jobs` queues it again, which `manage.py
+maintenance` does every 15 minutes from cron: with rq, a retry therefore
+waits for the first run after its backoff, up to 15 minutes more. The local
+queues retry their jobs themselves, right after the backoff.
+"""
+import collections
+import logging
+import multiprocessing
 import os
+import threading
+import traceback
+import uuid
+
+from datetime import datetime, timedelta
+
+log = logging.getLogger(__name__)
 
-from redis import Redis
-from rq import Queue
+# The queues, by decreasing priority
+QUEUES = ('interactive', 'bulk')
 
-queue_name = 'test' if os.environ.get(
-    'SECUREDROP_ENV') == 'test' else 'default'
+# The names of the rq queues are prefixed, so that the tests never take the
+# jobs of a development instance, or the other way round
+queue_prefix = 'test-' if os.environ.get('SECUREDROP_ENV') == 'test' else ''
 
 # `srm` can take a long time on large files, so allow it run for up to an hour
-q = Queue(name=queue_name, connection=Redis(), default_timeout=3600)
+DEFAULT_TIMEOUT = 3600
+
+# How long, in seconds, the local backends keep the jobs that have finished,
+# as rq keeps their results, and so the window over which the throughput of
+# the queues is measured
+RESULT_TTL = 500
+
+# How long to wait at least before retrying a failed job, doubled after each
+# attempt
+RETRY_BACKOFF = 30
+
+JobType = collections.namedtuple('JobType', ('queue', 'timeout', 'retries'))
+
+# The queue, timeout and number of retries of the jobs, by function. The
+# timeout applies to each attempt. With rq, a retry waits for the next
+# `manage.py maintenance` cron run (every 15 minutes) after its backoff, so
+# retries suit jobs nobody waits for, and the bulk archives only get one.
+JOB_TYPES = {
+    'store.build_bulk_archive': JobType('interactive', 30 * 60, 1),
+    'rm.secure_delete_batch': JobType('bulk', DEFAULT_TIMEOUT, 3),
+    'maintenance.run': JobType('bulk', 30 * 60, 0),
+}
+
+DEFAULT_JOB_TYPE = JobType('bulk', DEFAULT_TIMEOUT, 0)
+
+BACKENDS = ('rq', 'thread', 'process')
+
+_lock = threading.Lock()
+_queue = None
+
+
+def job_type(function):
+    """Return the JobType of the jobs running `function`."""
+    return JOB_TYPES.get('{}.{}'.format(function.__module__,
+                                        function.__name__),
+                         DEFAULT_JOB_TYPE)
+
+
+def _summary(name, queued, oldest, started, finished, failed, workers):
+    """Return the statistics of the queue `name`, given the number of its
+    queued jobs, the oldest of them, its started jobs, and the numbers of
+    its recently finished and failed jobs and of its workers."""
+    now = datetime.utcnow()
+    return {
+        'name': name,
+        'queued': queued,
+        'started': len(started),
+        'finished': finished,
+        'failed': failed,
+        'workers': workers,
+        'oldest_queued': (now - oldest.enqueued_at).total_seconds()
+        if oldest else None,
+        'longest_started': max([(now - job.started_at).total_seconds()
+                                for job in started] or [None]),
+        'jobs_per_minute': finished * 60.0 / RESULT_TTL,
+    }
+
+
+class RQQueue(object):
+    """Jobs queued in Redis, and run by rqworker."""
+
+    def __init__(self, default_timeout=DEFAULT_TIMEOUT):
+        from redis import Redis
+        from rq import Queue
+        connection = Redis()
+        self.__queues = collections.OrderedDict(
+            (name, Queue(name=queue_prefix + name, connection=connection,
+                         default_timeout=default_timeout))
+            for name in QUEUES)
+
+    @property
+    def connection(self):
+        return self.__queues[QUEUES[0]].connection
+
+    def enqueue(self, *args, **kwargs):
+        queue = self.__queues[kwargs.pop('queue', QUEUES[-1])]
+        return queue.enqueue(*args, **kwargs)
+
+    def fetch_job(self, job_id):
+        from rq.exceptions import NoSuchJobError
+        from rq.job import Job
+        try:
+            return Job.fetch(job_id, connection=self.connection)
+        except NoSuchJobError:
+            return None
+
+    def ping(self):
+        return self.connection.ping()
+
+    def get_current_job(self):
+        import rq
+        return rq.get_current_job()
+
+    def stats(self):
+        from rq import Worker
+        from rq.registry import FinishedJobRegistry, StartedJobRegistry
+        failed = collections.Counter(job.origin
+                                     for job in self.__failed_queue().jobs)
+        stats = []
+        for name, queue in self.__queues.items():
+            oldest = queue.get_jobs(0, 1)
+            started = StartedJobRegistry(queue.name,
+                                         connection=self.connection)
+            stats.append(_summary(
+                name, queue.count, oldest[0] if oldest else None,
+                [job for job in map(self.fetch_job, started.get_job_ids())
+                 if job is not None],
+                FinishedJobRegistry(queue.name,
+                                    connection=self.connection).count,
+                failed[queue.name],
+                len(Worker.all(queue=queue))))
+        return stats
+
+    def failed_jobs(self):
+        return self.__failed_queue().jobs
+
+    def requeue(self, job_id):
+        job = self.fetch_job(job_id)
+        if job is None or not job.is_failed:
+            return None
+        return self.__failed_queue().requeue(job_id)
+
+    def discard(self, job_id):
+        job = self.fetch_job(job_id)
+        if job is None or not job.is_failed:
+            return False
+        # not every release of rq takes the jobs it deletes off the failed
+        # queue, and requirements.in does not pin it
+        self.__failed_queue().remove(job)
+        job.delete()
+        return True
+
+    def retry_due_jobs(self, now):
+        return [self.__failed_queue().requeue(job.id)
+                for job in self.__failed_queue().jobs
+                if job.meta.get('retry_at', now) < now]
+
+    def __failed_queue(self):
+        from rq import get_failed_queue
+        return get_failed_queue(connection=self.connection)
+
+
+class JobTimeoutException(Exception):
+    pass
+
+
+class LocalJob(object):
+    """A job of a :class:`LocalQueue`."""
+
+    def __init__(self, id, function, args, kwargs, description=None,
+                 timeout=DEFAULT_TIMEOUT, result_ttl=RESULT_TTL,
+                 origin=QUEUES[-1]):
+        self.id = id
+        self.origin = origin
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.description = description or getattr(
+            function, '__name__', repr(function))
+        self.timeout = timeout
+        self.result_ttl = result_ttl
+        self.meta = {}
+        self.result = None
+        self.exc_info = None
+        self.enqueued_at = datetime.utcnow()
+        self.started_at = None
+        self.ended_at = None
+        self.__status = 'queued'
+
+    def get_status(self):
+        return self.__status
+
+    def set_status(self, status):
+        self.__status = status
+
+    @property
+    def is_queued(self):
+        return self.__status == 'queued'
+
+    @property
+    def is_started(self):
+        return self.__status == 'started'
+
+    @property
+    def is_finished(self):
+        return self.__status == 'finished'
+
+    @property
+    def is_failed(self):
+        return self.__status == 'failed'
+
+    def save_meta(self):
+        pass  # the meta of a local job is kept by the job itself
+
+    def __repr__(self):
+        return '<LocalJob {} {}>'.format(self.id, self.description)
+
+
+_current = threading.local()
+
+
+def _run(job):
+    """Run `job` in the current thread, and return its status and its result
+    or the traceback of its failure."""
+    _current.job = job
+    try:
+        return 'finished', job.function(*job.args, **job.kwargs)
+    except Exception:
+        return 'failed', traceback.format_exc()
+    finally:
+        _current.job = None
+
+
+def _run_in_child(job, connection):
+    outcome = _run(job)
+    try:
+        connection.send(outcome + (job.meta,))
+    except Exception:  # the result cannot be pickled
+        connection.send(('failed', traceback.format_exc(), job.meta))
+    connection.close()
+
+
+class LocalQueue(object):
+    """Jobs run by up to `workers` threads of this process per queue, which
+    are only started when jobs are queued, and stop when there are none left.
+
+    With `processes`, each job runs in a child process, which is killed if
+    the job exceeds its timeout. Threads cannot be killed: a job run in a
+    thread which exceeds its timeout is marked as failed, and its thread
+    moves on to the next job, but the job runs until it returns.
+
+    A failed job with a `retry_at` in its meta (see :func:`_retry`) is
+    queued again by a timer at that time.
+    """
+
+    def __init__(self, workers=1, processes=False,
+                 default_timeout=DEFAULT_TIMEOUT):
+        self.workers = workers
+        self.processes = processes
+        self.default_timeout = default_timeout
+        self.__jobs = {}
+        self.__pending = dict((name, collections.deque()) for name in QUEUES)
+        self.__running = dict.fromkeys(QUEUES, 0)
+        self.__retrying = 0
+        self.__idle = threading.Condition(threading.Lock())
+
+    def enqueue(self, function, *args, **kwargs):
+        job_id = kwargs.pop('job_id', None) or str(uuid.uuid4())
+        queue = kwargs.pop('queue', QUEUES[-1])
+        description = kwargs.pop('description', None)
+        timeout = kwargs.pop('timeout', None) or self.default_timeout
+        result_ttl = kwargs.pop('result_ttl', RESULT_TTL)
+        meta = kwargs.pop('meta', None) or {}
+        job = LocalJob(job_id, function, args, kwargs, description=description,
+                       timeout=timeout, result_ttl=result_ttl, origin=queue)
+        job.meta.update(meta)
+        with self.__idle:
+            self.__forget_finished_jobs()
+            self.__jobs[job.id] = job
+            self.__push(job)
+        return job
+
+    def fetch_job(self, job_id):
+        return self.__jobs.get(job_id)
+
+    def ping(self):
+        return True
+
+    def get_current_job(self):
+        return getattr(_current, 'job', None)
+
+    def stats(self):
+        with self.__idle:
+            self.__forget_finished_jobs()
+            jobs = list(self.__jobs.values())
+            pending = dict((name, list(self.__pending[name]))
+                           for name in QUEUES)
+        return [_summary(name, len(pending[name]),
+                         pending[name][0] if pending[name] else None,
+                         [job for job in jobs
+                          if job.origin == name and job.is_started],
+                         sum(job.origin == name and job.is_finished
+                             for job in jobs),
+                         sum(job.origin == name and job.is_failed
+                             for job in jobs),
+                         self.workers)
+                for name in QUEUES]
+
+    def failed_jobs(self):
+        return sorted((job for job in self.__jobs.values() if job.is_failed),
+                      key=lambda job: job.ended_at)
+
+    def requeue(self, job_id):
+        with self.__idle:
+            job = self.__jobs.get(job_id)
+            if job is None or not job.is_failed:
+                return None
+            self.__requeue(job)
+        return job
+
+    def discard(self, job_id):
+        with self.__idle:
+            job = self.__jobs.get(job_id)
+            if job is None or not job.is_failed:
+                return False
+            del self.__jobs[job_id]
+        return True
+
+    def join(self):
+        """Wait until all the queued jobs, and the retries of those which
+        failed, have been run."""
+        with self.__idle:
+            while any(self.__running.values()) or self.__retrying:
+                self.__idle.wait()
+
+    def __requeue(self, job):
+        job.set_status('queued')
+        job.exc_info = job.started_at = job.ended_at = None
+        job.enqueued_at = datetime.utcnow()
+        self.__push(job)
+
+    def retry_due_jobs(self, now):
+        return []  # retried by their timers
+
+    def __retry_later(self, job):
+        retry_at = job.meta['retry_at']
+        delay = (retry_at - datetime.utcnow()).total_seconds()
+        with self.__idle:
+            self.__retrying += 1
+        timer = threading.Timer(max(delay, 0), self.__retry, (job, retry_at))
+        timer.daemon = True
+        timer.start()
+
+    def __retry(self, job, retry_at):
+        with self.__idle:
+            self.__retrying -= 1
+            # unless it has been requeued or discarded meanwhile
+            if (self.__jobs.get(job.id) is job and job.is_failed and
+                    job.meta.get('retry_at') == retry_at):
+                del job.meta['retry_at']
+                self.__requeue(job)
+            self.__idle.notify_all()
+
+    def __push(self, job):
+        self.__pending[job.origin].append(job)
+        if self.__running[job.origin] < self.workers:
+            self.__running[job.origin] += 1
+            thread = threading.Thread(target=self.__work, args=(job.origin,),
+                                      name='{} job queue worker'.format(
+                                          job.origin))
+            thread.daemon = True
+            thread.start()
+
+    def __forget_finished_jobs(self):
+        # like rq, keep the failed jobs until they are requeued or discarded
+        now = datetime.utcnow()
+        for job_id, job in list(self.__jobs.items()):
+            if job.is_finished and \
+                    now - job.ended_at > timedelta(seconds=job.result_ttl):
+                del self.__jobs[job_id]
+
+    def __work(self, queue):
+        while True:
+            with self.__idle:
+                if not self.__pending[queue]:
+                    self.__running[queue] -= 1
+                    self.__idle.notify_all()
+                    return
+                job = self.__pending[queue].popleft()
+            self.__perform(job)
+
+    def __perform(self, job):
+        job.started_at = datetime.utcnow()
+        job.set_status('started')
+        if self.processes:
+            status, result = self.__perform_in_child(job)
+        else:
+            status, result = self.__perform_in_thread(job)
+        job.ended_at = datetime.utcnow()
+        if status == 'finished':
+            job.result = result
+        else:
+            job.exc_info = result
+            log.error('job %s (%s) failed: %s', job.id, job.description,
+                      result)
+        job.set_status(status)
+        if status == 'failed' and 'retry_at' in job.meta:
+            self.__retry_later(job)
+
+    def __perform_in_thread(self, job):
+        outcome = []
+        runner = threading.Thread(target=lambda: outcome.extend(_run(job)),
+                                  name='job {}'.format(job.id))
+        runner.daemon = True
+        runner.start()
+        runner.join(job.timeout)
+        if runner.is_alive():
+            return 'failed', _timeout_message(job)
+        return outcome
+
+    def __perform_in_child(self, job):
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        child = multiprocessing.Process(target=_run_in_child,
+                                        args=(job, sender))
+        child.start()
+        sender.close()
+        try:
+            if receiver.poll(job.timeout):
+                status, result, meta = receiver.recv()
+                job.meta.update(meta)
+            else:
+                child.terminate()
+                status, result = 'failed', _timeout_message(job)
+        except EOFError:  # the child died without a word
+            status, result = 'failed', 'the job process exited with {}'.format(
+                child.exitcode)
+        finally:
+            receiver.close()
+            child.join()
+        return status, result
+
+
+def _timeout_message(job):
+    return '{}: Job exceeded maximum timeout value ({} seconds)'.format(
+        JobTimeoutException.__name__, job.timeout)
+
+
+def make_queue(backend='rq', workers=1):
+    """Return a queue of the `backend`, one of BACKENDS."""
+    if backend == 'rq':
+        return RQQueue()
+    if backend in ('thread', 'process'):
+        return LocalQueue(workers=workers, processes=backend == 'process')
+    raise ValueError('unknown job queue backend {!r}, not one of {}'.format(
+        backend, ', '.join(BACKENDS)))
+
+
+def get_queue():
+    """Return the queue, which is created the first time, as configured."""
+    global _queue
+    with _lock:
+        if _queue is None:
+            from sdconfig import config
+            _queue = make_queue(getattr(config, 'JOB_QUEUE_BACKEND', 'rq'),
+                                getattr(config, 'JOB_QUEUE_WORKERS', 1))
+        return _queue
+
+
+def set_queue(queue):
+    """Use `queue` from now on, instead of the configured one, and return
+    the previous queue, if any."""
+    global _queue
+    with _lock:
+        previous, _queue = _queue, queue
+    return previous
+
+
+def enqueue(function, *args, **kwargs):
+    """Queue a job calling `function(*args, **kwargs)`, with the queue,
+    timeout and retries of its type unless given as the `queue`, `timeout`
+    and `retries` keyword arguments."""
+    type_ = job_type(function)
+    kwargs.setdefault('queue', type_.queue)
+    kwargs.setdefault('timeout', type_.timeout)
+    retries = kwargs.pop('retries', type_.retries)
+    if retries:
+        options = dict((key, kwargs.pop(key)) for key in _OPTIONS
+                       if key in kwargs)
+        options.setdefault('description', function.__name__)
+        return get_queue().enqueue(_retry, function, args, kwargs, retries,
+                                   **options)
+    return get_queue().enqueue(function, *args, **kwargs)
+
+
+# The keyword arguments of enqueue which are not passed on to the function
+_OPTIONS = ('queue', 'job_id', 'description', 'timeout', 'result_ttl', 'meta')
+
+
+def _retry(function, args, kwargs, retries):
+    """Job calling `function(*args, **kwargs)`, to be queued again up to
+    `retries` times if it fails, after an exponential backoff. The attempts
+    are counted in the job's meta, along with the time after which a failed
+    attempt is to be retried, as `retry_at`."""
+    job = get_current_job()
+    if job is None:
+        return function(*args, **kwargs)
+    attempt = job.meta.get('attempts', 0) + 1
+    job.meta['attempts'] = attempt
+    job.meta.pop('retry_at', None)
+    job.save_meta()
+    try:
+        return function(*args, **kwargs)
+    except Exception as e:
+        # a job which ran out of time would most likely do so again
+        if attempt <= retries and type(e).__name__ != 'JobTimeoutException':
+            delay = RETRY_BACKOFF * 2 ** (attempt - 1)
+            job.meta['retry_at'] = datetime.utcnow() + timedelta(
+                seconds=delay)
+            job.save_meta()
+            log.warning('%s failed (attempt %d of %d), retrying in %ss: %s',
+                        function.__name__, attempt, retries + 1, delay, e)
+        raise
+
+
+def fetch_job(job_id):
+    """Return the job `job_id`, or None if it does not exist (anymore)."""
+    return get_queue().fetch_job(job_id)
+
+
+def get_current_job():
+    """Return the job being run by the current thread, or None."""
+    return get_queue().get_current_job()
+
+
+def ping():
+    """Raise an exception if the jobs cannot be queued, e.g. if Redis is
+    down."""
+    return get_queue().ping()
+
+
+def stats():
+    """Return the statistics of each of QUEUES, in order, as dicts: the
+    numbers of queued, started, recently finished and failed jobs and of
+    workers, the age in seconds of the oldest queued job and of the longest
+    started job, and the number of jobs finished per minute."""
+    return get_queue().stats()
+
+
+def failed_jobs():
+    """Return the jobs which failed after all their attempts, oldest
+    first."""
+    return [job for job in get_queue().failed_jobs()
+            if 'retry_at' not in job.meta]
+
+
+def requeue(job_id):
+    """Queue the failed job `job_id` again, with as many attempts as at
+    first, and return it, or None if there is no such failed job."""
+    job = fetch_job(job_id)
+    if job is None or not job.is_failed:
+        return None
+    job.meta.pop('attempts', None)
+    job.meta.pop('retry_at', None)
+    job.save_meta()
+    return get_queue().requeue(job_id)
+
+
+def retry_due_jobs(now=None):
+    """Queue again the failed jobs whose next attempt is due, and return
+    them."""
+    return get_queue().retry_due_jobs(now or datetime.utcnow())
 
 
-def enqueue(*args, **kwargs):
-    return q.enqueue(*args, **kwargs)
+def discard(job_id):
+    """Forget the failed job `job_id`, and return whether there was one."""
+    return get_queue().discard(job_id)
@@ -7,7 +7,7 @@ securedrop_test_vars = pytest.securedrop_test_vars
 
 @pytest.mark.parametrize('config_line', [
   '[program:securedrop_worker]',
-  'command=/usr/local/bin/rqworker',
+  'command=/usr/local/bin/rqworker interactive bulk default',
   "directory={}".format(securedrop_test_vars.securedrop_code),
   'autostart=true',
   'autorestart=true',
@@ -16,6 +16,10 @@ securedrop_test_vars = pytest.securedrop_test_vars
   'stdout_logfile=/var/log/securedrop_worker/out.log',
   "user={}".format(securedrop_test_vars.securedrop_user),
   'environment=HOME="/tmp/python-gnupg"',
+  '[program:securedrop_interactive_worker]',
+  'command=/usr/local/bin/rqworker interactive',
+  'stderr_logfile=/var/log/securedrop_worker/interactive-err.log',
+  'stdout_logfile=/var/log/securedrop_worker/interactive-out.log',
 ])
 def test_redis_worker_configuration(File, config_line):
     """
@@ -84,7 +84,7 @@ common_apache2_directory_declarations = """
   "WSGIDaemonProcess journalist processes=2 threads=30 display-name=%{{GROUP}} python-path={}".format(  # noqa
       securedrop_test_vars.securedrop_code),
   'WSGIProcessGroup journalist',
-  'WSGIScriptAlias / /var/www/journalist.wsgi',
+  'WSGIScriptAlias / /var/www/journalist.wsgi process-group=journalist application-group=%{GLOBAL}',  # noqa
   'Header set Cache-Control "no-store"',
   "Alias /static {}/static".format(securedrop_test_vars.securedrop_code),
   """
@@ -93,6 +93,20 @@ common_apache2_directory_declarations = """
   Allow from all
   # Cache static resources for 1 hour
   Header set Cache-Control "max-age=3600"
+  # ... except for the copies listed in static/manifest.json, whose names
+  # carry a hash of their content and therefore never change
+  <FilesMatch "\\.[0-9a-f]{{12}}\\.[a-z0-9]+(\\.gz)?$">
+    Header set Cache-Control "max-age=31536000, immutable"
+    Header append Vary Accept-Encoding
+  </FilesMatch>
+  # Serve their compressed variants to the browsers that accept them
+  RemoveType .gz
+  AddEncoding gzip .gz
+  RewriteEngine On
+  RewriteBase /static/
+  RewriteCond %{{HTTP:Accept-Encoding}} gzip
+  RewriteCond %{{REQUEST_FILENAME}}.gz -f
+  RewriteRule ^(.+\\.[0-9a-f]{{12}}\\.[a-z0-9]+)$ $1.gz [L]
 </Directory>
 """.strip('\n').format(securedrop_test_vars.securedrop_code),
   'XSendFile        On',
@@ -25,7 +25,7 @@ def test_apache_headers_source_interface(File, header):
     "WSGIDaemonProcess source  processes=2 threads=30 display-name=%{{GROUP}} python-path={}".format(  # noqa
         securedrop_test_vars.securedrop_code),
     'WSGIProcessGroup source',
-    'WSGIScriptAlias / /var/www/source.wsgi',
+    'WSGIScriptAlias / /var/www/source.wsgi process-group=source application-group=%{GLOBAL}',  # noqa
     'Header set Cache-Control "no-store"',
     'Header set Referrer-Policy "no-referrer"',
     "Alias /static {}/static".format(securedrop_test_vars.securedrop_code),
@@ -35,6 +35,20 @@ def test_apache_headers_source_interface(File, header):
   Allow from all
   # Cache static resources for 1 hour
   Header set Cache-Control "max-age=3600"
+  # ... except for the copies listed in static/manifest.json, whose names
+  # carry a hash of their content and therefore never change
+  <FilesMatch "\\.[0-9a-f]{{12}}\\.[a-z0-9]+(\\.gz)?$">
+    Header set Cache-Control "max-age=31536000, immutable"
+    Header append Vary Accept-Encoding
+  </FilesMatch>
+  # Serve their compressed variants to the browsers that accept them
+  RemoveType .gz
+  AddEncoding gzip .gz
+  RewriteEngine On
+  RewriteBase /static/
+  RewriteCond %{{HTTP:Accept-Encoding}} gzip
+  RewriteCond %{{REQUEST_FILENAME}}.gz -f
+  RewriteRule ^(.+\\.[0-9a-f]{{12}}\\.[a-z0-9]+)$ $1.gz [L]
 </Directory>
 """.strip('\n').format(securedrop_test_vars.securedrop_code),
     'XSendFile        Off',
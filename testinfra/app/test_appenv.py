@@ -61,13 +61,15 @@ def test_ensure_logo(File, Sudo):
         assert f.group == sdvars.securedrop_user
 
 
-def test_securedrop_tmp_clean_cron(Command, Sudo):
-    """ Ensure securedrop tmp clean cron job in place """
+def test_securedrop_maintenance_cron(Command, Sudo):
+    """ Ensure securedrop maintenance cron job in place, which replaces the
+    tmp clean one """
     with Sudo():
         cronlist = Command("crontab -l").stdout
-        cronjob = "@daily {}/manage.py clean-tmp".format(
+        cronjob = "*/15 * * * * {}/manage.py maintenance".format(
             sdvars.securedrop_code)
         assert cronjob in cronlist
+        assert "manage.py clean-tmp" not in cronlist
 
 
 def test_app_workerlog_dir(File, Sudo):